@@ -6,6 +6,10 @@
 #include "tinyml.h"
 #include "blackbox.h"
 #include <ArduinoJson.h>
+#if __has_include("tinyml_seed.h")
+#include "tinyml_seed.h" // generated by scripts/distill.py --tinyml
+#define HAS_TINYML_SEED
+#endif
 
 // --- Global Objects ---
 SensorManager sensors(PIN_DHT, PIN_IR);
@@ -57,6 +61,11 @@ void setup() {
     blackBox.begin();
     sensors.begin();
     actuators.begin();
+
+#ifdef HAS_TINYML_SEED
+    // Start offline mode from the distilled teacher instead of an empty memory
+    tinyML.load(TINYML_SEED, TINYML_SEED_COUNT);
+#endif
     
     connectivity.setCallback(mqttCallback);
     connectivity.begin();
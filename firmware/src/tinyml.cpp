@@ -20,6 +20,13 @@ void TinyML::train(float temp, float hum, bool fabric, bool relayState) {
     head = (head + 1) % MAX_SAMPLES;
 }
 
+void TinyML::load(const DataPoint* points, int count) {
+    for (int i = 0; i < count && i < MAX_SAMPLES; i++) {
+        memory[i] = points[i];
+    }
+    head = (count < MAX_SAMPLES) ? count : 0;
+}
+
 bool TinyML::predict(float temp, float hum, bool fabric) {
     int validCount = 0;
     struct Neighbor {
@@ -21,6 +21,7 @@ private:
 public:
     TinyML(int k_neighbors = 3);
     void train(float temp, float hum, bool fabric, bool relayState);
+    void load(const DataPoint* points, int count); // seed memory, e.g. from distill.py
     bool predict(float temp, float hum, bool fabric);
     int getSampleCount();
 };
@@ -1,8 +1,20 @@
-import ollama
 import json
+import re
+import time
+import atexit
+import threading
+from decision_cache import DecisionCache
+from ironcore.rules import rule_decision
+from inference import InferenceService, MicroBatcher
+from metrics import LLM_SECONDS, PARSE_SECONDS, ERRORS, FALLBACKS, DECISIONS
+from config import CACHE_TEMP_STEP, CACHE_HUM_STEP, CACHE_MAX_SIZE, CACHE_TTL, CACHE_PATH, LLM_STREAM, LLM_NUM_PREDICT
+from config import LLM_WARMUP, LLM_BATCH_SIZE, LLM_BATCH_WAIT
+from config import STUDENT_PATH, STUDENT_MODE, STUDENT_PROMOTE_AT, STUDENT_MIN_SHADOW, STUDENT_AUDIT_RATE
 
 MODEL_NAME = "llama3"
 
+TIERS = ("rules", "cache", "student", "llm")
+
 TEACHER_PROMPT = """
 You are the Expert AI Supervisor for a Smart Ironing System. 
 Your decisions are ground-truth labels for training a TinyML model on the edge device.
@@ -26,29 +38,301 @@ Output JSON format strictly:
 }
 """
 
-def get_ai_decision(temp, humidity, fabric_detected):
+_tier_lock = threading.Lock()
+_tier_hits = {tier: 0 for tier in TIERS}
+
+def _count_tier(tier):
+    with _tier_lock:
+        _tier_hits[tier] += 1
+
+def get_tier_stats():
+    with _tier_lock:
+        return dict(_tier_hits)
+
+# Shared by every caller in this process (decision_core loop, dashboard AIWorker);
+# set CACHE_PATH to share it across processes and restarts as well.
+DECISION_CACHE = DecisionCache(
+    temp_step=CACHE_TEMP_STEP,
+    hum_step=CACHE_HUM_STEP,
+    max_size=CACHE_MAX_SIZE,
+    ttl=CACHE_TTL,
+    path=CACHE_PATH,
+)
+atexit.register(DECISION_CACHE.flush)
+
+# --- Distilled Student (see distill.py) ---
+# Loaded on the first escalation past the cache, so numpy stays out of
+# startup for agents that never get that far.
+STUDENT = None
+_student_lock = threading.Lock()
+
+def get_student():
+    global STUDENT
+    with _student_lock:
+        if STUDENT is None:
+            from distill import StudentGate
+            STUDENT = StudentGate.load(STUDENT_PATH, mode=STUDENT_MODE, promote_at=STUDENT_PROMOTE_AT,
+                                       min_shadow=STUDENT_MIN_SHADOW, audit_rate=STUDENT_AUDIT_RATE)
+        return STUDENT
+
+# --- LLM Tier ---
+# Pooled client with the model pinned in memory (see inference.py). Options
+# and the system prompt never change between calls so ollama can keep
+# reusing the evaluated prompt prefix.
+LLM = InferenceService(MODEL_NAME)
+LLM_OPTIONS = {"num_predict": LLM_NUM_PREDICT, "temperature": 0}
+
+def warm_up_llm(block=False):
+    """Load llama3 and prime the TEACHER_PROMPT prefix before the first decision."""
+    if not LLM_WARMUP:
+        return None
+    if block:
+        return LLM.warm_up(TEACHER_PROMPT, LLM_OPTIONS)
+    LLM.warm_up_async(TEACHER_PROMPT, LLM_OPTIONS)
+
+# Property order matters: the model emits relay/buzzer before the free-text reason
+DECISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "relay": {"type": "boolean"},
+        "buzzer": {"type": "boolean"},
+        "reason": {"type": "string"},
+    },
+    "required": ["relay", "buzzer", "reason"],
+}
+
+_ACTUATION_RE = {field: re.compile(rf'"{field}"\s*:\s*(true|false)') for field in ("relay", "buzzer")}
+
+_parse_lock = threading.Lock()
+_parse_stats = {"ok": 0, "failed": 0, "truncated": 0, "exceptions": 0, "early_actuations": 0,
+                "actuation_s_total": 0.0, "actuations": 0, "generation_s_total": 0.0, "streams": 0}
+
+def _count_parse(key, amount=1):
+    with _parse_lock:
+        _parse_stats[key] += amount
+
+def get_parse_stats():
+    with _parse_lock:
+        stats = dict(_parse_stats)
+    streams, actuations = stats.pop("streams"), stats.pop("actuations")
+    actuation_s, generation_s = stats.pop("actuation_s_total"), stats.pop("generation_s_total")
+    stats["mean_time_to_actuation_s"] = actuation_s / actuations if actuations else 0.0
+    stats["mean_generation_s"] = generation_s / streams if streams else 0.0
+    return stats
+
+def extract_decision(content):
+    """First JSON object in `content` that carries relay/buzzer, else None.
+
+    Tries each '{' in turn with raw_decode, so prose, code fences or extra
+    braces around the object do not break parsing.
+    """
+    decoder = json.JSONDecoder()
+    start = content.find('{')
+    while start != -1:
+        try:
+            obj, _ = decoder.raw_decode(content, start)
+            if isinstance(obj, dict) and "relay" in obj and "buzzer" in obj:
+                return obj
+        except ValueError:
+            pass
+        start = content.find('{', start + 1)
+    return None
+
+class StreamingDecisionParser:
+    """Accumulates streamed tokens and spots relay/buzzer as soon as they appear."""
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+
+    def feed(self, chunk):
+        """Returns True exactly once: when both actuation fields are known."""
+        self.text += chunk
+        if len(self.fields) == 2:
+            return False
+        for field, pattern in _ACTUATION_RE.items():
+            if field not in self.fields:
+                match = pattern.search(self.text)
+                if match:
+                    self.fields[field] = match.group(1) == "true"
+        return len(self.fields) == 2
+
+    def result(self):
+        decision = extract_decision(self.text)
+        if decision is not None:
+            return decision, False
+        if len(self.fields) == 2:
+            # Token budget ran out inside the reason; actuation is still valid
+            reason = re.search(r'"reason"\s*:\s*"(.*)', self.text, re.S)
+            partial = reason.group(1).rstrip('"} \n') if reason else ""
+            return {**self.fields, "reason": partial + "..."}, True
+        return None, False
+
+def _llm_messages(temp, humidity, fabric_detected):
     user_msg = f"Data: Temp={temp}, Humidity={humidity}, FabricDetected={fabric_detected}."
-    
+    return [
+        {'role': 'system', 'content': TEACHER_PROMPT},
+        {'role': 'user', 'content': user_msg}
+    ]
+
+def _parse_failure(reason):
+    _count_parse("failed")
+    ERRORS.inc(stage="parse")
+    print(f"AI Parse Error: {reason}")
+    return {"relay": False, "buzzer": False, "reason": "Error parsing JSON", "fallback": True}
+
+def get_llm_decision(temp, humidity, fabric_detected, on_actuation=None, stream=LLM_STREAM):
+    """Ask llama3 for a schema-constrained decision.
+
+    In streaming mode `on_actuation({"relay", "buzzer"})` fires as soon as both
+    fields have been generated, before the reason text is finished.
+    """
     try:
-        response = ollama.chat(model=MODEL_NAME, messages=[
-            {'role': 'system', 'content': TEACHER_PROMPT},
-            {'role': 'user', 'content': user_msg}
-        ])
-        
-        content = response['message']['content']
-        # Extract JSON from potential markdown text
-        start = content.find('{')
-        end = content.rfind('}') + 1
-        if start != -1 and end != -1:
-            json_str = content[start:end]
-            return json.loads(json_str)
-        else:
-            return {"relay": False, "buzzer": False, "reason": "Error parsing JSON"}
-            
+        if not stream:
+            with LLM_SECONDS.time(mode="blocking"):
+                response = LLM.chat(_llm_messages(temp, humidity, fabric_detected),
+                                    format=DECISION_SCHEMA, options=LLM_OPTIONS)
+            with PARSE_SECONDS.time():
+                decision = extract_decision(response['message']['content'])
+            if decision is None:
+                return _parse_failure(response['message']['content'][:200])
+            _count_parse("ok")
+            return decision
+
+        started = time.perf_counter()
+        parser = StreamingDecisionParser()
+        for chunk in LLM.chat(_llm_messages(temp, humidity, fabric_detected),
+                              format=DECISION_SCHEMA, options=LLM_OPTIONS, stream=True):
+            if parser.feed(chunk['message']['content']):
+                _count_parse("actuation_s_total", time.perf_counter() - started)
+                _count_parse("actuations")
+                if on_actuation:
+                    _count_parse("early_actuations")
+                    on_actuation(dict(parser.fields))
+        _count_parse("generation_s_total", time.perf_counter() - started)
+        _count_parse("streams")
+        LLM_SECONDS.observe(time.perf_counter() - started, mode="stream")
+
+        with PARSE_SECONDS.time():
+            decision, truncated = parser.result()
+        if decision is None:
+            return _parse_failure(parser.text[:200])
+        _count_parse("truncated" if truncated else "ok")
+        return decision
+
     except Exception as e:
+        _count_parse("exceptions")
+        ERRORS.inc(stage="llm")
         print(f"AI Error: {e}")
-        return {"relay": False, "buzzer": False, "reason": f"AI Exception: {e}"}
+        return {"relay": False, "buzzer": False, "reason": f"AI Exception: {e}", "fallback": True}
+
+# --- Batched LLM Tier (fleet) ---
+BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "decisions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, **DECISION_SCHEMA["properties"]},
+                "required": ["id"] + DECISION_SCHEMA["required"],
+            },
+        },
+    },
+    "required": ["decisions"],
+}
+
+def get_llm_decisions(samples):
+    """One ollama request for several (temp, humidity, fabric_detected) samples.
+
+    The system prompt is the same TEACHER_PROMPT as single decisions, so the
+    cached prefix is shared; samples are numbered in the user message and the
+    answers mapped back by id. Samples the model skipped get the safe-off
+    fallback.
+    """
+    lines = [f"id={i}: Temp={t}, Humidity={h}, FabricDetected={f}" for i, (t, h, f) in enumerate(samples)]
+    user_msg = ("Decide for each iron independently. Reply with {\"decisions\": [...]}, one entry per id.\n"
+                + "\n".join(lines))
+    messages = [{'role': 'system', 'content': TEACHER_PROMPT}, {'role': 'user', 'content': user_msg}]
+    options = {**LLM_OPTIONS, "num_predict": LLM_NUM_PREDICT * len(samples)}
+    try:
+        with LLM_SECONDS.time(mode="batch"):
+            response = LLM.chat(messages, format=BATCH_SCHEMA, options=options)
+        with PARSE_SECONDS.time():
+            content = response['message']['content']
+            by_id = {}
+            for item in json.loads(content).get("decisions", []):
+                if isinstance(item, dict) and "relay" in item and "buzzer" in item:
+                    by_id.setdefault(item.get("id"), {k: item[k] for k in ("relay", "buzzer", "reason") if k in item})
+    except Exception as e:
+        _count_parse("exceptions")
+        ERRORS.inc(stage="llm")
+        print(f"AI Batch Error: {e}")
+        # One dict per sample: callers tag and cache them independently
+        return [{"relay": False, "buzzer": False, "reason": f"AI Exception: {e}", "fallback": True}
+                for _ in samples]
+    decisions = []
+    for i in range(len(samples)):
+        if i in by_id:
+            _count_parse("ok")
+            decisions.append(by_id[i])
+        else:
+            decisions.append(_parse_failure(f"batch answer missing id={i}"))
+    return decisions
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+def batched_llm_decision(temp, humidity, fabric_detected):
+    """get_llm_decision for get_ai_decision's `llm`, sharing ollama requests with concurrent callers.
+
+    Batched answers are not streamed, so there is no early actuation.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher(get_llm_decisions, max_batch=LLM_BATCH_SIZE, max_wait=LLM_BATCH_WAIT)
+    return _batcher.submit((temp, humidity, fabric_detected))
+
+def get_batch_stats():
+    return _batcher.get_stats() if _batcher else {"items": 0, "batches": 0, "mean_batch": 0.0}
+
+def get_ai_decision(temp, humidity, fabric_detected, on_actuation=None, llm=None):
+    """Rules -> cache -> student -> `llm` (get_llm_decision unless given).
+
+    `on_actuation` only applies to the streaming get_llm_decision; an `llm`
+    passed in (e.g. batched_llm_decision) is called without it.
+    """
+    decision = rule_decision(temp, humidity, fabric_detected)
+    tier = "rules"
+    if decision is None:
+        decision = DECISION_CACHE.get(temp, humidity, fabric_detected)
+        tier = "cache"
+    if decision is None:
+        decision = get_student().decide(temp, humidity, fabric_detected)
+        tier = "student"
+    if decision is None:
+        if llm is None:
+            decision = get_llm_decision(temp, humidity, fabric_detected, on_actuation=on_actuation)
+        else:
+            decision = llm(temp, humidity, fabric_detected)
+        tier = "llm"
+        # Never memoize the safe-off fallback produced by a failed inference
+        if not decision.get("fallback"):
+            DECISION_CACHE.put(temp, humidity, fabric_detected, decision)
+            get_student().observe(temp, humidity, fabric_detected, decision)
+        else:
+            FALLBACKS.inc()
+    _count_tier(tier)
+    DECISIONS.inc(tier=tier)
+    decision["tier"] = tier
+    return decision
 
 if __name__ == "__main__":
     # Test
     print(get_ai_decision(100, 50, True))
+    print(get_ai_decision(135, 50, True))
+    print(get_tier_stats())
+    print(DECISION_CACHE.get_stats())
+    print(get_parse_stats())
+    print(get_student().get_stats())
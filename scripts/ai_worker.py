@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+
+from ai_engine import get_ai_decision
+from ironcore.rules import offline_decision
+from scheduler import LATE_POLICIES, fallback_decision
+from config import DECISION_DEADLINE, LATE_POLICY
+
+class AIWorker:
+    """Background inference driven by new telemetry.
+
+    Workers sleep on a condition variable and only run get_ai_decision when a
+    sample with a newer timestamp arrives. There is a single pending slot: a
+    sample that is superseded before a worker picks it up is dropped rather
+    than queued, so decisions always chase the freshest data.
+
+    Every sample is held to scheduler.DeadlineScheduler's deadline: once a
+    sample has gone `deadline` seconds without a decision (a stalled LLM, or
+    every worker busy), get_decision() returns the rules / offline fallback
+    for the newest sample instead of the last, stale, answer, until the
+    workers answer a sample in time again. Late answers are then discarded
+    or, with late_policy="apply", used if no newer sample has arrived.
+    """
+
+    def __init__(self, num_workers=1, decide=get_ai_decision, decision_log=None, device_id=None,
+                 deadline=DECISION_DEADLINE, late_policy=LATE_POLICY, fallback=offline_decision, clock=time.time):
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"late_policy must be one of {LATE_POLICIES}, got {late_policy!r}")
+        self.decide = decide
+        self.decision_log = decision_log
+        self.device_id = device_id
+        self.deadline = deadline
+        self.late_policy = late_policy
+        self.fallback = fallback
+        self.clock = clock          # virtual in simulate.py
+        self.latest_telemetry = (0.0, 0.0, False) # Temp, Hum, Fabric
+        self.latest_ts = 0          # newest sample accepted (epoch ms)
+        self.pending = None         # (ts, temp, hum, fabric, accepted at) waiting for a worker
+        self.undecided = deque()    # (ts, accepted at) of samples newer than latest_decision
+        self.latest_decision = {"relay": False, "buzzer": False, "reason": "Initializing AI..."}
+        self.decision_ts = 0        # sample timestamp behind latest_decision
+        self.fallback_decision = None
+        self.fallback_ts = 0        # sample timestamp behind fallback_decision
+        self.stats = {"accepted": 0, "stale": 0, "superseded": 0, "inferences": 0, "out_of_order": 0,
+                      "on_time": 0, "fallbacks": 0, "late_applied": 0, "late_discarded": 0}
+        self.running = True
+        self.cond = threading.Condition()
+        self.threads = [threading.Thread(target=self._run_loop, daemon=True) for _ in range(max(num_workers, 0))]
+        for thread in self.threads:
+            thread.start()
+
+    def update_telemetry(self, temp, hum, fabric, ts=None):
+        """Offer a sample; returns False if it is not newer than the last one."""
+        if ts is None:
+            ts = time.time() * 1000
+        with self.cond:
+            # Same sample re-offered with different inputs (e.g. sensor inversion toggled) still counts as new
+            if ts < self.latest_ts or (ts == self.latest_ts and (temp, hum, fabric) == self.latest_telemetry):
+                self.stats["stale"] += 1
+                return False
+            if self.pending is not None:
+                self.stats["superseded"] += 1
+            accepted = self.clock()
+            self.latest_ts = ts
+            self.latest_telemetry = (temp, hum, fabric)
+            self.pending = (ts, temp, hum, fabric, accepted)
+            self.undecided.append((ts, accepted))
+            self.stats["accepted"] += 1
+            self.cond.notify_all()
+            return True
+
+    def get_decision(self, wait=False):
+        """Decision to actuate now; with `wait`, first give the newest sample until its deadline."""
+        with self.cond:
+            # Without worker threads (step() callers) nothing would answer while we wait
+            if wait and self.threads:
+                self.cond.wait_for(lambda: self.decision_ts >= self.latest_ts or not self.running,
+                                   timeout=self._time_left())
+            if self._time_left() == 0 or self.fallback_ts > self.decision_ts:
+                return self._fall_back()
+            return self.latest_decision
+
+    def _time_left(self):
+        if not self.undecided:
+            return None
+        return max(0.0, self.undecided[0][1] + self.deadline - self.clock())
+
+    def _fall_back(self):
+        # The rules decide instantly, so the fallback always covers the newest sample
+        if self.fallback_ts != self.latest_ts:
+            temp, hum, fabric = self.latest_telemetry
+            self.fallback_decision = fallback_decision(temp, hum, fabric, self.fallback)
+            self.fallback_ts = self.latest_ts
+            self.stats["fallbacks"] += 1
+            if self.decision_log:
+                waited = self.clock() - self.undecided[-1][1] if self.undecided else 0.0
+                self.decision_log.log_decision(self.device_id, temp, hum, fabric, self.fallback_decision,
+                                               waited * 1000)
+        return self.fallback_decision
+
+    def get_stats(self):
+        with self.cond:
+            return dict(self.stats)
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def _take(self):
+        with self.cond:
+            while self.running and self.pending is None:
+                self.cond.wait()
+            sample, self.pending = self.pending, None
+            return sample
+
+    def infer(self, sample):
+        ts, t, h, f, _ = sample
+        started = time.perf_counter()
+        try:
+            decision = self.decide(t, h, f)
+        except Exception as e:
+            print(f"AI Worker Error: {e}")
+            return None
+        if self.decision_log:
+            self.decision_log.log_decision(self.device_id, t, h, f, decision,
+                                           (time.perf_counter() - started) * 1000)
+        return decision
+
+    def publish(self, sample, decision):
+        """Make a finished inference the current decision, unless it is outdated or late."""
+        ts, accepted = sample[0], sample[4]
+        with self.cond:
+            self.stats["inferences"] += 1
+            # With several workers a slower, older inference may finish last
+            if ts < self.decision_ts:
+                self.stats["out_of_order"] += 1
+                return decision
+            if self.clock() - accepted > self.deadline:
+                # The fallback has been covering this sample; keep it unless nothing newer arrived
+                if self.late_policy != "apply" or ts != self.latest_ts or decision.get("fallback"):
+                    self.stats["late_discarded"] += 1
+                    return decision
+                self.stats["late_applied"] += 1
+            else:
+                self.stats["on_time"] += 1
+            self.latest_decision = decision
+            self.decision_ts = ts
+            while self.undecided and self.undecided[0][0] <= ts:
+                self.undecided.popleft()
+            self.cond.notify_all()
+        return decision
+
+    def process(self, sample):
+        decision = self.infer(sample)
+        return self.publish(sample, decision) if decision is not None else None
+
+    def step(self):
+        """Take the pending sample and run its inference on the caller's thread, unpublished.
+
+        For num_workers=0 (simulation): returns (sample, decision) for the
+        caller to publish() once the inference would have finished.
+        """
+        with self.cond:
+            sample, self.pending = self.pending, None
+        return (sample, self.infer(sample)) if sample is not None else None
+
+    def _run_loop(self):
+        while self.running:
+            sample = self._take()
+            if sample is not None:
+                self.process(sample)
+
+if __name__ == "__main__":
+    # Check: a stalled LLM still yields a safe decision within the deadline
+    def stalled_decide(temp, humidity, fabric_detected):
+        time.sleep(0.5)
+        return {"relay": True, "buzzer": False, "reason": "late"}
+
+    worker = AIWorker(decide=stalled_decide, deadline=0.1, late_policy="discard")
+    for temp, tier in ((160, "rules"), (135, "offline"), (175, "rules")):
+        started = time.monotonic()
+        worker.update_telemetry(temp, 50, True)
+        decision = worker.get_decision(wait=True)
+        assert time.monotonic() - started < 0.15, "missed the deadline"
+        assert decision["tier"] == tier and not (temp > 150 and decision["relay"]), decision
+        time.sleep(0.01)
+    time.sleep(1.0)
+    # The late answers were discarded: the fallback keeps covering the newest sample
+    assert worker.get_decision()["tier"] == "rules", worker.get_decision()
+    print(worker.get_stats())
+    worker.stop()
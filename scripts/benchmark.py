@@ -0,0 +1,312 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from standins import FakeThingsBoard, FakeOllama, FakeMqttBroker
+
+# Benchmarks run entirely against local stand-ins. Environment variables are
+# set before the project modules are imported so config.py and the ollama
+# client pick up the stand-in URLs.
+
+def summarize(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        "n": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(0.99 * len(ordered)))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def bench_decisions(iterations):
+    import ai_engine
+
+    actuations = []
+
+    def streamed():
+        started = time.perf_counter()
+        ai_engine.get_llm_decision(135.0, 50.0, True, stream=True,
+                                   on_actuation=lambda fields: actuations.append(time.perf_counter() - started))
+
+    results = {
+        # Full LLM round trip through the ollama client, including JSON extraction
+        "llm": summarize(timed(lambda: ai_engine.get_llm_decision(135.0, 50.0, True, stream=False), iterations)),
+        "llm_stream": summarize(timed(streamed, iterations)),
+        "llm_stream_actuation": summarize(actuations),
+        # One request carrying 8 devices (fleet LLM_BATCH_SIZE)
+        "llm_batch8": summarize(timed(lambda: ai_engine.get_llm_decisions([(135.0, 50.0, True)] * 8), iterations)),
+        "rules_tier": summarize(timed(lambda: ai_engine.get_ai_decision(100.0, 50.0, True), iterations)),
+    }
+    ai_engine.get_ai_decision(140.0, 50.0, True)
+    results["cache_tier"] = summarize(timed(lambda: ai_engine.get_ai_decision(140.0, 50.0, True), iterations))
+    results["parse"] = ai_engine.get_parse_stats()
+    return results
+
+def bench_telemetry(iterations):
+    import requests
+    from ironcore.telemetry import telemetry_url, parse_telemetry, telemetry_ts
+    from config import DEVICE_ID
+
+    session = requests.Session()
+    headers = {"X-Authorization": "Bearer standin-token"}
+    payload = session.get(telemetry_url(DEVICE_ID), headers=headers).json()
+
+    started = time.perf_counter()
+    for _ in range(iterations * 100):
+        parse_telemetry(payload)
+        telemetry_ts(payload)
+    parse_rate = iterations * 100 / (time.perf_counter() - started)
+
+    def fetch_and_parse():
+        parse_telemetry(session.get(telemetry_url(DEVICE_ID), headers=headers).json())
+
+    samples = timed(fetch_and_parse, iterations)
+    return {"parse_per_s": parse_rate, "fetch_parse": summarize(samples),
+            "fetch_parse_per_s": len(samples) / sum(samples)}
+
+def bench_rpc(iterations):
+    from ironcore.rpc import RpcDispatcher
+    from config import DEVICE_ID
+
+    dispatcher = RpcDispatcher(lambda: "standin-token", keepalive=3600, coalesce_window=0)
+    raw = timed(lambda: dispatcher.post(DEVICE_ID, "setRelay", True), iterations)
+
+    # Steady state: the same relay value every tick is suppressed after the first send
+    started = time.perf_counter()
+    for _ in range(iterations):
+        dispatcher.send(DEVICE_ID, "setRelay", False)
+    dispatch_rate = iterations / (time.perf_counter() - started)
+    return {"post": summarize(raw), "post_per_s": len(raw) / sum(raw),
+            "steady_dispatch_per_s": dispatch_rate, "dispatcher": dispatcher.get_stats()}
+
+def bench_ticks(iterations):
+    import requests
+    from decision_core import control_tick
+    from ironcore.telemetry import telemetry_url, telemetry_ts, parse_telemetry
+    from config import DEVICE_ID
+    from decision_log import DecisionLog
+    from ironcore.rpc import RpcDispatcher
+    from ai_worker import AIWorker
+    from history import TelemetryHistory
+
+    session = requests.Session()
+    headers = {"X-Authorization": "Bearer standin-token"}
+    dispatcher = RpcDispatcher(lambda: "standin-token")
+    log = DecisionLog(None)
+
+    def agent_tick():
+        data = session.get(telemetry_url(DEVICE_ID), headers=headers).json()
+        control_tick(data, DEVICE_ID, dispatcher, log)
+
+    # Dashboard tick minus Streamlit rendering: fetch, parse, hand off to the
+    # worker, dispatch the current decision and update history.
+    worker = AIWorker(num_workers=1)
+    history = TelemetryHistory()
+
+    def dashboard_tick():
+        data = session.get(telemetry_url(DEVICE_ID), headers=headers).json()
+        temp, hum, fabric = parse_telemetry(data)
+        worker.update_telemetry(temp, hum, fabric, ts=telemetry_ts(data))
+        decision = worker.get_decision()
+        dispatcher.submit(DEVICE_ID, "setRelay", decision.get('relay', False))
+        dispatcher.flush(DEVICE_ID)
+        history.append(time.time(), temp, hum)
+        history.window(3600)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        agent = timed(agent_tick, iterations)
+    dashboard = timed(dashboard_tick, iterations)
+    worker.stop()
+    return {"agent_tick": summarize(agent), "dashboard_tick": summarize(dashboard)}
+
+def bench_fleet(device_counts, seconds, tick):
+    from fleet import FleetSupervisor
+
+    results = {}
+    for count in device_counts:
+        supervisor = FleetSupervisor([f"bench-{i}" for i in range(count)], tick=tick,
+                                     report_interval=3600, adaptive=False)
+
+        async def run():
+            task = asyncio.create_task(supervisor.run())
+            await asyncio.sleep(seconds)
+            supervisor.stop()
+            await task   # device loops finish their current tick and exit
+
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        report = supervisor.get_report()
+        results[str(count)] = {
+            "ticks_per_s": report["ticks"] / elapsed,
+            "expected_ticks_per_s": count / tick,
+            "errors": report["errors"],
+            "median_p95_ms": report["median_p95_ms"],
+            "worst_p95_ms": report["worst_p95_ms"],
+            "rpc": report["rpc"],
+        }
+        print(f"  fleet {count:>5} devices: {results[str(count)]['ticks_per_s']:.0f} ticks/s, "
+              f"p95 median {report['median_p95_ms']:.1f}ms", file=sys.stderr)
+    return results
+
+def bench_push(seconds, tb, broker):
+    """run_event_driven on websocket and MQTT pushes: every kind must reach the decision loop."""
+    import threading
+    from decision_core import run_event_driven
+    from config import DEVICE_ID, MQTT_TOPIC
+
+    stop = threading.Event()
+
+    def publish():
+        # The iron side of MQTT: flat payloads at the websocket push rate
+        while not stop.wait(tb.push_interval):
+            sample = tb.telemetry(DEVICE_ID)
+            payload = {key: series[0]["value"] for key, series in sample.items()}
+            payload["ts"] = sample["temperature"][0]["ts"]
+            broker.publish(MQTT_TOPIC.format(device_id=DEVICE_ID), payload)
+
+    publisher = threading.Thread(target=publish, daemon=True)
+    publisher.start()
+    results = {}
+    for kind in ("ws", "mqtt"):
+        until = time.time() + seconds
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stats = run_event_driven(kind, should_continue=lambda: time.time() < until)
+        if not stats or not stats.get("decisions"):
+            raise SystemExit(f"push ({kind}): no pushed telemetry reached the decision loop")
+        results[kind] = stats
+        print(f"  push {kind:>4}: {stats['decisions']} decisions, p95 {stats['p95_ms']:.1f}ms", file=sys.stderr)
+    stop.set()
+    return results
+
+def bench_stall(seconds, llm, tick, deadline=0.5, stall=2.0):
+    """LLM stalled past the deadline: fleet and dashboard ticks must still decide, safely, in time."""
+    import ai_engine
+    from decision_cache import DecisionCache
+    from fleet import FleetSupervisor
+    from ai_worker import AIWorker
+
+    latency, llm.latency = llm.latency, stall
+    # Answers cached by earlier sections would hide the stall
+    ai_engine.DECISION_CACHE = DecisionCache()
+    supervisor = FleetSupervisor([f"stall-{i}" for i in range(10)], tick=tick, report_interval=3600,
+                                 adaptive=False, deadline=deadline)
+
+    async def run():
+        task = asyncio.create_task(supervisor.run())
+        await asyncio.sleep(seconds)
+        supervisor.stop()
+        await task
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        asyncio.run(run())
+    report = supervisor.get_report()
+    # Whole ticks: fetch, decision and RPCs against the local stand-ins
+    worst_ms = max(s["max_ms"] for s in report["per_device"].values())
+    if not report["deadline"]["missed"] or worst_ms > deadline * 1000 + 250:
+        raise SystemExit(f"stall (fleet): worst tick {worst_ms:.0f}ms, {report['deadline']}")
+
+    ai_engine.DECISION_CACHE = DecisionCache()
+    worker = AIWorker(num_workers=1, deadline=deadline)
+    waits = []
+    for i in range(5):
+        temp = 125.0 + 5 * i   # hysteresis band: escalated to the stalled LLM
+        worker.update_telemetry(temp, 50.0, True)
+        started = time.perf_counter()
+        decision = worker.get_decision(wait=True)
+        waits.append(time.perf_counter() - started)
+        if decision.get("tier") not in ("rules", "offline") or waits[-1] > deadline + 0.05:
+            raise SystemExit(f"stall (dashboard): {decision} after {waits[-1] * 1000:.0f}ms")
+        time.sleep(0.1)
+    worker.stop()
+    llm.latency = latency
+    print(f"  stall: fleet worst tick {worst_ms:.0f}ms, dashboard worst wait {max(waits) * 1000:.0f}ms "
+          f"(deadline {deadline * 1000:.0f}ms)", file=sys.stderr)
+    return {"deadline_ms": deadline * 1000, "fleet_worst_tick_ms": worst_ms, "fleet": report["deadline"],
+            "dashboard": summarize(waits), "worker": worker.get_stats()}
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Smart Iron benchmark suite (local stand-ins)")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Fake ollama latency (s)")
+    parser.add_argument("--tb-latency", type=float, default=0.0, help="Fake ThingsBoard latency (s)")
+    parser.add_argument("--devices", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--fleet-seconds", type=float, default=10)
+    parser.add_argument("--fleet-tick", type=float, default=2.0)
+    parser.add_argument("--push-seconds", type=float, default=3, help="Per push source (ws, mqtt)")
+    parser.add_argument("--stall-seconds", type=float, default=3, help="Fleet run with the LLM stalled")
+    parser.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = parser.parse_args()
+
+    tb = FakeThingsBoard(latency=args.tb_latency).start()
+    llm = FakeOllama(latency=args.llm_latency).start()
+    broker = FakeMqttBroker().start()
+    os.environ.update({
+        "TB_URL": tb.url, "TB_USERNAME": "bench", "TB_PASSWORD": "bench", "DEVICE_ID": "bench-0",
+        "OLLAMA_HOST": llm.url, "DECISION_LOG_DIR": "", "CACHE_PATH": "",
+        "MQTT_HOST": broker.host, "MQTT_PORT": str(broker.port),
+    })
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+    }
+    print("Benchmarking decisions...", file=sys.stderr)
+    results["decision"] = bench_decisions(args.iterations)
+    print("Benchmarking telemetry...", file=sys.stderr)
+    results["telemetry"] = bench_telemetry(args.iterations)
+    print("Benchmarking RPC...", file=sys.stderr)
+    results["rpc"] = bench_rpc(args.iterations)
+    print("Benchmarking loop ticks...", file=sys.stderr)
+    results["ticks"] = bench_ticks(args.iterations)
+    print("Benchmarking fleet mode...", file=sys.stderr)
+    results["fleet"] = bench_fleet(args.devices, args.fleet_seconds, args.fleet_tick)
+    print("Benchmarking push ingestion...", file=sys.stderr)
+    results["push"] = bench_push(args.push_seconds, tb, broker)
+    print("Benchmarking a stalled LLM...", file=sys.stderr)
+    results["stall"] = bench_stall(args.stall_seconds, llm, args.fleet_tick)
+    results["standins"] = {"thingsboard": dict(tb.counts), "ollama_requests": llm.requests,
+                           "mqtt_published": broker.published}
+
+    output = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    tb.stop()
+    llm.stop()
+    broker.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+from config import BLACKBOX_DB, DECISION_LOG_DIR
+
+# Ingests the ESP32 BlackBox (firmware/src/blackbox.cpp) into an indexed
+# SQLite store. The firmware writes "[uptime_s] TYPE: message" lines to
+# /system.log and dumpLogs() streams the whole file back between
+#   --- BLACK BOX DUMP START ---  /  --- BLACK BOX DUMP END ---
+# Dumps are read line by line (file, stdin or serial), staged on disk, and
+# only the part not seen in an earlier dump of the same file is stored.
+
+DUMP_START = "--- BLACK BOX DUMP START ---"
+DUMP_END = "--- BLACK BOX DUMP END ---"
+LINE_RE = re.compile(r"^\[(\d+)\]\s+([A-Z]+):\s?(.*)$")
+VALUE_RE = re.compile(r"(-?\d+(?:\.\d+)?)\s*$")
+UPTIME_WRAP = 2 ** 32 // 1000   # millis() overflows after ~49.7 days
+CHUNK = 5000
+
+BlackBoxEvent = namedtuple("BlackBoxEvent", "device_id ts uptime type message value")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    device_id TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL,        -- bumps when the log file was cleared / replaced
+    prefix_lines INTEGER NOT NULL,      -- lines of the current file already ingested
+    prefix_hash TEXT NOT NULL           -- sha1 over those lines
+);
+CREATE TABLE IF NOT EXISTS boots (
+    boot_id INTEGER PRIMARY KEY,
+    device_id TEXT NOT NULL,
+    generation INTEGER NOT NULL,
+    boot_index INTEGER NOT NULL,
+    boot_epoch REAL,                    -- upper bound on the wall-clock boot time
+    max_uptime INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (device_id, generation, boot_index)
+);
+CREATE TABLE IF NOT EXISTS events (
+    device_id TEXT NOT NULL,
+    boot_id INTEGER NOT NULL,
+    seq INTEGER NOT NULL,               -- line number in the device's log file
+    uptime INTEGER NOT NULL,
+    ts REAL,                            -- boot_epoch + uptime
+    type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    value REAL,                         -- trailing number, e.g. the trip temperature
+    PRIMARY KEY (device_id, boot_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_type_ts ON events (type, ts);
+CREATE INDEX IF NOT EXISTS events_device_ts ON events (device_id, ts);
+CREATE INDEX IF NOT EXISTS events_device_type_ts ON events (device_id, type, ts);
+CREATE INDEX IF NOT EXISTS boots_device ON boots (device_id, boot_epoch);
+"""
+
+# --- Reading ---
+def read_dump(lines):
+    """Yield the log lines of a dump; everything outside START/END is serial noise.
+
+    Input that starts straight with a log line (a plain copy of system.log)
+    is passed through whole.
+    """
+    inside = False
+    for raw in lines:
+        line = raw.decode(errors="replace") if isinstance(raw, bytes) else raw
+        line = line.rstrip("\r\n")
+        if line.strip() == DUMP_START:
+            inside = True
+        elif line.strip() == DUMP_END:
+            return
+        elif inside:
+            yield line
+        elif inside is False and line.strip():
+            # Decided by the first non-blank line: a log line means no markers to wait for
+            inside = True if LINE_RE.match(line) else None
+            if inside:
+                yield line
+
+def serial_lines(port, baud=115200, timeout=30.0):
+    """Ask the iron for a dump over USB serial and yield its raw lines (needs pyserial)."""
+    import serial
+
+    with serial.Serial(port, baud, timeout=1) as conn:
+        conn.reset_input_buffer()
+        conn.write(b"dumpLogs\n")
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            line = conn.readline()
+            if line:
+                deadline = time.time() + timeout   # still streaming
+                yield line
+                if line.strip() == DUMP_END.encode():
+                    return
+
+def parse_lines(lines):
+    """(seq, boot_index, uptime, type, message, value) per well-formed line.
+
+    A BOOT line, or uptime going backwards without a millis() wrap, starts a
+    new boot. Malformed lines are skipped but keep their sequence number.
+    """
+    boot_index, prev_uptime, wrap = -1, None, 0
+    for seq, line in enumerate(lines):
+        match = LINE_RE.match(line)
+        if not match:
+            yield seq, None, None, None, line, None
+            continue
+        uptime, kind, message = int(match.group(1)), match.group(2), match.group(3)
+        if kind == "BOOT" or boot_index < 0:
+            boot_index, wrap = boot_index + 1, 0
+        elif prev_uptime is not None and uptime + wrap < prev_uptime:
+            if prev_uptime % UPTIME_WRAP > UPTIME_WRAP - 3600:
+                wrap += UPTIME_WRAP
+            else:
+                boot_index, wrap = boot_index + 1, 0   # rebooted before the FS mounted/logged BOOT
+        prev_uptime = uptime + wrap
+        value = VALUE_RE.search(message)
+        yield seq, boot_index, prev_uptime, kind, message, float(value.group(1)) if value else None
+
+# --- Store ---
+class BlackBoxStore:
+    """Indexed BlackBox events for the whole fleet, in one SQLite file.
+
+    Wall-clock times: a dump captured at `captured_at` proves its last boot
+    started no later than captured_at - (last uptime); earlier boots started
+    no later than the next boot's epoch minus their own last uptime. Each
+    boot keeps the tightest such bound seen across dumps, and event `ts`
+    (boot_epoch + uptime) is kept in sync with it, so time-range queries are
+    plain index scans.
+    """
+
+    def __init__(self, path=BLACKBOX_DB):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.execute("PRAGMA optimize")   # refresh planner stats so type/device filters pick the right index
+        self.db.close()
+
+    # --- Ingestion ---
+    def ingest(self, device_id, lines, captured_at=None):
+        """Store the new part of one dump; returns ingestion stats."""
+        db = self.db
+        row = db.execute("SELECT generation, prefix_lines, prefix_hash FROM devices WHERE device_id = ?",
+                         (device_id,)).fetchone()
+        generation, prefix_lines, prefix_hash = row or (0, 0, hashlib.sha1().hexdigest())
+
+        db.execute("CREATE TEMP TABLE IF NOT EXISTS staging "
+                   "(seq INTEGER, boot_index INTEGER, uptime INTEGER, type TEXT, message TEXT, value REAL)")
+        db.execute("DELETE FROM staging")
+        digest, hash_at_prefix, total, malformed, batch = hashlib.sha1(), None, 0, 0, []
+        for seq, boot_index, uptime, kind, message, value in parse_lines(read_dump(lines)):
+            digest.update(message.encode() if kind is None else f"[{uptime}] {kind}: {message}\n".encode())
+            total = seq + 1
+            if total == prefix_lines:
+                hash_at_prefix = digest.hexdigest()
+            if kind is None:
+                malformed += 1
+                continue
+            batch.append((seq, boot_index, uptime, kind, message, value))
+            if len(batch) >= CHUNK:
+                db.executemany("INSERT INTO staging VALUES (?, ?, ?, ?, ?, ?)", batch)
+                batch = []
+        db.executemany("INSERT INTO staging VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+        continuation = prefix_lines > 0 and hash_at_prefix == prefix_hash
+        if continuation:
+            db.execute("DELETE FROM staging WHERE seq < ?", (prefix_lines,))
+        elif prefix_lines:
+            generation += 1   # log was cleared (or another file): everything is new
+        stats = {"lines": total, "malformed": malformed, "skipped": prefix_lines if continuation else 0}
+
+        with db:
+            # Boots seen in this dump (continuations may extend the last known one)
+            for boot_index, max_uptime in db.execute(
+                    "SELECT boot_index, MAX(uptime) FROM staging GROUP BY boot_index").fetchall():
+                db.execute("INSERT INTO boots (device_id, generation, boot_index, max_uptime) VALUES (?, ?, ?, ?) "
+                           "ON CONFLICT (device_id, generation, boot_index) "
+                           "DO UPDATE SET max_uptime = MAX(max_uptime, excluded.max_uptime)",
+                           (device_id, generation, boot_index, max_uptime))
+            cur = db.execute(
+                "INSERT OR IGNORE INTO events (device_id, boot_id, seq, uptime, type, message, value) "
+                "SELECT ?, b.boot_id, s.seq, s.uptime, s.type, s.message, s.value FROM staging s "
+                "JOIN boots b ON b.device_id = ? AND b.generation = ? AND b.boot_index = s.boot_index",
+                (device_id, device_id, generation))
+            stats["new_events"] = cur.rowcount
+            db.execute("INSERT INTO devices VALUES (?, ?, ?, ?) ON CONFLICT (device_id) DO UPDATE SET "
+                       "generation = excluded.generation, prefix_lines = excluded.prefix_lines, "
+                       "prefix_hash = excluded.prefix_hash", (device_id, generation, total, digest.hexdigest()))
+            if captured_at is not None:
+                self._anchor(device_id, generation, captured_at)
+        db.execute("DELETE FROM staging")
+        stats["boots"] = db.execute("SELECT COUNT(*) FROM boots WHERE device_id = ? AND generation = ?",
+                                    (device_id, generation)).fetchone()[0]
+        return stats
+
+    def _anchor(self, device_id, generation, captured_at):
+        """Tighten boot epochs backwards from the capture time. Caller holds the transaction."""
+        boots = self.db.execute("SELECT boot_id, boot_epoch, max_uptime FROM boots WHERE device_id = ? "
+                                "AND generation = ? ORDER BY boot_index DESC", (device_id, generation)).fetchall()
+        bound = captured_at
+        for boot_id, epoch, max_uptime in boots:
+            bound -= max_uptime
+            if epoch is None or bound < epoch:
+                epoch = bound
+                self.db.execute("UPDATE boots SET boot_epoch = ? WHERE boot_id = ?", (epoch, boot_id))
+                self.db.execute("UPDATE events SET ts = ? + uptime WHERE device_id = ? AND boot_id = ?",
+                                (epoch, device_id, boot_id))
+            bound = epoch
+
+    # --- Queries ---
+    def query(self, type=None, match=None, device_id=None, start=None, end=None, limit=None):
+        """Events filtered by type, message prefix, device and time range, oldest first."""
+        clauses, params = [], []
+        for column, op, value in (("e.type", "=", type), ("e.device_id", "=", device_id),
+                                  ("e.ts", ">=", start), ("e.ts", "<", end)):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+        if match:
+            clauses.append("e.message LIKE ?")
+            params.append(f"%{match}%")
+        sql = ("SELECT e.device_id, e.ts, e.uptime, e.type, e.message, e.value FROM events e")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY e.ts"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [BlackBoxEvent(*row) for row in self.db.execute(sql, params)]
+
+    def counts(self, start=None, end=None):
+        """{(device_id, type): events} over a time range."""
+        sql = "SELECT device_id, type, COUNT(*) FROM events WHERE ts >= ? AND ts < ? GROUP BY device_id, type"
+        rows = self.db.execute(sql, (start or 0, end or float("inf")))
+        return {(device, kind): n for device, kind, n in rows}
+
+    def timeline(self, device_id, start, end, log_dir=DECISION_LOG_DIR):
+        """BlackBox events merged with the logged telemetry and decisions for one device.
+
+        Returns a DataFrame ordered by time with a `source` column
+        (blackbox / telemetry / decision).
+        """
+        import pandas as pd
+
+        events = self.query(device_id=device_id, start=start, end=end)
+        frames = [pd.DataFrame({
+            "time": pd.to_datetime([e.ts for e in events], unit="s"), "source": "blackbox",
+            "type": [e.type for e in events], "message": [e.message for e in events],
+            "temperature": [e.value if e.type == "ALRT" else None for e in events],
+        })]
+        if log_dir and os.path.isdir(log_dir):
+            import pyarrow.compute as pc
+            from decision_log import scan
+
+            window = ((pc.field("device") == device_id) & (pc.field("ts") >= pd.Timestamp(start, unit="s"))
+                      & (pc.field("ts") < pd.Timestamp(end, unit="s")))
+            for table, kind in (("telemetry", None), ("decisions", "AI")):
+                if not os.path.isdir(os.path.join(log_dir, table)):
+                    continue
+                df = scan(table, log_dir, filter=window).to_pandas()
+                if df.empty:
+                    continue
+                frame = pd.DataFrame({"time": df["ts"], "source": table.rstrip("s"),
+                                      "temperature": df["temperature"]})
+                if kind:
+                    frame["type"] = kind
+                    frame["message"] = df["reason"].astype(str) + " (relay=" + df["relay"].astype(str) + ")"
+                frames.append(frame)
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return pd.DataFrame(columns=["time", "source", "type", "message", "temperature"])
+        return pd.concat(frames, ignore_index=True).sort_values("time", kind="stable").reset_index(drop=True)
+
+# --- CLI ---
+def _since(text):
+    """'30d' / '12h' / '45m' before now, as epoch seconds."""
+    units = {"d": 86400, "h": 3600, "m": 60, "s": 1}
+    return time.time() - float(text[:-1]) * units[text[-1]] if text[-1] in units else float(text)
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest and query ESP32 BlackBox dumps")
+    parser.add_argument("--db", default=BLACKBOX_DB)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest = sub.add_parser("ingest", help="Store a dump from a file, stdin (-) or a serial port")
+    ingest.add_argument("--device", required=True)
+    source = ingest.add_mutually_exclusive_group(required=True)
+    source.add_argument("--file", help="Captured dump or copy of system.log ('-' for stdin)")
+    source.add_argument("--serial", metavar="PORT", help="Request a dump over serial, e.g. /dev/ttyUSB0")
+    ingest.add_argument("--baud", type=int, default=115200)
+    ingest.add_argument("--captured-at", type=float,
+                        help="Epoch seconds the dump was taken (default: now for serial, file mtime for files)")
+
+    query = sub.add_parser("query", help="Search events across the fleet")
+    query.add_argument("--type", help="BOOT, AUTO, NET, ALRT, SYS, ...")
+    query.add_argument("--match", help="Message substring, e.g. 'Overheat'")
+    query.add_argument("--device")
+    query.add_argument("--since", help="e.g. 30d, 12h, or epoch seconds")
+    query.add_argument("--limit", type=int)
+
+    timeline = sub.add_parser("timeline", help="One device's events joined with the decision log")
+    timeline.add_argument("--device", required=True)
+    timeline.add_argument("--since", default="1d")
+    timeline.add_argument("--log-dir", default=DECISION_LOG_DIR)
+    args = parser.parse_args()
+
+    store = BlackBoxStore(args.db)
+    if args.command == "ingest":
+        started = time.perf_counter()
+        if args.serial:
+            stats = store.ingest(args.device, serial_lines(args.serial, args.baud),
+                                 captured_at=args.captured_at or time.time())
+        elif args.file == "-":
+            stats = store.ingest(args.device, sys.stdin, captured_at=args.captured_at or time.time())
+        else:
+            with open(args.file, "rb") as f:
+                stats = store.ingest(args.device, f, captured_at=args.captured_at or os.path.getmtime(args.file))
+        print(f"{args.device}: {stats} in {(time.perf_counter() - started) * 1000:.0f} ms")
+    elif args.command == "query":
+        started = time.perf_counter()
+        events = store.query(type=args.type, match=args.match, device_id=args.device,
+                             start=_since(args.since) if args.since else None, limit=args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for e in events:
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(e.ts)) if e.ts is not None else "unknown"
+            print(f"{when}  {e.device_id:<20} [{e.uptime:>8}] {e.type}: {e.message}")
+        print(f"{len(events)} events in {elapsed:.1f} ms")
+    else:
+        print(store.timeline(args.device, _since(args.since), time.time(), args.log_dir).to_string(index=False))
+    store.close()
+
+if __name__ == "__main__":
+    main()
@@ -12,3 +12,96 @@ DEVICE_ID = os.getenv("DEVICE_ID")
 
 if not all([USERNAME, PASSWORD, DEVICE_ID]):
     print("WARNING: Missing credentials in .env file. Please copy .env.example to .env and fill in your details.")
+
+# --- Auth ---
+TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "300"))   # renew this long before JWT exp
+TOKEN_MAX_BACKOFF = float(os.getenv("TOKEN_MAX_BACKOFF", "300"))         # cap for failed-login retries
+
+# --- Decision Cache ---
+CACHE_TEMP_STEP = float(os.getenv("CACHE_TEMP_STEP", "1.0"))   # C per bucket
+CACHE_HUM_STEP = float(os.getenv("CACHE_HUM_STEP", "5.0"))     # % per bucket
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "512"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "600"))               # seconds
+CACHE_PATH = os.getenv("CACHE_PATH")                           # optional, persists across restarts
+
+# --- Fleet Mode ---
+FLEET_TICK = float(os.getenv("FLEET_TICK", "2.0"))                     # seconds between ticks per device
+FLEET_LLM_CONCURRENCY = int(os.getenv("FLEET_LLM_CONCURRENCY", "4"))  # in-flight ollama requests
+FLEET_MAX_CONNECTIONS = int(os.getenv("FLEET_MAX_CONNECTIONS", "100"))
+FLEET_REPORT_INTERVAL = float(os.getenv("FLEET_REPORT_INTERVAL", "30"))
+
+# --- Sharding ---
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0"))   # worker processes per node for --workers; 0 = one per core
+LEASE_DB = os.getenv("LEASE_DB", "leases.db")          # SQLite lease store, shared by every node's workers
+LEASE_TTL = float(os.getenv("LEASE_TTL", "10"))        # seconds a device lease / worker heartbeat stays valid
+NODE_ID = os.getenv("NODE_ID", "")                      # defaults to the hostname
+
+# --- Telemetry Ingestion ---
+TELEMETRY_SOURCE = os.getenv("TELEMETRY_SOURCE", "poll")   # poll | ws | mqtt
+TB_WS_URL = os.getenv("TB_WS_URL", TB_URL.replace("https://", "wss://").replace("http://", "ws://"))
+MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
+MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
+MQTT_TOPIC = os.getenv("MQTT_TOPIC", "irons/{device_id}/telemetry")
+
+# --- AI Worker ---
+AI_WORKERS = int(os.getenv("AI_WORKERS", "1"))   # parallel inference threads in the dashboard
+
+# --- Dashboard ---
+DASHBOARD_FETCH_INTERVAL = float(os.getenv("DASHBOARD_FETCH_INTERVAL", "1.0"))   # seconds between polls
+RENDER_FPS = float(os.getenv("RENDER_FPS", "1.0"))                               # redraws per second per viewer
+CHART_FPS = float(os.getenv("CHART_FPS", "0.5"))                                 # trend chart redraws per second
+
+# --- History ---
+HISTORY_WORKERS = int(os.getenv("HISTORY_WORKERS", "8"))             # concurrent range-query pages
+HISTORY_CACHE_PAGES = int(os.getenv("HISTORY_CACHE_PAGES", "4096"))  # cached aggregated pages (LRU)
+HISTORY_LIVE_TTL = float(os.getenv("HISTORY_LIVE_TTL", "30"))        # seconds before the open page is re-fetched
+
+# --- Control Scheduler ---
+CONTROL_INTERVAL = float(os.getenv("CONTROL_INTERVAL", "2.0"))     # seconds between agent ticks
+DECISION_DEADLINE = float(os.getenv("DECISION_DEADLINE", "1.5"))   # max wait for the tiers before the offline rules decide
+LATE_POLICY = os.getenv("LATE_POLICY", "discard")                  # discard | apply (late LLM answers)
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", "2"))                 # concurrent inferences before ticks skip the LLM
+
+# --- Adaptive Polling ---
+POLL_ADAPTIVE = os.getenv("POLL_ADAPTIVE", "1") == "1"                 # vary poll/decision interval with thermal state
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", "0.5"))       # seconds, near 170C or overheated
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", "10"))        # seconds, cold and idle without fabric
+POLL_ACTIVE_INTERVAL = float(os.getenv("POLL_ACTIVE_INTERVAL", "2"))   # seconds, ironing (fabric present)
+POLL_GUARD_BAND = float(os.getenv("POLL_GUARD_BAND", "10"))            # C below 170 that always polls at the minimum
+POLL_LOOKAHEAD = float(os.getenv("POLL_LOOKAHEAD", "4"))               # samples before reaching a threshold
+
+# --- Signal Statistics ---
+SIGNAL_TAU = float(os.getenv("SIGNAL_TAU", "10"))         # seconds, temperature mean/variance smoothing
+RATE_TAU = float(os.getenv("RATE_TAU", "6"))              # seconds, rate-of-rise smoothing
+FABRIC_VOTES = int(os.getenv("FABRIC_VOTES", "3"))        # fabric_detected majority-vote window (samples)
+OVERHEAT_VOTES = int(os.getenv("OVERHEAT_VOTES", "2"))    # readings above 170C out of the last 3 before buzzing
+
+# --- Metrics ---
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))   # Prometheus /metrics on localhost; 0 disables
+PROFILE_HZ = int(os.getenv("PROFILE_HZ", "0"))       # sampling profiler rate (/profile); 0 disables
+
+# --- Decision Log ---
+DECISION_LOG_DIR = os.getenv("DECISION_LOG_DIR", "logs")   # empty string disables logging
+DECISION_LOG_BATCH = int(os.getenv("DECISION_LOG_BATCH", "5000"))
+DECISION_LOG_FLUSH_INTERVAL = float(os.getenv("DECISION_LOG_FLUSH_INTERVAL", "10"))
+DECISION_LOG_ROLL_INTERVAL = float(os.getenv("DECISION_LOG_ROLL_INTERVAL", "3600"))   # max seconds a Parquet file stays open
+
+# --- BlackBox ---
+BLACKBOX_DB = os.getenv("BLACKBOX_DB", "blackbox.db")   # SQLite store for ingested firmware logs
+
+# --- LLM ---
+LLM_STREAM = os.getenv("LLM_STREAM", "1") == "1"            # stream + act on relay/buzzer before the reason
+LLM_NUM_PREDICT = int(os.getenv("LLM_NUM_PREDICT", "128"))  # token budget per decision
+OLLAMA_HOST = os.getenv("OLLAMA_HOST")                       # None: ollama's default (localhost:11434)
+LLM_KEEP_ALIVE = os.getenv("LLM_KEEP_ALIVE", "30m")          # how long ollama keeps llama3 loaded ("-1" = forever)
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "8"))         # pooled HTTP connections to ollama
+LLM_WARMUP = os.getenv("LLM_WARMUP", "1") == "1"             # load the model + prompt prefix at startup
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))       # fleet: devices per ollama request (1 = no batching)
+LLM_BATCH_WAIT = float(os.getenv("LLM_BATCH_WAIT", "0.02"))  # fleet: max seconds a request waits to fill a batch
+
+# --- Student Model (distill.py) ---
+STUDENT_PATH = os.getenv("STUDENT_PATH", "student_model.json")
+STUDENT_MODE = os.getenv("STUDENT_MODE", "shadow")                       # off | shadow | serve
+STUDENT_PROMOTE_AT = float(os.getenv("STUDENT_PROMOTE_AT", "0.98"))      # agreement needed to serve
+STUDENT_MIN_SHADOW = int(os.getenv("STUDENT_MIN_SHADOW", "200"))         # comparisons before promotion
+STUDENT_AUDIT_RATE = float(os.getenv("STUDENT_AUDIT_RATE", "0.05"))      # share still sent to the LLM
@@ -0,0 +1,284 @@
+import threading
+import time
+
+import pandas as pd
+
+from ironcore.signals import get_signal_bank, debounce_decision
+from ironcore.cadence import poll_interval
+from ironcore.telemetry import telemetry_ts
+from fabric_classifier import SPECTRUM_KEY, get_library, spectrum_from_telemetry
+from history import TelemetryHistory
+from metrics import FETCH_SECONDS, TOKEN_REFRESHES, ERRORS, LoopTimer
+from config import POLL_ADAPTIVE
+
+IDLE_POLL_INTERVAL = 5.0   # slowest adaptive poll; keeps the 15 s online indicator from flapping
+
+class DashboardController:
+    """Fetch -> decide -> actuate loop for the dashboard, on its own thread.
+
+    Runs at `fetch_interval` (with `adaptive`: up to IDLE_POLL_INTERVAL for
+    an idle iron, faster near 170C), or on every pushed sample when `stream`
+    is set, regardless of how often, or whether, anything is rendered.
+    Renderers read the latest view model with snapshot() and chart points via
+    the history_* methods. The loop stops by itself once nobody has asked for
+    a snapshot in `idle_timeout` seconds and restarts on the next snapshot().
+    """
+
+    def __init__(self, device_id, tokens, fetch, ai_worker, dispatcher, stream=None, fetch_interval=1.0,
+                 decision_log=None, idle_timeout=60.0, archive=None, adaptive=POLL_ADAPTIVE):
+        self.device_id = device_id
+        self.tokens = tokens
+        self.fetch = fetch                # fetch(token) -> (data, status_code, raw_resp)
+        self.ai_worker = ai_worker
+        self.dispatcher = dispatcher
+        self.stream = stream
+        self.fetch_interval = fetch_interval
+        self.adaptive = adaptive
+        self.decision_log = decision_log
+        self.idle_timeout = idle_timeout
+        self.archive = archive            # HistoryQuery for windows older than the in-memory history
+        self.signals = get_signal_bank()
+        self.settings = {"auto_mode": True, "invert_sensor": False, "fabric_override": False}
+        self.history = TelemetryHistory()
+        self.lock = threading.Lock()
+        self.view = {
+            "seq": 0, "temp": 0.0, "hum": 0.0, "fabric_detected": False, "fabric_type": "Unknown",
+            "fabric_confidence": None, "ai_result": ai_worker.get_decision(), "rpc_stats": dispatcher.get_stats(),
+            "last_tp": 0, "temp_rate": 0.0, "status_code": 0, "raw_resp": "Waiting for data...",
+        }
+        self.last_event_ts = 0
+        self.fresh_event = None           # pushed event not yet decided on (for latency stats)
+        self.last_seen = time.time()
+        self.running = False
+        self.thread = None
+
+    # --- Renderer side ---
+    def configure(self, **settings):
+        with self.lock:
+            self.settings.update(settings)
+
+    def get_settings(self):
+        with self.lock:
+            return dict(self.settings)
+
+    def snapshot_seq(self):
+        with self.lock:
+            return self.view["seq"]
+
+    def snapshot(self):
+        self.last_seen = time.time()
+        self.ensure_running()
+        with self.lock:
+            return dict(self.view)
+
+    def history_frame(self, seconds, max_points=500):
+        """Last `seconds` of history; the part before this process started comes from `archive`."""
+        with self.lock:
+            frame = self.history.to_frame(seconds, max_points)
+            oldest = self.history.raw.oldest_time()
+            if self.history.rollup.ring.size:
+                oldest = min(oldest, self.history.rollup.ring.oldest_time())
+        if self.archive is None:
+            return frame
+        # Local history is stamped with naive wall-clock time; ThingsBoard with epoch time
+        local_offset = pd.Timestamp.now().value / 1e9 - time.time()
+        end = (oldest - local_offset) if oldest is not None else time.time()
+        start = time.time() - seconds
+        if end - start < 60:
+            return frame
+        older = self.archive.query(self.device_id, start, end, max_points=max_points)
+        if older.empty:
+            return frame
+        older["time"] += pd.Timedelta(seconds=local_offset)
+        return pd.concat([older[frame.columns], frame], ignore_index=True)
+
+    def history_since(self, t):
+        """Raw points strictly newer than `t` (seconds), as a chart-ready DataFrame."""
+        with self.lock:
+            cols = self.history.raw.since(t)
+        cols = cols[:, cols[0] > t]
+        return pd.DataFrame({"time": pd.to_datetime(cols[0], unit="s"),
+                             "temperature": cols[1], "humidity": cols[2]})
+
+    # --- Control loop ---
+    def ensure_running(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        timer = LoopTimer("dashboard", self.fetch_interval if self.stream is None else 0.0)
+        while self.running:
+            if time.time() - self.last_seen > self.idle_timeout:
+                self.running = False
+                break
+            started = time.time()
+            try:
+                with timer.tick():
+                    self.tick()
+            except Exception as e:
+                ERRORS.inc(stage="dashboard")
+                print(f"Dashboard controller error: {e}")
+            if self.stream is None:
+                interval = self.fetch_interval
+                if self.adaptive:
+                    interval = poll_interval(self.signals.get(self.device_id), active_interval=self.fetch_interval,
+                                             max_interval=max(IDLE_POLL_INTERVAL, self.fetch_interval))
+                timer.interval = interval
+                time.sleep(max(0.0, interval - (time.time() - started)))
+
+    def _fetch(self):
+        if self.stream is None:
+            token = self.tokens.get()
+            with FETCH_SECONDS.time(loop="dashboard"):
+                data, status_code, raw_resp = self.fetch(token)
+            if status_code == 401:
+                TOKEN_REFRESHES.inc()
+                self.tokens.invalidate(token)
+            return data, status_code, raw_resp
+        # Wake up on the next pushed sample
+        event = self.stream.wait_for_update(self.device_id, after_ts=self.last_event_ts, timeout=1.0)
+        self.fresh_event = event
+        event = event or self.stream.latest(self.device_id)
+        if event is None:
+            return {}, 0, "Waiting for data..."
+        self.last_event_ts = event.ts
+        return event.data, 200, "OK"
+
+    def tick(self):
+        data, status_code, raw_resp = self._fetch()
+        with self.lock:
+            settings = dict(self.settings)
+            fabric_type = self.view["fabric_type"]
+            fabric_confidence = self.view["fabric_confidence"]
+
+        # 1. Parse
+        try:
+            # A failed fetch ({}) or a value without a device timestamp is not a
+            # sample: it must neither reach the statistics nor move the heartbeat
+            sample_ts = telemetry_ts(data)
+            if not sample_ts:
+                raise ValueError("no telemetry sample")
+
+            temp_list = data.get('temperature', [{'value': 0}])
+            hum_list = data.get('humidity', [{'value': 0}])
+            fab_list = data.get('fabric_detected', [{'value': False}])
+
+            current_temp = float(temp_list[0]['value'])
+            current_hum = float(hum_list[0]['value'])
+
+            # Fabric bool parsing safely
+            fab_val = fab_list[0]['value']
+            if isinstance(fab_val, str):
+                raw_detected = fab_val.lower() == 'true'
+            else:
+                raw_detected = bool(fab_val)
+            fabric_detected = not raw_detected if settings["invert_sensor"] else raw_detected
+
+            # Heartbeat from the sample's own timestamp, so a stale value reads as offline
+            last_tp = sample_ts / 1000
+
+            # --- DEBOUNCE --- (a flickering sensor no longer flips detection / fabric type)
+            signals = self.signals.update(self.device_id, current_temp, fabric_detected, ts=last_tp)
+            fabric_detected = signals.fabric
+
+            # --- SIMULATION OVERRIDE ---
+            if settings["fabric_override"]:
+                fabric_detected = True
+
+            # --- AUTO-SCAN LOGIC ---
+            if not fabric_detected:
+                fabric_type, fabric_confidence = "Unknown", None
+            else:
+                spectrum = spectrum_from_telemetry(data.get(SPECTRUM_KEY, [{}])[0].get('value'))
+                if spectrum is not None and not settings["fabric_override"]:
+                    match = get_library().classify(spectrum)[0]
+                    fabric_type, fabric_confidence = match.fabric, match.confidence
+                else:
+                    # No IR scan reported: force Cotton for all detected fabrics as per user request
+                    fabric_type, fabric_confidence = "Cotton", None
+        except Exception:
+            current_temp, current_hum, fabric_detected = 0, 0, False
+            sample_ts, signals = None, None
+            with self.lock:
+                last_tp = self.view["last_tp"]
+
+        # 2. Logic & AI (only real samples, on the device clock the worker orders them by)
+        if sample_ts is not None and self.ai_worker.update_telemetry(current_temp, current_hum, fabric_detected,
+                                                                     ts=sample_ts):
+            if self.decision_log:
+                self.decision_log.log_sample(self.device_id, current_temp, current_hum, fabric_detected, ts=sample_ts)
+        # Waits at most the worker's deadline for this sample, then the rules / offline fallback decides
+        decision = self.ai_worker.get_decision(wait=sample_ts is not None)
+        # Only buzz on a confirmed overheat, never on one hot reading or an "AI hallucination"
+        ai_result = debounce_decision(decision, signals)
+
+        # 3. Control Loop (Auto Mode)
+        if settings["auto_mode"]:
+            self.dispatcher.submit(self.device_id, "setRelay", ai_result.get('relay', False))
+            if ai_result.get('buzzer', False):
+                self.dispatcher.submit(self.device_id, "setBuzzer", True)
+            # Unchanged states are suppressed until the keep-alive expires
+            self.dispatcher.flush(self.device_id)
+        if self.fresh_event is not None:
+            # Sensor-to-decision latency, as the agent's event loop reports it
+            self.stream.record_decision(self.fresh_event)
+            self.fresh_event = None
+
+        # 4. Publish (history keeps local wall-clock time, like the charts' axis)
+        with self.lock:
+            self.history.append(pd.Timestamp.now().value / 1e9, current_temp, current_hum)
+            self.view = {
+                "seq": self.view["seq"] + 1, "temp": current_temp, "hum": current_hum,
+                "fabric_detected": fabric_detected, "fabric_type": fabric_type,
+                "fabric_confidence": fabric_confidence, "ai_result": ai_result,
+                "rpc_stats": self.dispatcher.get_stats(), "last_tp": last_tp,
+                "temp_rate": signals.rate if signals else 0.0,
+                "status_code": status_code, "raw_resp": raw_resp,
+            }
+
+class TelemetryHub:
+    """One DashboardController per device, shared by every viewer session.
+
+    Sessions only read snapshots, so ThingsBoard polls, inference and relay
+    commands scale with the number of devices, not viewers. Control settings
+    (auto mode, sensor inversion, fabric override) are per device: a change
+    made by one operator applies to, and shows up for, everyone watching.
+    """
+
+    def __init__(self, factory, viewer_timeout=10.0):
+        self.factory = factory            # factory(device_id) -> DashboardController
+        self.viewer_timeout = viewer_timeout
+        self.lock = threading.Lock()
+        self.controllers = {}
+        self.viewers = {}                 # device_id -> {viewer_id: last snapshot time}
+
+    def controller(self, device_id):
+        with self.lock:
+            if device_id not in self.controllers:
+                self.controllers[device_id] = self.factory(device_id)
+            return self.controllers[device_id]
+
+    def snapshot(self, device_id, viewer_id):
+        controller = self.controller(device_id)
+        with self.lock:
+            self.viewers.setdefault(device_id, {})[viewer_id] = time.time()
+        return controller.snapshot()
+
+    def viewer_count(self, device_id):
+        cutoff = time.time() - self.viewer_timeout
+        with self.lock:
+            seen = self.viewers.get(device_id, {})
+            for viewer_id in [v for v, t in seen.items() if t < cutoff]:
+                del seen[viewer_id]
+            return len(seen)
+
+    def get_stats(self):
+        with self.lock:
+            devices = list(self.controllers)
+        return {device_id: {"viewers": self.viewer_count(device_id),
+                            "samples": self.controllers[device_id].snapshot_seq()} for device_id in devices}
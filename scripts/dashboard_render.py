@@ -0,0 +1,89 @@
+import time
+
+import altair as alt
+import pandas as pd
+from streamlit.delta_generator import DeltaGenerator
+
+# add_rows was removed in newer Streamlit releases
+ADD_ROWS = hasattr(DeltaGenerator, "add_rows")
+
+# Render side of the dashboard: widgets are redrawn only when the part of
+# the view model they show has changed, and trend charts grow from new
+# points instead of re-querying and re-sending the whole window every frame.
+
+class Widget:
+    """A placeholder that redraws only when its view-model slice changes."""
+
+    def __init__(self, placeholder, draw):
+        self.placeholder = placeholder
+        self.draw = draw            # draw(placeholder, model)
+        self.model = None
+        self.renders = 0
+
+    def update(self, model):
+        if model == self.model:
+            return False
+        self.model = model
+        self.draw(self.placeholder, model)
+        self.renders += 1
+        return True
+
+class LiveChart:
+    """Line chart fed incrementally from the controller's history.
+
+    The first frame (and every `rebuild_every` new points, so old points roll
+    off and the point budget is re-applied) draws a downsampled frame of the
+    whole window. In between only new raw points are fetched: on Streamlit
+    versions with add_rows they are appended client-side; otherwise they are
+    appended to the cached frame and the chart is redrawn at most every
+    `min_interval` seconds, and never when nothing new arrived.
+    """
+
+    def __init__(self, placeholder, field, color, title, y_scale, time_format, window,
+                 rebuild_every=300, min_interval=2.0):
+        self.placeholder = placeholder
+        self.field = field
+        self.window = window
+        self.rebuild_every = rebuild_every
+        self.min_interval = min_interval
+        self.template = alt.Chart().mark_line(color=color).encode(
+            x=alt.X('time:T', axis=alt.Axis(format=time_format, title='Time')),
+            y=alt.Y(f'{field}:Q', scale=y_scale, title=title),
+            tooltip=['time', 'temperature', 'humidity']
+        ).properties(height=300)
+        self.element = None
+        self.frame = None
+        self.last_time = None
+        self.appended = 0
+        self.drawn_at = 0.0
+        self.dirty = False
+        self.redraws = 0
+
+    def _draw(self):
+        self.element = self.placeholder.altair_chart(self.template.properties(data=self.frame),
+                                                     use_container_width=True)
+        self.drawn_at = time.time()
+        self.dirty = False
+        self.redraws += 1
+
+    def update(self, controller):
+        if self.frame is None or self.appended >= self.rebuild_every:
+            frame = controller.history_frame(self.window, max_points=500)
+            if frame.empty:
+                return
+            self.frame = frame
+            self.last_time = frame["time"].iloc[-1].value / 1e9
+            self.appended = 0
+            self._draw()
+            return
+        new = controller.history_since(self.last_time)
+        if not new.empty:
+            self.last_time = new["time"].iloc[-1].value / 1e9
+            self.appended += len(new)
+            if ADD_ROWS:
+                self.element.add_rows(new)
+                return
+            self.frame = pd.concat([self.frame, new], ignore_index=True)
+            self.dirty = True
+        if self.dirty and time.time() - self.drawn_at >= self.min_interval:
+            self._draw()
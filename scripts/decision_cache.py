@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class DecisionCache:
+    """Memoizes decisions for quantized (temp, humidity, fabric) situations.
+
+    Entries are kept in LRU order, expire after `ttl` seconds and can be
+    persisted to a JSON file so a restarted agent starts warm.
+    """
+
+    def __init__(self, temp_step=1.0, hum_step=5.0, max_size=512, ttl=600, path=None, save_interval=30,
+                 clock=time.time):
+        self.clock = clock
+        self.temp_step = temp_step
+        self.hum_step = hum_step
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self.lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, decision)
+        self._dirty = False
+        self._last_save = clock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        if path:
+            self.load()
+
+    def key(self, temp, humidity, fabric_detected):
+        return (round(temp / self.temp_step), round(humidity / self.hum_step), bool(fabric_detected))
+
+    def get(self, temp, humidity, fabric_detected):
+        key = self.key(temp, humidity, fabric_detected)
+        now = self.clock()
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            stored_at, decision = entry
+            if now - stored_at > self.ttl:
+                del self._entries[key]
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return dict(decision)
+
+    def put(self, temp, humidity, fabric_detected, decision):
+        key = self.key(temp, humidity, fabric_detected)
+        with self.lock:
+            self._entries[key] = (self.clock(), dict(decision))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._dirty = True
+        if self.path and self.clock() - self._last_save > self.save_interval:
+            self.save()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self._dirty = True
+
+    # --- Persistence ---
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except Exception as e:
+            print(f"Cache load failed: {e}")
+            return
+        now = self.clock()
+        with self.lock:
+            for t, h, fab, stored_at, decision in rows:
+                key = (t, h, fab)
+                if now - stored_at > self.ttl:
+                    continue
+                current = self._entries.get(key)
+                if current is None or current[0] < stored_at:
+                    self._entries[key] = (stored_at, decision)
+            # Keep LRU order roughly by age after merging
+            ordered = sorted(self._entries.items(), key=lambda kv: kv[1][0])
+            self._entries = OrderedDict(ordered[-self.max_size:])
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        # Merge with whatever other processes (agent / dashboard) wrote meanwhile
+        self.load()
+        with self.lock:
+            rows = [[k[0], k[1], k[2], stored_at, decision] for k, (stored_at, decision) in self._entries.items()]
+            self._dirty = False
+            self._last_save = self.clock()
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(rows, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Cache save failed: {e}")
@@ -1,99 +1,195 @@
 import time
 import requests
-import json
-from ai_engine import get_ai_decision
+from functools import partial
+from ai_engine import get_ai_decision, warm_up_llm
+from ironcore.telemetry import telemetry_url, telemetry_ts, parse_telemetry
+from ironcore.signals import get_signal_bank, debounce_decision
+from ironcore.cadence import poll_interval
+from metrics import FETCH_SECONDS, TOKEN_REFRESHES, ERRORS, TICK_SECONDS
 
-from config import TB_URL, USERNAME, PASSWORD, DEVICE_ID
+from config import DEVICE_ID, TELEMETRY_SOURCE, POLL_ADAPTIVE
 
 # --- Auth ---
 def get_token():
-    url = f"{TB_URL}/api/auth/login"
-    try:
-        response = requests.post(url, json={"username": USERNAME, "password": PASSWORD})
-        response.raise_for_status()
-        return response.json()["token"]
-    except Exception as e:
-        print(f"Login failed: {e}")
-        return None
+    # Shared JWT manager (ironcore/auth.py): renewed ahead of expiry, logins coalesced and backed off
+    from ironcore.auth import get_token_manager
+    return get_token_manager().get()
+
+def send_decision(dispatcher, device_id, decision):
+    # Only changed (or keep-alive due) actuator states reach ThingsBoard
+    dispatcher.submit(device_id, "setRelay", decision['relay'])
+    if decision['buzzer']:
+        dispatcher.submit(device_id, "setBuzzer", True)
+    for method, params, ok in dispatcher.flush(device_id):
+        if ok:
+            print(f"RPC {method}={params} Sent OK")
+
+def control_tick(data, device_id, dispatcher, decision_log, decide=get_ai_decision, signals=None):
+    """One decision for one telemetry response: parse, debounce, decide, log, dispatch."""
+    temp, hum, fabric = parse_telemetry(data)
+    sample_ts = telemetry_ts(data)
+    decision_log.log_sample(device_id, temp, hum, fabric, ts=sample_ts)
+
+    # Decide on the debounced fabric flag; the buzzer waits for a confirmed overheat
+    state = (signals or get_signal_bank()).update(device_id, temp, fabric, ts=sample_ts / 1000 if sample_ts else None)
+    print(f"Received: Temp={temp}, Hum={hum}, Fabric={fabric} (debounced {state.fabric}), "
+          f"Trend={state.rate:+.2f}C/s")
+
+    def actuate_early(fields):
+        # Streaming LLM: relay/buzzer are known before the reason is finished
+        send_decision(dispatcher, device_id, debounce_decision(fields, state))
+
+    started = time.perf_counter()
+    decision = debounce_decision(decide(temp, hum, state.fabric, on_actuation=actuate_early), state)
+    decision_log.log_decision(device_id, temp, hum, state.fabric, decision, (time.perf_counter() - started) * 1000)
+    print(f"AI Decision: {decision}")
+
+    send_decision(dispatcher, device_id, decision)
+    return decision
 
 def main():
     print("Starting Smart Iron AI Agent...")
-    token = get_token()
-    if not token:
+    from ironcore.auth import get_token_manager
+    from ironcore.rpc import RpcDispatcher
+    from decision_log import get_decision_log
+    from scheduler import DeadlineScheduler
+
+    tokens = get_token_manager()
+    if not tokens.get():
         return
+    warm_up_llm()
 
-    headers = {"X-Authorization": f"Bearer {token}"}
-    
-    while True:
+    decision_log = get_decision_log()
+    dispatcher = RpcDispatcher(tokens.get, decision_log=decision_log)
+    # Ticks on a fixed grid (CONTROL_INTERVAL, or adaptive with POLL_ADAPTIVE);
+    # decisions never take longer than DECISION_DEADLINE
+    scheduler = DeadlineScheduler()
+    decide = partial(scheduler.decide, device_id=DEVICE_ID)
+
+    def tick():
+        token = tokens.get()
         try:
-            # 1. Get Latest Telemetry
-            # API: /api/plugins/telemetry/{entityType}/{entityId}/values/timeseries
-            url = f"{TB_URL}/api/plugins/telemetry/DEVICE/{DEVICE_ID}/values/timeseries?keys=temperature,humidity,fabric_detected&useStrictDataTypes=true"
-            resp = requests.get(url, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            
-            # Debugging Raw Data
-            print(f"Raw Data: {data}") 
-            
-            def get_val(key, default=0):
-                series = data.get(key, [])
-                if not series:
-                    return default
-                val = series[0].get('value')
-                if val is None:
-                    return default
-                return float(val)
-
-            def get_bool(key, default=False):
-                series = data.get(key, [])
-                if not series:
-                    return default
-                val = series[0].get('value')
-                if val is None:
-                    return default
-                return str(val).lower() == 'true'
-
-            temp = get_val('temperature', 0)
-            hum = get_val('humidity', 0)
-            fabric = get_bool('fabric_detected', False)
-            
-            print(f"Received: Temp={temp}, Hum={hum}, Fabric={fabric}")
-            
-            # 2. Ask AI
-            decision = get_ai_decision(temp, hum, fabric)
-            print(f"AI Decision: {decision}")
-            
-            # 3. Send Command via RPC
-            # Try standard device endpoint first
-            rpc_url = f"{TB_URL}/api/plugins/rpc/oneway/{DEVICE_ID}"
-            try:
-                cmd_relay = {"method": "setRelay", "params": decision['relay']}
-                rpc_resp = requests.post(rpc_url, headers=headers, json=cmd_relay)
-                if rpc_resp.status_code != 200:
-                    print(f"RPC Failed: {rpc_resp.status_code} - {rpc_resp.text}")
-                else:
-                    print("RPC Relay Sent OK")
-                    
-                if decision['buzzer']:
-                    cmd_buzzer = {"method": "setBuzzer", "params": True}
-                    requests.post(rpc_url, headers=headers, json=cmd_buzzer)
-            except Exception as e:
-                print(f"RPC Error: {e}")
-
-            time.sleep(2) # Decision Loop Interval
-            
+            with TICK_SECONDS.time(loop="agent"):
+                # 1. Get Latest Telemetry
+                headers = {"X-Authorization": f"Bearer {token}"}
+                with FETCH_SECONDS.time(loop="agent"):
+                    resp = requests.get(telemetry_url(DEVICE_ID), headers=headers, timeout=scheduler.interval)
+                resp.raise_for_status()
+                data = resp.json()
+
+                # Debugging Raw Data
+                print(f"Raw Data: {data}")
+
+                # 2. Ask AI + 3. Send Command via RPC
+                control_tick(data, DEVICE_ID, dispatcher, decision_log, decide=decide)
+
         except requests.exceptions.HTTPError as e:
             print(f"HTTP Error (Main Loop): {e}")
+            ERRORS.inc(stage="telemetry")
             if e.response.status_code == 401:
-                print("Token expired, refreshing...")
-                token = get_token()
-                headers = {"X-Authorization": f"Bearer {token}"}
-            else:
-                time.sleep(5)
+                print("Token rejected, refreshing...")
+                TOKEN_REFRESHES.inc()
+                tokens.invalidate(token)
         except Exception as e:
             print(f"Loop Error: {e}")
-            time.sleep(5)
+            ERRORS.inc(stage="loop")
+
+    def next_interval():
+        # Poll near-critical irons fast and idle ones rarely
+        return poll_interval(get_signal_bank().get(DEVICE_ID))
+
+    scheduler.run(tick, next_interval=next_interval if POLL_ADAPTIVE else None)
+
+def run_event_driven(source_kind, should_continue=lambda: True):
+    """Decide on pushed telemetry (ws / mqtt) instead of polling on a timer.
+
+    Returns the source's sensor-to-decision latency stats once `should_continue()` is False.
+    """
+    from ironcore.auth import get_token_manager
+    from telemetry_stream import create_source
+    from ironcore.rpc import RpcDispatcher
+    from decision_log import get_decision_log
+    from scheduler import DeadlineScheduler
+
+    print(f"Starting Smart Iron AI Agent ({source_kind} ingestion)...")
+    tokens = get_token_manager()
+    if not tokens.get():
+        return
+    warm_up_llm()
+
+    # Called on every (re)connect / request, so both always carry the current JWT
+    source = create_source(source_kind, [DEVICE_ID], tokens.get).start()
+    decision_log = get_decision_log()
+    dispatcher = RpcDispatcher(tokens.get, decision_log=decision_log)
+    # Event-driven: no cadence to keep, but every decision still honours DECISION_DEADLINE
+    scheduler = DeadlineScheduler(name="event")
+    signals = get_signal_bank()
+    last_ts = 0
+    decisions = 0
+    try:
+        while should_continue():
+            event = source.wait_for_update(DEVICE_ID, after_ts=last_ts, timeout=30)
+            if event is None:
+                print("No telemetry received in 30s, still waiting...")
+                continue
+            last_ts = event.ts
+            tick_started = time.perf_counter()
+            print(f"Received: Temp={event.temp}, Hum={event.hum}, Fabric={event.fabric}")
+
+            decision_log.log_sample(DEVICE_ID, event.temp, event.hum, event.fabric, ts=event.ts)
+            state = signals.update(DEVICE_ID, event.temp, event.fabric, ts=event.ts / 1000)
+
+            started = time.perf_counter()
+            decision = scheduler.decide(event.temp, event.hum, state.fabric, device_id=DEVICE_ID,
+                                        on_actuation=lambda fields: send_decision(
+                                            dispatcher, DEVICE_ID, debounce_decision(fields, state)))
+            decision = debounce_decision(decision, state)
+            decision_log.log_decision(DEVICE_ID, event.temp, event.hum, state.fabric, decision,
+                                      (time.perf_counter() - started) * 1000, ts=event.ts)
+            print(f"AI Decision: {decision}")
+            send_decision(dispatcher, DEVICE_ID, decision)
+            source.record_decision(event)
+            TICK_SECONDS.observe(time.perf_counter() - tick_started, loop="event")
+
+            decisions += 1
+            if decisions % 50 == 0:
+                print(f"Sensor-to-decision latency: {source.latency_stats()}")
+                print(f"RPC: {dispatcher.get_stats()}")
+        return source.latency_stats()
+    finally:
+        source.stop()
+        scheduler.stop()
+
+def load_device_ids(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Smart Iron AI Agent")
+    parser.add_argument("--fleet", nargs="+", metavar="DEVICE_ID", help="Supervise several irons concurrently")
+    parser.add_argument("--fleet-file", help="File with one device ID per line")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="Shard the fleet over N processes with leases (0 = one per core); see shard.py")
+    parser.add_argument("--source", choices=["poll", "ws", "mqtt"], default=TELEMETRY_SOURCE,
+                        help="Telemetry ingestion: REST polling, ThingsBoard websocket or MQTT")
+    args = parser.parse_args()
+
+    from metrics import start_metrics_server
+    start_metrics_server()
+
+    fleet_ids = list(args.fleet or [])
+    if args.fleet_file:
+        fleet_ids += load_device_ids(args.fleet_file)
+
+    if fleet_ids and args.workers is not None:
+        from shard import run_sharded
+        run_sharded(fleet_ids, workers=args.workers)
+    elif fleet_ids:
+        from fleet import run_fleet
+        run_fleet(fleet_ids)
+    elif args.source != "poll":
+        run_event_driven(args.source)
+    else:
+        main()
@@ -0,0 +1,270 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+from config import DECISION_LOG_DIR, DECISION_LOG_BATCH, DECISION_LOG_FLUSH_INTERVAL, DECISION_LOG_ROLL_INTERVAL
+
+TABLES = ("telemetry", "decisions", "rpc")
+
+class DecisionLog:
+    """Append-only Parquet log of telemetry samples, decisions and RPC outcomes.
+
+    Producers only enqueue rows; a background thread batches them into
+    zstd-compressed Parquet files under `<directory>/<table>/date=YYYY-MM-DD/`
+    (hive partitioned, so date filters prune whole files). Each flush is
+    appended to one open `_part-*.arrows` file per table and day, an Arrow
+    IPC stream that is readable up to its last complete flush even after a
+    crash; scan() skips it. When the day rolls over, after `roll_interval`
+    seconds or on close() it is converted into a `part-*.parquet` file (one
+    row group per flush). Streams left behind by a process that died are
+    converted the same way when the next log starts.
+    If the queue is full, rows are dropped and counted rather than blocking
+    the control loop. A log created with directory=None is a no-op.
+    """
+
+    def __init__(self, directory, batch_size=5000, flush_interval=10.0, max_queue=100000,
+                 roll_interval=3600.0):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.roll_interval = roll_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "files": 0, "recovered": 0}
+        self.stats_lock = threading.Lock()
+        self.writers = {}               # (table, day) -> [stream writer, sink, stream path, opened at]
+        self.running = bool(directory)
+        self.thread = None
+        if self.running:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    # --- Producers (never block) ---
+    def _put(self, table, row):
+        if not self.running:
+            return
+        try:
+            self.queue.put_nowait((table, row))
+            counter = "queued"
+        except queue.Full:
+            counter = "dropped"
+        with self.stats_lock:
+            self.stats[counter] += 1
+
+    def log_sample(self, device_id, temp, hum, fabric, ts=None):
+        ts = int(ts if ts else time.time() * 1000)
+        self._put("telemetry", (ts, device_id, temp, hum, bool(fabric)))
+
+    def log_decision(self, device_id, temp, hum, fabric, decision, latency_ms, ts=None):
+        ts = int(ts if ts else time.time() * 1000)
+        self._put("decisions", (ts, device_id, temp, hum, bool(fabric),
+                                bool(decision.get('relay')), bool(decision.get('buzzer')),
+                                str(decision.get('reason', '')), decision.get('tier', 'llm'), latency_ms))
+
+    def log_rpc(self, device_id, method, params, ok):
+        self._put("rpc", (int(time.time() * 1000), device_id, method, str(params), bool(ok)))
+
+    # --- Writer ---
+    def _run(self):
+        self._recover()
+        pending = {table: [] for table in TABLES}
+        last_flush = time.time()
+        while self.running or not self.queue.empty():
+            try:
+                table, row = self.queue.get(timeout=0.5)
+                pending[table].append(row)
+                # Drain whatever else is already queued without waiting
+                for _ in range(self.batch_size):
+                    table, row = self.queue.get_nowait()
+                    pending[table].append(row)
+            except queue.Empty:
+                pass
+            due = time.time() - last_flush > self.flush_interval
+            for table, rows in pending.items():
+                if rows and (due or len(rows) >= self.batch_size):
+                    self._write(table, rows)
+                    pending[table] = []
+            if due:
+                last_flush = time.time()
+                for key, (_, _, _, opened) in list(self.writers.items()):
+                    if last_flush - opened > self.roll_interval:
+                        self._roll(key)
+        for table, rows in pending.items():
+            if rows:
+                self._write(table, rows)
+        for key in list(self.writers):
+            self._roll(key)
+
+    def _write(self, table, rows):
+        # A batch can straddle midnight: every row goes to its own day
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row[0] // 86400000, []).append(row)
+        for day in sorted(by_day):
+            self._append(table, time.strftime("%Y-%m-%d", time.gmtime(day * 86400)), by_day[day])
+        # Rows only move forward in time, so once a newer day shows up the
+        # older partitions of this table are complete
+        newest = max(key[1] for key in self.writers if key[0] == table) if self.writers else None
+        for key in [k for k in self.writers if k[0] == table and k[1] != newest]:
+            self._roll(key)
+
+    def _append(self, table, day, rows):
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+
+        try:
+            arrow_table = self._table(table, rows)
+            key = (table, day)
+            entry = self.writers.get(key)
+            if entry is None:
+                folder = os.path.join(self.directory, table, f"date={day}")
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, f"_part-{time.time_ns()}-{os.getpid()}.arrows")
+                sink = pa.OSFile(path, "wb")
+                entry = self.writers[key] = [ipc.new_stream(sink, arrow_table.schema), sink, path, time.time()]
+            entry[0].write_table(arrow_table)
+            # Unbuffered to the OS, so a crash of this process loses nothing already written
+            entry[1].flush()
+            with self.stats_lock:
+                self.stats["written"] += len(rows)
+        except Exception as e:
+            print(f"Decision log write failed: {e}")
+
+    def _roll(self, key):
+        """Finish a partition's open stream and make it visible to scan()."""
+        writer, sink, path, _ = self.writers.pop(key)
+        try:
+            writer.close()
+            sink.close()
+            if self._convert(path):
+                with self.stats_lock:
+                    self.stats["files"] += 1
+        except Exception as e:
+            print(f"Decision log write failed: {e}")
+
+    @staticmethod
+    def _convert(path):
+        """Rewrite a `_part-*.arrows` stream as `part-*.parquet`; returns the row count.
+
+        A stream cut short by a crash is read up to its last complete batch.
+        """
+        import pyarrow as pa
+        import pyarrow.ipc as ipc
+        import pyarrow.parquet as pq
+
+        folder, name = os.path.split(path)
+        final = os.path.join(folder, name[1:].replace(".arrows", ".parquet"))
+        hidden = os.path.join(folder, "_" + os.path.basename(final))
+        rows, writer = 0, None
+        try:
+            with pa.OSFile(path) as source:
+                reader = ipc.open_stream(source)
+                while True:
+                    try:
+                        batch = reader.read_next_batch()
+                    except StopIteration:
+                        break
+                    except pa.ArrowInvalid:
+                        break   # truncated final batch
+                    writer = writer or pq.ParquetWriter(hidden, reader.schema, compression="zstd")
+                    writer.write_batch(batch)
+                    rows += batch.num_rows
+        except pa.ArrowInvalid:
+            pass                # died before the schema was written: nothing to keep
+        if writer:
+            writer.close()
+            os.replace(hidden, final)
+        os.remove(path)
+        return rows
+
+    def _recover(self):
+        """Convert the open streams of processes that are no longer running."""
+        import glob
+
+        for path in glob.glob(os.path.join(self.directory, "*", "date=*", "_part-*.arrows")):
+            try:
+                pid = int(path.rsplit("-", 1)[1].split(".")[0])
+                if pid == os.getpid() or _running(pid):
+                    continue
+                # Renaming claims it, so two starting logs never convert the same stream
+                claimed = os.path.join(os.path.dirname(path), f"_part-{time.time_ns()}-{os.getpid()}.arrows")
+                os.rename(path, claimed)
+            except (ValueError, OSError):
+                continue
+            try:
+                rows = self._convert(claimed)
+                with self.stats_lock:
+                    self.stats["files"] += bool(rows)
+                    self.stats["recovered"] += rows
+                print(f"Decision log recovered {rows} rows from {path}")
+            except Exception as e:
+                print(f"Decision log recovery failed for {path}: {e}")
+
+    def _table(self, table, rows):
+        import pyarrow as pa
+
+        columns = list(zip(*rows))
+        ts = pa.array(columns[0], type=pa.int64()).cast(pa.timestamp("ms"))
+        device = pa.array(columns[1], type=pa.string()).dictionary_encode()
+        if table == "telemetry":
+            arrays = [ts, device,
+                      pa.array(columns[2], type=pa.float32()), pa.array(columns[3], type=pa.float32()),
+                      pa.array(columns[4], type=pa.bool_())]
+            names = ["ts", "device", "temperature", "humidity", "fabric"]
+        elif table == "decisions":
+            arrays = [ts, device,
+                      pa.array(columns[2], type=pa.float32()), pa.array(columns[3], type=pa.float32()),
+                      pa.array(columns[4], type=pa.bool_()), pa.array(columns[5], type=pa.bool_()),
+                      pa.array(columns[6], type=pa.bool_()),
+                      pa.array(columns[7], type=pa.string()).dictionary_encode(),
+                      pa.array(columns[8], type=pa.string()).dictionary_encode(),
+                      pa.array(columns[9], type=pa.float32())]
+            names = ["ts", "device", "temperature", "humidity", "fabric", "relay", "buzzer", "reason", "tier", "latency_ms"]
+        else:
+            arrays = [ts, device, pa.array(columns[2], type=pa.string()).dictionary_encode(),
+                      pa.array(columns[3], type=pa.string()), pa.array(columns[4], type=pa.bool_())]
+            names = ["ts", "device", "method", "params", "ok"]
+        return pa.table(arrays, names=names)
+
+    def close(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=30)
+
+    def get_stats(self):
+        with self.stats_lock:
+            return dict(self.stats)
+
+def _running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass                    # someone else's process
+    return True
+
+def scan(table, directory=DECISION_LOG_DIR, columns=None, filter=None):
+    """Read a logged table (optionally projected / filtered) as a pyarrow Table.
+
+    e.g. scan("decisions", filter=pc.field("tier") == "llm")
+    """
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(os.path.join(directory, table), format="parquet", partitioning="hive")
+    return dataset.to_table(columns=columns, filter=filter)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_decision_log():
+    """Process-wide log shared by the agent loop, fleet mode and the dashboard."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = DecisionLog(DECISION_LOG_DIR or None, batch_size=DECISION_LOG_BATCH,
+                                  flush_interval=DECISION_LOG_FLUSH_INTERVAL,
+                                  roll_interval=DECISION_LOG_ROLL_INTERVAL)
+            atexit.register(_shared.close)
+        return _shared
@@ -0,0 +1,396 @@
+import argparse
+import json
+import os
+import random
+import threading
+from collections import deque
+
+import numpy as np
+
+# Distils the LLM teacher (TEACHER_PROMPT) into a compact student:
+#   logged / freshly labelled (temp, humidity, fabric) -> (relay, buzzer) pairs
+#   -> small CART tree served in-process (shadow first, promoted on agreement)
+#   -> 20 kNN prototypes in the firmware TinyML DataPoint format, picked over
+#      the full temperature range (the firmware has no rules tier in front
+#      of its kNN), so rule-labelled samples from 20-200C join the LLM pairs.
+
+FALLBACK_REASONS = ("Error parsing JSON", "AI Exception")
+TINYML_MAX_SAMPLES = 20   # firmware/src/tinyml.h
+TINYML_K = 5              # TinyML tinyML(5) in main.cpp
+TINYML_RULE_SAMPLES = 2000
+
+# --- Collection ---
+def load_pairs(directory, tiers=("llm",)):
+    """Teacher-labelled pairs from the decision log as (X, relay, buzzer).
+
+    Cache hits are left out by default: they replay a neighbour's answer from
+    the same temperature/humidity bucket, which blurs the teacher's boundary.
+    """
+    import pyarrow.compute as pc
+    from decision_log import scan
+
+    table = scan("decisions", directory, columns=["temperature", "humidity", "fabric", "relay", "buzzer", "reason", "tier"],
+                 filter=pc.field("tier").isin(list(tiers)))
+    reasons = table.column("reason").to_pylist()
+    keep = np.array([not str(r).startswith(FALLBACK_REASONS) for r in reasons], dtype=bool)
+    X = np.column_stack([table.column("temperature").to_numpy(zero_copy_only=False),
+                         table.column("humidity").to_numpy(zero_copy_only=False),
+                         table.column("fabric").to_numpy(zero_copy_only=False)]).astype(float)
+    relay = table.column("relay").to_numpy(zero_copy_only=False).astype(bool)
+    buzzer = table.column("buzzer").to_numpy(zero_copy_only=False).astype(bool)
+    return X[keep], relay[keep], buzzer[keep]
+
+def sample_inputs(n, rng, temp_range=(20.0, 200.0), hum_range=(20.0, 90.0), fabric_rate=0.9):
+    return np.column_stack([rng.uniform(*temp_range, n), rng.uniform(*hum_range, n),
+                            rng.random(n) < fabric_rate]).astype(float)
+
+def rule_labelled(X):
+    """(X, relay) for the inputs rule_decision settles, i.e. outside the LLM's 120-150C fabric band."""
+    from ironcore.rules import rule_decision
+
+    rows, relay = [], []
+    for temp, hum, fabric in X:
+        decision = rule_decision(float(temp), float(hum), bool(fabric))
+        if decision is not None:
+            rows.append((temp, hum, fabric))
+            relay.append(bool(decision["relay"]))
+    return np.array(rows, dtype=float).reshape(-1, 3), np.array(relay, dtype=bool)
+
+def label_samples(X, teacher=None):
+    """Ask the teacher (get_ai_decision by default) for each input; failed inferences are dropped."""
+    if teacher is None:
+        from ai_engine import get_ai_decision as teacher
+    rows, relay, buzzer = [], [], []
+    for temp, hum, fabric in X:
+        decision = teacher(float(temp), float(hum), bool(fabric))
+        if decision.get("fallback") or decision.get("tier") == "student":
+            continue
+        rows.append((temp, hum, fabric))
+        relay.append(bool(decision["relay"]))
+        buzzer.append(bool(decision["buzzer"]))
+    return np.array(rows, dtype=float).reshape(-1, 3), np.array(relay, dtype=bool), np.array(buzzer, dtype=bool)
+
+# --- Student ---
+class DecisionTree:
+    """Small CART classifier (gini) stored as flat node lists.
+
+    Prediction walks at most `max_depth` nodes in plain Python, which keeps a
+    single decision in the low microseconds without any numpy call overhead.
+    """
+
+    def __init__(self, max_depth=6, min_samples_leaf=5):
+        self.max_depth = max_depth
+        self.min_samples_leaf = min_samples_leaf
+        self.feature, self.threshold, self.left, self.right, self.value = [], [], [], [], []
+
+    def fit(self, X, y):
+        X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=int)
+        self.n_classes = int(y.max()) + 1 if len(y) else 1
+        self.feature, self.threshold, self.left, self.right, self.value = [], [], [], [], []
+        self._grow(X, y, 0)
+        return self
+
+    def _node(self, y):
+        self.feature.append(-1)
+        self.threshold.append(0.0)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.value.append(int(np.bincount(y, minlength=self.n_classes).argmax()) if len(y) else 0)
+        return len(self.value) - 1
+
+    def _best_split(self, X, y):
+        n = len(y)
+        onehot = np.eye(self.n_classes)[y]
+        best = (None, None, 1 - ((onehot.sum(axis=0) / n) ** 2).sum())   # (feature, threshold, impurity)
+        leaf = self.min_samples_leaf
+        for f in range(X.shape[1]):
+            order = np.argsort(X[:, f], kind="stable")
+            xs = X[order, f]
+            left = np.cumsum(onehot[order], axis=0)[:-1]
+            right = left[-1] + onehot[order[-1]] - left
+            n_left = np.arange(1, n)
+            valid = (xs[1:] > xs[:-1]) & (n_left >= leaf) & (n - n_left >= leaf)
+            if not valid.any():
+                continue
+            gini_left = 1 - ((left / n_left[:, None]) ** 2).sum(axis=1)
+            gini_right = 1 - ((right / (n - n_left)[:, None]) ** 2).sum(axis=1)
+            impurity = np.where(valid, (n_left * gini_left + (n - n_left) * gini_right) / n, np.inf)
+            i = int(np.argmin(impurity))
+            if impurity[i] < best[2] - 1e-12:
+                best = (f, (xs[i] + xs[i + 1]) / 2, impurity[i])
+        return best[:2]
+
+    def _grow(self, X, y, depth):
+        node = self._node(y)
+        if depth >= self.max_depth or len(y) < 2 * self.min_samples_leaf or len(np.unique(y)) < 2:
+            return node
+        feature, threshold = self._best_split(X, y)
+        if feature is None:
+            return node
+        mask = X[:, feature] <= threshold
+        self.feature[node] = feature
+        self.threshold[node] = float(threshold)
+        self.left[node] = self._grow(X[mask], y[mask], depth + 1)
+        self.right[node] = self._grow(X[~mask], y[~mask], depth + 1)
+        return node
+
+    def predict_one(self, x):
+        node = 0
+        feature, threshold, left, right = self.feature, self.threshold, self.left, self.right
+        while feature[node] >= 0:
+            node = left[node] if x[feature[node]] <= threshold[node] else right[node]
+        return self.value[node]
+
+    def predict(self, X):
+        return np.array([self.predict_one(x) for x in np.asarray(X, dtype=float).tolist()], dtype=int)
+
+    def to_dict(self):
+        return {"max_depth": self.max_depth, "min_samples_leaf": self.min_samples_leaf,
+                "feature": self.feature, "threshold": self.threshold, "left": self.left,
+                "right": self.right, "value": self.value}
+
+    @classmethod
+    def from_dict(cls, d):
+        tree = cls(d["max_depth"], d["min_samples_leaf"])
+        for key in ("feature", "threshold", "left", "right", "value"):
+            setattr(tree, key, list(d[key]))
+        return tree
+
+class Student:
+    """(relay, buzzer) predictor: one tree over the four combined labels."""
+
+    def __init__(self, tree, trained_on=0):
+        self.tree = tree
+        self.trained_on = trained_on
+
+    @classmethod
+    def train(cls, X, relay, buzzer, **kw):
+        labels = np.asarray(relay, dtype=int) + 2 * np.asarray(buzzer, dtype=int)
+        return cls(DecisionTree(**kw).fit(X, labels), trained_on=len(labels))
+
+    def decide(self, temp, humidity, fabric_detected):
+        label = self.tree.predict_one((temp, humidity, 1.0 if fabric_detected else 0.0))
+        relay, buzzer = bool(label & 1), bool(label & 2)
+        return {"relay": relay, "buzzer": buzzer,
+                "reason": f"Distilled student: {'heat' if relay else 'hold off'}{', alarm' if buzzer else ''}."}
+
+    def predict(self, X):
+        labels = self.tree.predict(X)
+        return (labels & 1).astype(bool), (labels & 2).astype(bool)
+
+    def save(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"trained_on": self.trained_on, "tree": self.tree.to_dict()}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            d = json.load(f)
+        return cls(DecisionTree.from_dict(d["tree"]), trained_on=d.get("trained_on", 0))
+
+class StudentGate:
+    """Shadow / serve switch for the student in ai_engine's tier chain.
+
+    mode "shadow": the LLM still decides; every teacher decision is compared
+    with the student's. Once `min_shadow` comparisons agree at least
+    `promote_at` of the time, the gate starts serving. While serving, a
+    fraction `audit_rate` of requests still go to the teacher so agreement
+    keeps being measured; falling below `promote_at` demotes it again.
+    mode "serve" starts promoted, "off" disables the student entirely.
+    """
+
+    def __init__(self, student=None, mode="shadow", promote_at=0.98, min_shadow=200, window=500,
+                 audit_rate=0.05, rng=random.random):
+        self.student = student
+        self.mode = mode if student else "off"
+        self.promote_at = promote_at
+        self.min_shadow = min_shadow
+        self.audit_rate = audit_rate
+        self.rng = rng
+        self.serving = self.mode == "serve"
+        self.agreements = deque(maxlen=window)
+        self.lock = threading.Lock()
+        self.stats = {"served": 0, "audited": 0, "compared": 0, "agreed": 0, "promotions": 0, "demotions": 0}
+
+    @classmethod
+    def load(cls, path, **kw):
+        if not path or not os.path.exists(path):
+            return cls(None)
+        try:
+            return cls(Student.load(path), **kw)
+        except Exception as e:
+            print(f"Student model load failed: {e}")
+            return cls(None)
+
+    def decide(self, temp, humidity, fabric_detected):
+        """Student decision, or None when the teacher should answer (not serving / audit)."""
+        if not self.serving:
+            return None
+        if self.audit_rate and self.rng() < self.audit_rate:
+            with self.lock:
+                self.stats["audited"] += 1
+            return None
+        with self.lock:
+            self.stats["served"] += 1
+        return self.student.decide(temp, humidity, fabric_detected)
+
+    def observe(self, temp, humidity, fabric_detected, teacher_decision):
+        """Compare the student with a teacher decision; may promote or demote."""
+        if self.mode == "off":
+            return
+        guess = self.student.decide(temp, humidity, fabric_detected)
+        agreed = guess["relay"] == bool(teacher_decision.get("relay")) and \
+            guess["buzzer"] == bool(teacher_decision.get("buzzer"))
+        with self.lock:
+            self.agreements.append(agreed)
+            self.stats["compared"] += 1
+            self.stats["agreed"] += agreed
+            agreement = sum(self.agreements) / len(self.agreements)
+            if not self.serving and len(self.agreements) >= self.min_shadow and agreement >= self.promote_at:
+                self.serving = True
+                self.stats["promotions"] += 1
+                print(f"Student promoted: {agreement:.1%} agreement over {len(self.agreements)} decisions")
+            elif self.serving and self.mode != "serve" and agreement < self.promote_at:
+                self.serving = False
+                self.stats["demotions"] += 1
+                print(f"Student demoted: agreement fell to {agreement:.1%}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["mode"] = self.mode
+            stats["serving"] = self.serving
+            stats["agreement"] = sum(self.agreements) / len(self.agreements) if self.agreements else None
+        return stats
+
+# --- TinyML export ---
+def tinyml_predict(memory, temp, hum, fabric, k=TINYML_K):
+    """Python port of TinyML::predict; `memory` rows are (temp, hum, fabric, relay)."""
+    if not len(memory):
+        return False
+    memory = np.asarray(memory, dtype=float)
+    dist = np.abs(memory[:, 0] - temp) + 0.5 * np.abs(memory[:, 1] - hum)
+    dist = np.where(memory[:, 2] != float(fabric), 99999.0, dist)
+    k_eff = min(k, len(memory))
+    nearest = np.argsort(dist, kind="stable")[:k_eff]
+    votes = sum(1 for i in nearest if dist[i] <= 5000 and memory[i, 3])
+    return votes > k_eff // 2
+
+def _tinyml_predict_batch(memory, X, k=TINYML_K):
+    dist = np.abs(X[:, None, 0] - memory[None, :, 0]) + 0.5 * np.abs(X[:, None, 1] - memory[None, :, 1])
+    dist = np.where(X[:, None, 2] != memory[None, :, 2], 99999.0, dist)
+    k_eff = min(k, len(memory))
+    nearest = np.argsort(dist, axis=1, kind="stable")[:, :k_eff]
+    rows = np.arange(len(X))[:, None]
+    votes = ((dist[rows, nearest] <= 5000) & (memory[nearest, 3] > 0)).sum(axis=1)
+    return votes > k_eff // 2
+
+def select_prototypes(X, relay, n=TINYML_MAX_SAMPLES, k=TINYML_K, candidates=300, seed=0, weights=None):
+    """Greedy forward selection of the n samples whose firmware kNN best reproduces `relay`.
+
+    `weights` (per pair) sets how much each pair counts, for candidates and scoring alike.
+    """
+    rng = np.random.default_rng(seed)
+    data = np.column_stack([X, relay]).astype(float)
+    p = None if weights is None else np.asarray(weights, dtype=float) / np.sum(weights)
+    pool = rng.choice(len(data), min(candidates, np.count_nonzero(p) if p is not None else len(data)),
+                      replace=False, p=p)
+    evaluate = rng.choice(len(data), 2000, p=p) if p is not None else \
+        rng.choice(len(data), min(2000, len(data)), replace=False)
+    X_eval, relay_eval = X[evaluate], relay[evaluate]
+    chosen = []
+    for _ in range(min(n, len(pool))):
+        best, best_acc = None, -1.0
+        for c in pool:
+            if c in chosen:
+                continue
+            acc = np.mean(_tinyml_predict_batch(data[chosen + [c]], X_eval, k) == relay_eval)
+            if acc > best_acc:
+                best, best_acc = c, acc
+        chosen.append(best)
+    return data[chosen], best_acc
+
+def in_band(X):
+    """Rows in the fabric hysteresis band that only the LLM decides."""
+    from ironcore.rules import HEAT_BELOW_TEMP, COOL_ABOVE_TEMP
+
+    return (X[:, 2] > 0) & (X[:, 0] >= HEAT_BELOW_TEMP) & (X[:, 0] <= COOL_ABOVE_TEMP)
+
+def tinyml_agreement(memory, X, relay, k=TINYML_K):
+    """Relay agreement of the firmware kNN over all of X, inside the LLM band and outside it."""
+
+    hit = _tinyml_predict_batch(np.asarray(memory, dtype=float), X, k) == relay
+    band = in_band(X)
+
+    def mean(mask):
+        return float(np.mean(hit[mask])) if mask.any() else float("nan")
+
+    return {"all": mean(np.ones(len(X), dtype=bool)), "band": mean(band), "outside": mean(~band)}
+
+def export_tinyml(memory, path):
+    """C header with DataPoint seeds for TinyML::load (see firmware/src/tinyml.h)."""
+    lines = ["// Generated by scripts/distill.py -- distilled TinyML seed memory",
+             "#ifndef TINYML_SEED_H", "#define TINYML_SEED_H", "", '#include "tinyml.h"', "",
+             f"const int TINYML_SEED_COUNT = {len(memory)};",
+             "const DataPoint TINYML_SEED[] = {"]
+    for temp, hum, fabric, relay in memory:
+        lines.append(f"    {{{temp:.1f}f, {hum:.1f}f, {'true' if fabric else 'false'}, "
+                     f"{'true' if relay else 'false'}, true}},")
+    lines += ["};", "", "#endif", ""]
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+def main():
+    parser = argparse.ArgumentParser(description="Distil the LLM teacher into a student model / TinyML seed")
+    parser.add_argument("--log-dir", help="Decision log to learn from (default: config DECISION_LOG_DIR)")
+    parser.add_argument("--label", type=int, default=0, help="Also label N random inputs with get_ai_decision")
+    parser.add_argument("--out", default=None, help="Student model path (default: config STUDENT_PATH)")
+    parser.add_argument("--max-depth", type=int, default=6)
+    parser.add_argument("--tinyml", help="Also write a TinyML seed header here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from config import DECISION_LOG_DIR, STUDENT_PATH
+    rng = np.random.default_rng(args.seed)
+    parts = []
+    log_dir = args.log_dir or DECISION_LOG_DIR
+    if log_dir and os.path.isdir(os.path.join(log_dir, "decisions")):
+        parts.append(load_pairs(log_dir))
+    if args.label:
+        parts.append(label_samples(sample_inputs(args.label, rng)))
+    if not parts or not sum(len(p[0]) for p in parts):
+        parser.error("no training pairs: point --log-dir at a decision log or use --label N")
+    X, relay, buzzer = (np.concatenate(cols) for cols in zip(*parts))
+
+    # Hold out a fifth of the pairs to report agreement with the teacher
+    order = rng.permutation(len(X))
+    test, train = order[:len(X) // 5], order[len(X) // 5:]
+    student = Student.train(X[train], relay[train], buzzer[train], max_depth=args.max_depth)
+    pred_relay, pred_buzzer = student.predict(X[test])
+    agreement = np.mean((pred_relay == relay[test]) & (pred_buzzer == buzzer[test])) if len(test) else float("nan")
+    student = Student.train(X, relay, buzzer, max_depth=args.max_depth)
+    out = args.out or STUDENT_PATH
+    student.save(out)
+    print(f"Student trained on {len(X)} pairs ({len(student.tree.value)} nodes), "
+          f"held-out agreement {agreement:.1%} -> {out}")
+
+    if args.tinyml:
+        # LLM pairs only cover the 120-150C band; the rules label everything else.
+        # Uniform samples rather than logged rules rows, which pile up where the irons idle
+        protos = [(X, relay), rule_labelled(sample_inputs(TINYML_RULE_SAMPLES, rng))]
+        X_all, relay_all = (np.concatenate(cols) for cols in zip(*protos))
+        # However many pairs each side has, the band and the rest count half each
+        band = in_band(X_all)
+        weights = np.where(band, 1.0 / max(band.sum(), 1), 1.0 / max((~band).sum(), 1))
+        memory, _ = select_prototypes(X_all, relay_all, weights=weights)
+        export_tinyml(memory, args.tinyml)
+        agreement = tinyml_agreement(memory, X_all, relay_all)
+        print(f"TinyML seed: {len(memory)} samples ({memory[:, 0].min():.0f}-{memory[:, 0].max():.0f}C), "
+              f"relay agreement {agreement['all']:.1%} over {X_all[:, 0].min():.0f}-{X_all[:, 0].max():.0f}C "
+              f"(LLM band {agreement['band']:.1%}, outside {agreement['outside']:.1%}) -> {args.tinyml}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import aiohttp
+
+from ai_engine import get_ai_decision, batched_llm_decision, get_batch_stats, warm_up_llm
+from ironcore.auth import get_token_manager
+from ironcore.rules import rule_decision
+from ironcore.signals import get_signal_bank, debounce_decision
+from ironcore.cadence import poll_interval
+from ironcore.telemetry import telemetry_url, rpc_url, parse_telemetry, telemetry_ts
+from decision_log import get_decision_log
+from metrics import FETCH_SECONDS, RPC_SECONDS, TICK_SECONDS, JITTER_SECONDS, TOKEN_REFRESHES, ERRORS
+from ironcore.rpc import RpcDispatcher
+from scheduler import LATE_POLICIES, fallback_decision
+from config import FLEET_TICK, FLEET_LLM_CONCURRENCY, FLEET_MAX_CONNECTIONS, FLEET_REPORT_INTERVAL, LLM_BATCH_SIZE
+from config import POLL_ADAPTIVE, DECISION_DEADLINE, LATE_POLICY
+
+class LatencyTracker:
+    """Keeps a bounded window of recent loop latencies for one device."""
+
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self.ticks = 0
+        self.errors = 0
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+        self.ticks += 1
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return {
+            "ticks": self.ticks,
+            "errors": self.errors,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "max_ms": max(self.samples, default=0.0) * 1000,
+        }
+
+class FleetSupervisor:
+    """Drives many irons from one asyncio event loop.
+
+    Each device gets its own tick schedule (staggered across the period so
+    polls do not arrive in bursts), all HTTP traffic shares one pooled
+    keep-alive session and LLM escalations are bounded by a semaphore.
+    Escalations follow scheduler.DeadlineScheduler's rules: they answer
+    within `deadline` (never more than the device's interval) or the
+    rules / offline fallback decides, ticks that find every LLM slot taken
+    fall back at once, and late answers are handled per `late_policy`.
+    """
+
+    def __init__(self, device_ids, tick=FLEET_TICK, llm_concurrency=FLEET_LLM_CONCURRENCY,
+                 max_connections=FLEET_MAX_CONNECTIONS, report_interval=FLEET_REPORT_INTERVAL,
+                 llm_batch_size=LLM_BATCH_SIZE, guard=None, adaptive=POLL_ADAPTIVE,
+                 deadline=DECISION_DEADLINE, late_policy=LATE_POLICY):
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"late_policy must be one of {LATE_POLICIES}, got {late_policy!r}")
+        self.device_ids = list(dict.fromkeys(device_ids))
+        # Adaptive: each device's next tick follows its thermal state instead of every `tick` seconds
+        self.adaptive = adaptive
+        # guard(device_id) -> bool is checked before every actuation (shard.py: "do we still hold the lease?")
+        self.guard = guard
+        self.tick = tick
+        self.llm_concurrency = llm_concurrency
+        # Batching: each of the llm_concurrency ollama requests carries up to llm_batch_size devices
+        self.llm_batch_size = max(llm_batch_size, 1)
+        self.llm = batched_llm_decision if self.llm_batch_size > 1 else None
+        self.max_deadline = deadline
+        self.late_policy = late_policy
+        self.seq = {}   # device_id -> number of the newest decision made
+        self.deadline_stats = {"on_time": 0, "missed": 0, "busy": 0, "late_applied": 0, "late_discarded": 0,
+                               "early_blocked": 0}
+        self.max_connections = max_connections
+        self.report_interval = report_interval
+        self.latency = {}
+        self.tasks = {}
+        self.running = False
+        self.stopped = None
+        self.tokens = None
+        self.session = None
+        self.llm_slots = None
+        self.token_lock = None
+        self.decision_log = get_decision_log()
+        # Per-device running statistics, array-backed so thousands of irons stay cheap
+        self.signals = get_signal_bank()
+        # Only used for change tracking/coalescing here; posts go through aiohttp
+        self.dispatcher = RpcDispatcher(lambda: self.token, decision_log=self.decision_log)
+
+    @property
+    def token(self):
+        # Never blocks the event loop; the manager renews ahead of expiry in its own thread
+        return self.tokens.get(block=False) if self.tokens else None
+
+    @property
+    def headers(self):
+        return {"X-Authorization": f"Bearer {self.token}"}
+
+    async def run(self):
+        self.running = True
+        self.stopped = asyncio.Event()
+        self.llm_slots = asyncio.Semaphore(self.llm_concurrency * self.llm_batch_size)
+        warm_up_llm()
+        self.token_lock = asyncio.Lock()
+        self.tokens = await asyncio.to_thread(get_token_manager)
+        if not await asyncio.to_thread(self.tokens.get):
+            return
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=60)
+        timeout = aiohttp.ClientTimeout(total=10)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            self.session = session
+            print(f"Fleet mode: supervising {len(self.device_ids)} devices every {self.tick}s")
+            self.add_devices(self.device_ids)
+            reporter = asyncio.create_task(self._report_loop())
+            try:
+                await self.stopped.wait()
+                # Device loops finish their current tick and exit
+                await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+            finally:
+                self.running = False
+                reporter.cancel()
+                for task in self.tasks.values():
+                    task.cancel()
+
+    def stop(self):
+        self.running = False
+        if self.stopped:
+            self.stopped.set()
+
+    def add_devices(self, device_ids):
+        """Start supervising `device_ids` (staggered across one tick); call from the event loop."""
+        new = [device_id for device_id in dict.fromkeys(device_ids) if device_id not in self.tasks]
+        spacing = self.tick / max(len(new), 1)
+        for i, device_id in enumerate(new):
+            # Someone else may have actuated it meanwhile: nothing acknowledged earlier still holds
+            self.dispatcher.invalidate(device_id)
+            self.latency.setdefault(device_id, LatencyTracker())
+            self.tasks[device_id] = asyncio.create_task(self._device_loop(device_id, i * spacing))
+        return new
+
+    def remove_devices(self, device_ids):
+        """Stop supervising `device_ids`; an in-flight tick is cancelled before it actuates."""
+        for device_id in device_ids:
+            task = self.tasks.pop(device_id, None)
+            if task:
+                task.cancel()
+            self.latency.pop(device_id, None)
+
+    async def _refresh_token(self, stale_token):
+        async with self.token_lock:
+            # Another device may already have refreshed while we waited
+            if self.token == stale_token:
+                print("Token rejected, refreshing...")
+                await asyncio.to_thread(self.tokens.invalidate, stale_token)
+
+    async def _device_loop(self, device_id, offset):
+        loop = asyncio.get_running_loop()
+        tracker = self.latency[device_id]
+        next_tick = loop.time() + offset
+        while self.running:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            started = loop.time()
+            JITTER_SECONDS.observe(max(0.0, started - next_tick), loop="fleet")
+            token = self.token
+            try:
+                await self._tick(device_id)
+                tracker.record(loop.time() - started)
+                TICK_SECONDS.observe(loop.time() - started, loop="fleet")
+            except aiohttp.ClientResponseError as e:
+                tracker.errors += 1
+                ERRORS.inc(stage="telemetry")
+                if e.status == 401:
+                    TOKEN_REFRESHES.inc()
+                    await self._refresh_token(token)
+                else:
+                    print(f"[{device_id}] HTTP Error: {e.status} {e.message}")
+            except Exception as e:
+                tracker.errors += 1
+                ERRORS.inc(stage="loop")
+                print(f"[{device_id}] Loop Error: {e!r}")
+
+            # Fixed-rate (or adaptive) schedule; skip ticks we already missed instead of bursting
+            interval = self._interval(device_id)
+            next_tick += interval
+            if next_tick < loop.time():
+                next_tick = loop.time() + interval
+
+    async def _tick(self, device_id):
+        fetch_started = time.perf_counter()
+        async with self.session.get(telemetry_url(device_id), headers=self.headers) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+        FETCH_SECONDS.observe(time.perf_counter() - fetch_started, loop="fleet")
+        temp, hum, fabric = parse_telemetry(data)
+        sample_ts = telemetry_ts(data)
+        self.decision_log.log_sample(device_id, temp, hum, fabric, ts=sample_ts)
+        state = self.signals.update(device_id, temp, fabric, ts=sample_ts / 1000 if sample_ts else None)
+        fabric = state.fabric
+
+        started = time.perf_counter()
+        seq = self.seq[device_id] = self.seq.get(device_id, 0) + 1
+        if rule_decision(temp, hum, fabric) is not None:
+            decision = get_ai_decision(temp, hum, fabric)
+        else:
+            decision = await self._escalate(device_id, seq, temp, hum, fabric, state)
+        decision = debounce_decision(decision, state)
+        self.decision_log.log_decision(device_id, temp, hum, fabric, decision, (time.perf_counter() - started) * 1000)
+
+        await self._dispatch(device_id, decision)
+        return decision
+
+    def _interval(self, device_id):
+        return poll_interval(self.signals.get(device_id)) if self.adaptive else self.tick
+
+    async def _escalate(self, device_id, seq, temp, hum, fabric, state):
+        """LLM decision within the deadline, else the fallback (see scheduler.DeadlineScheduler.decide)."""
+        loop = asyncio.get_running_loop()
+        expired = threading.Event()
+
+        def actuate_early(fields):
+            # Called from the inference thread once relay/buzzer have streamed in
+            if expired.is_set():
+                loop.call_soon_threadsafe(self._count, "early_blocked")
+                return
+            fields = debounce_decision(fields, state)
+            asyncio.run_coroutine_threadsafe(self._dispatch(device_id, fields), loop)
+
+        if self.llm_slots.locked():
+            self._count("busy")
+            return fallback_decision(temp, hum, fabric)
+        await self.llm_slots.acquire()
+        inference = asyncio.ensure_future(
+            asyncio.to_thread(get_ai_decision, temp, hum, fabric, actuate_early, self.llm))
+        inference.add_done_callback(lambda task: self.llm_slots.release())
+        try:
+            # Shielded: the thread keeps running past the deadline and holds its slot until it returns
+            decision = await asyncio.wait_for(asyncio.shield(inference),
+                                              min(self.max_deadline, self._interval(device_id)))
+            self._count("on_time")
+            return decision
+        except asyncio.TimeoutError:
+            expired.set()
+            self._count("missed")
+            inference.add_done_callback(lambda task: self._on_late(task, device_id, seq, state))
+            return fallback_decision(temp, hum, fabric)
+
+    def _on_late(self, task, device_id, seq, state):
+        if task.cancelled() or task.exception() is not None:
+            return
+        decision = task.result()
+        current = self.seq.get(device_id) == seq and device_id in self.tasks
+        if self.late_policy == "apply" and current and not decision.get("fallback"):
+            self._count("late_applied")
+            asyncio.ensure_future(self._dispatch(device_id, debounce_decision(decision, state)))
+        else:
+            self._count("late_discarded")
+
+    def _count(self, key):
+        self.deadline_stats[key] += 1
+
+    async def _dispatch(self, device_id, decision):
+        if self.guard and not self.guard(device_id):
+            return
+        self.dispatcher.submit(device_id, "setRelay", decision['relay'])
+        if decision['buzzer']:
+            self.dispatcher.submit(device_id, "setBuzzer", True)
+        for method, params in self.dispatcher.take(device_id):
+            if self.guard and not self.guard(device_id):
+                return   # the lease moved while an earlier command was being sent
+            ok = await self._send_rpc(device_id, method, params)
+            self.dispatcher.ack(device_id, method, params, ok)
+
+    async def _send_rpc(self, device_id, method, params):
+        started = time.perf_counter()
+        async with self.session.post(rpc_url(device_id), headers=self.headers,
+                                     json={"method": method, "params": params}) as resp:
+            RPC_SECONDS.observe(time.perf_counter() - started, method=method)
+            if resp.status != 200:
+                ERRORS.inc(stage="rpc")
+                print(f"[{device_id}] RPC {method} Failed: {resp.status}")
+            return resp.status == 200
+
+    # --- Reporting ---
+    def get_report(self):
+        per_device = {device_id: tracker.summary() for device_id, tracker in self.latency.items()}
+        p95s = sorted(s["p95_ms"] for s in per_device.values())
+        return {
+            "devices": len(per_device),
+            "ticks": sum(s["ticks"] for s in per_device.values()),
+            "errors": sum(s["errors"] for s in per_device.values()),
+            "rpc": self.dispatcher.get_stats(),
+            "auth": self.tokens.get_stats() if self.tokens else {},
+            "llm_batches": get_batch_stats(),
+            "deadline": dict(self.deadline_stats),
+            "signals": self.signals.get_stats(),
+            "median_p95_ms": p95s[len(p95s) // 2] if p95s else 0.0,
+            "worst_p95_ms": p95s[-1] if p95s else 0.0,
+            "per_device": per_device,
+        }
+
+    async def _report_loop(self):
+        while self.running:
+            await asyncio.sleep(self.report_interval)
+            report = self.get_report()
+            print(f"Fleet: {report['devices']} devices, {report['ticks']} ticks, {report['errors']} errors, "
+                  f"p95 median {report['median_p95_ms']:.0f}ms, worst {report['worst_p95_ms']:.0f}ms")
+            rpc = report["rpc"]
+            print(f"  RPC: {rpc['sent']} sent, {rpc['suppressed']} suppressed, {rpc['failed']} failed")
+            late = report["deadline"]
+            print(f"  LLM: {late['on_time']} on time, {late['missed']} missed deadline, {late['busy']} busy")
+            slowest = sorted(report["per_device"].items(), key=lambda kv: kv[1]["p95_ms"], reverse=True)[:5]
+            for device_id, s in slowest:
+                print(f"  {device_id}: p50={s['p50_ms']:.0f}ms p95={s['p95_ms']:.0f}ms max={s['max_ms']:.0f}ms")
+
+def run_fleet(device_ids, **kwargs):
+    supervisor = FleetSupervisor(device_ids, **kwargs)
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        print("Fleet stopped.")
+    return supervisor
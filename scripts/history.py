@@ -0,0 +1,141 @@
+import numpy as np
+
+FIELDS = ("time", "temperature", "humidity")
+
+class RingBuffer:
+    """Preallocated column store with O(1) append; oldest rows are overwritten."""
+
+    def __init__(self, capacity, fields=FIELDS):
+        self.fields = fields
+        self.capacity = capacity
+        self.data = np.zeros((len(fields), capacity))
+        self.head = 0   # next write position
+        self.size = 0
+
+    def append(self, *values):
+        self.data[:, self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def __len__(self):
+        return self.size
+
+    def _halves(self):
+        """(older, newer) views of the stored rows, each already in time order."""
+        if self.size < self.capacity:
+            return self.data[:, :self.size], self.data[:, :0]
+        return self.data[:, self.head:], self.data[:, :self.head]
+
+    def columns(self):
+        """All rows, oldest first, as a (fields, size) array."""
+        older, newer = self._halves()
+        return np.concatenate((older, newer), axis=1) if newer.shape[1] else older.copy()
+
+    def since(self, t0):
+        """Rows with time >= t0, copying only that tail rather than the whole ring."""
+        older, newer = self._halves()
+        if newer.shape[1] and (not older.shape[1] or t0 > older[0, -1]):
+            return newer[:, np.searchsorted(newer[0], t0):].copy()
+        start = np.searchsorted(older[0], t0)
+        return np.concatenate((older[:, start:], newer), axis=1)
+
+    def latest_time(self):
+        if not self.size:
+            return None
+        return self.data[0, self.head - 1]
+
+    def oldest_time(self):
+        if not self.size:
+            return None
+        return self.data[0, self.head if self.size == self.capacity else 0]
+
+class Rollup:
+    """Averages samples into fixed-width time buckets stored in their own ring."""
+
+    def __init__(self, bucket_seconds, capacity):
+        self.bucket_seconds = bucket_seconds
+        self.ring = RingBuffer(capacity)
+        self.bucket = None
+        self.sums = np.zeros(len(FIELDS) - 1)
+        self.count = 0
+
+    def add(self, t, *values):
+        bucket = int(t // self.bucket_seconds)
+        if self.bucket is not None and bucket != self.bucket:
+            self._close()
+        self.bucket = bucket
+        self.sums += values
+        self.count += 1
+
+    def _close(self):
+        if self.count:
+            mid = (self.bucket + 0.5) * self.bucket_seconds
+            self.ring.append(mid, *(self.sums / self.count))
+        self.sums[:] = 0
+        self.count = 0
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets downsampling; returns selected indices."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the third triangle vertex
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+class TelemetryHistory:
+    """Raw 1 Hz history plus per-minute rollups, served at a fixed point budget.
+
+    Appends are O(1) and memory is fixed up front: by default 12 hours of raw
+    samples and 7 days of minute averages.
+    """
+
+    def __init__(self, raw_capacity=12 * 3600, rollup_seconds=60, rollup_capacity=7 * 24 * 60):
+        self.raw = RingBuffer(raw_capacity)
+        self.rollup = Rollup(rollup_seconds, rollup_capacity)
+
+    def append(self, t, temperature, humidity):
+        self.raw.append(t, temperature, humidity)
+        self.rollup.add(t, temperature, humidity)
+
+    @property
+    def empty(self):
+        return len(self.raw) == 0
+
+    def window(self, seconds, max_points=500):
+        """(fields, n) array covering the last `seconds`, at most `max_points` wide."""
+        if self.empty:
+            return np.zeros((len(FIELDS), 0))
+        latest = self.raw.latest_time()
+        t0 = latest - seconds
+        oldest_raw = self.raw.oldest_time()
+        if t0 >= oldest_raw or not len(self.rollup.ring):
+            cols = self.raw.since(t0)
+        else:
+            # Older than the raw ring: minute averages, then raw for the recent tail
+            older = self.rollup.ring.since(t0)
+            older = older[:, older[0] < oldest_raw]
+            cols = np.concatenate((older, self.raw.columns()), axis=1)
+        idx = lttb(cols[0], cols[1], max_points)
+        return cols[:, idx]
+
+    def to_frame(self, seconds, max_points=500):
+        import pandas as pd
+
+        cols = self.window(seconds, max_points)
+        return pd.DataFrame({
+            "time": pd.to_datetime(cols[0], unit="s"),
+            "temperature": cols[1],
+            "humidity": cols[2],
+        })
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import TB_URL, HISTORY_WORKERS, HISTORY_CACHE_PAGES, HISTORY_LIVE_TTL
+
+AGGREGATIONS = ("AVG", "MIN", "MAX")
+
+# Bucket widths (seconds) the dashboard asks ThingsBoard for. Snapping to a
+# fixed ladder keeps cache keys stable when operators zoom and pan.
+INTERVALS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 24 * 3600)
+
+def interval_for(seconds, max_points=500):
+    """Narrowest bucket width that keeps `seconds` of history within `max_points`."""
+    for interval in INTERVALS:
+        if seconds / interval <= max_points:
+            return interval
+    return INTERVALS[-1]
+
+class HistoryQuery:
+    """Aggregated ThingsBoard timeseries, fetched in cached pages.
+
+    A query for [start, end) at a given `interval` and `agg` is split into
+    epoch-aligned pages of `page_buckets` buckets. Pages already in the cache
+    are served locally; the rest are requested concurrently over one pooled
+    session, using the range API (startTs/endTs/interval/agg). Closed pages
+    never change and stay cached until evicted (LRU, `max_pages`); the page
+    that contains "now" is re-fetched once it is `live_ttl` seconds old.
+    """
+
+    def __init__(self, token_provider, url=TB_URL, keys=("temperature", "humidity"), page_buckets=96,
+                 max_workers=8, max_pages=4096, live_ttl=30.0, timeout=10, clock=time.time):
+        self.token_provider = token_provider
+        self.url = url
+        self.keys = tuple(keys)
+        self.page_buckets = page_buckets
+        self.max_pages = max_pages
+        self.live_ttl = live_ttl
+        self.timeout = timeout
+        self.clock = clock
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="history")
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()   # (device_id, agg, interval, page) -> (fetched_at, closed, columns)
+        self.stats = {"queries": 0, "page_hits": 0, "page_misses": 0, "requests": 0, "failed": 0}
+
+    # --- Public API ---
+    def query(self, device_id, start, end, interval=None, agg="AVG", max_points=500):
+        """DataFrame of `time` plus one column per key covering [start, end) (epoch seconds)."""
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"agg must be one of {AGGREGATIONS}, got {agg!r}")
+        interval = interval or interval_for(end - start, max_points)
+        span = interval * self.page_buckets
+        now = self.clock()
+        wanted = range(int(start // span), int(min(end, now) // span) + 1)
+
+        with self.lock:
+            self.stats["queries"] += 1
+            cached, missing = {}, []
+            for page in wanted:
+                entry = self._lookup((device_id, agg, interval, page), now)
+                if entry is None:
+                    missing.append(page)
+                else:
+                    cached[page] = entry
+            self.stats["page_hits"] += len(cached)
+            self.stats["page_misses"] += len(missing)
+
+        fetched = self.pool.map(lambda page: self._fetch_page(device_id, agg, interval, page), missing)
+        for page, columns in zip(missing, fetched):
+            if columns is None:
+                continue   # failed page: leave a gap, try again on the next query
+            cached[page] = columns
+            closed = (page + 1) * span <= now
+            with self.lock:
+                self.pages[(device_id, agg, interval, page)] = (now, closed, columns)
+                while len(self.pages) > self.max_pages:
+                    self.pages.popitem(last=False)
+
+        parts = [cached[page] for page in wanted if page in cached]
+        cols = np.concatenate(parts, axis=1) if parts else np.zeros((len(self.keys) + 1, 0))
+        cols = cols[:, (cols[0] >= start) & (cols[0] < end)]
+        frame = pd.DataFrame({"time": pd.to_datetime(cols[0], unit="s")})
+        for i, key in enumerate(self.keys):
+            frame[key] = cols[i + 1]
+        return frame
+
+    def last(self, device_id, seconds, agg="AVG", max_points=500):
+        end = self.clock()
+        return self.query(device_id, end - seconds, end, agg=agg, max_points=max_points)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["cached_pages"] = len(self.pages)
+        return stats
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        self.session.close()
+
+    # --- Internals ---
+    def _lookup(self, key, now):
+        """Cached columns for `key`, or None if absent or a stale live page. Caller holds the lock."""
+        entry = self.pages.get(key)
+        if entry is None:
+            return None
+        fetched_at, closed, columns = entry
+        if not closed and now - fetched_at > self.live_ttl:
+            del self.pages[key]
+            return None
+        self.pages.move_to_end(key)
+        return columns
+
+    def _fetch_page(self, device_id, agg, interval, page):
+        span = interval * self.page_buckets
+        params = {
+            "keys": ",".join(self.keys),
+            "startTs": int(page * span * 1000),
+            "endTs": int((page + 1) * span * 1000),
+            "interval": int(interval * 1000),
+            "agg": agg,
+            "limit": self.page_buckets + 1,
+            "orderBy": "ASC",
+            "useStrictDataTypes": "true",
+        }
+        url = f"{self.url}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries"
+        try:
+            token = self.token_provider()
+            resp = self.session.get(url, params=params, headers={"X-Authorization": f"Bearer {token}"},
+                                    timeout=self.timeout)
+            with self.lock:
+                self.stats["requests"] += 1
+            if resp.status_code == 401 and hasattr(self.token_provider, "invalidate"):
+                self.token_provider.invalidate(token)
+            resp.raise_for_status()
+            return self._columns(resp.json())
+        except Exception as e:
+            with self.lock:
+                self.stats["failed"] += 1
+            print(f"History query failed ({device_id}, page {page}): {e}")
+            return None
+
+    def _columns(self, data):
+        """(1 + keys, n) array on a shared, sorted timestamp axis; missing values are NaN."""
+        series = {key: {point["ts"]: float(point["value"]) for point in data.get(key, [])
+                        if point.get("value") is not None}
+                  for key in self.keys}
+        stamps = sorted(set().union(*series.values()))
+        cols = np.full((len(self.keys) + 1, len(stamps)), np.nan)
+        cols[0] = np.asarray(stamps, dtype=float) / 1000
+        for i, key in enumerate(self.keys):
+            cols[i + 1] = [series[key].get(ts, np.nan) for ts in stamps]
+        return cols
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_history_query():
+    """Process-wide history layer, so every dashboard session shares one page cache."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            from ironcore.auth import get_token_manager
+            _shared = HistoryQuery(get_token_manager(), max_workers=HISTORY_WORKERS, max_pages=HISTORY_CACHE_PAGES,
+                                   live_ttl=HISTORY_LIVE_TTL)
+        return _shared
+
+if __name__ == "__main__":
+    # Cold vs warm week-long query against the local stand-in server
+    from standins import FakeThingsBoard
+    from ironcore.auth import TokenManager
+
+    tb = FakeThingsBoard(latency=0.05).start()
+    history = HistoryQuery(TokenManager(url=tb.url, username="u", password="p"), url=tb.url)
+    for label in ("cold", "warm", "pan 1h"):
+        end = time.time() - (3600 if label == "pan 1h" else 0)
+        started = time.perf_counter()
+        frame = history.query("standin-device", end - 7 * 24 * 3600, end)
+        print(f"{label}: {len(frame)} points in {(time.perf_counter() - started) * 1000:.0f} ms")
+    print(history.get_stats())
+    tb.stop()
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from config import OLLAMA_HOST, LLM_KEEP_ALIVE, LLM_POOL_SIZE
+
+class InferenceService:
+    """One pooled ollama client for the whole process, with the model pinned.
+
+    Every chat goes through the same keep-alive HTTP connection pool and
+    carries `keep_alive`, so ollama does not unload the model between
+    decisions. Callers pass the same static system prompt and the same
+    options on every call; ollama then reuses the evaluated prompt prefix
+    and only processes the short per-sample user message. warm_up() loads
+    the model and primes that prefix before the first real decision.
+    """
+
+    def __init__(self, model, host=OLLAMA_HOST, keep_alive=LLM_KEEP_ALIVE, pool_size=LLM_POOL_SIZE):
+        self.model = model
+        self.host = host
+        self.keep_alive = keep_alive
+        self.pool_size = pool_size
+        self._client = None
+        self.lock = threading.Lock()
+        self.warm = threading.Event()
+        self.stats = {"calls": 0, "warmups": 0, "warmup_s": 0.0}
+
+    @property
+    def client(self):
+        # ollama (and httpx/pydantic behind it) is the heaviest import in the
+        # agent; only pay for it once a decision actually needs the LLM
+        with self.lock:
+            if self._client is None:
+                import httpx
+                import ollama
+
+                limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                self._client = ollama.Client(host=self.host, limits=limits)
+            return self._client
+
+    def chat(self, messages, **kwargs):
+        with self.lock:
+            self.stats["calls"] += 1
+        return self.client.chat(model=self.model, messages=messages, keep_alive=self.keep_alive, **kwargs)
+
+    def warm_up(self, system_prompt, options=None):
+        """Load the model and evaluate `system_prompt` once; returns seconds taken."""
+        started = time.perf_counter()
+        try:
+            self.client.chat(model=self.model, keep_alive=self.keep_alive,
+                             messages=[{'role': 'system', 'content': system_prompt},
+                                       {'role': 'user', 'content': "Ready?"}],
+                             options={**(options or {}), "num_predict": 1})
+        except Exception as e:
+            print(f"LLM warm-up failed: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.stats["warmups"] += 1
+            self.stats["warmup_s"] += elapsed
+        self.warm.set()
+        return elapsed
+
+    def warm_up_async(self, system_prompt, options=None):
+        threading.Thread(target=self.warm_up, args=(system_prompt, options), daemon=True).start()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["warm"] = self.warm.is_set()
+        return stats
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for one `batch_fn` call.
+
+    submit() blocks until its item's result is ready. The first item of a
+    batch waits at most `max_wait` seconds for company; a batch is sent as
+    soon as it holds `max_batch` items. `batch_fn(items)` returns one result
+    per item, in order.
+    """
+
+    def __init__(self, batch_fn, max_batch=8, max_wait=0.02):
+        self.batch_fn = batch_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.cond = threading.Condition()
+        self.queue = []   # (item, future)
+        self.stats = {"items": 0, "batches": 0}
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        with self.cond:
+            self.queue.append((item, future))
+            self.cond.notify()
+        return future.result()
+
+    def _take(self):
+        with self.cond:
+            while not self.queue:
+                self.cond.wait()
+            deadline = time.monotonic() + self.max_wait
+            while len(self.queue) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+            batch, self.queue = self.queue[:self.max_batch], self.queue[self.max_batch:]
+            self.stats["items"] += len(batch)
+            self.stats["batches"] += 1
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take()
+            # Each batch runs on its own thread so the next one can fill meanwhile
+            threading.Thread(target=self._resolve, args=(batch,), daemon=True).start()
+
+    def _resolve(self, batch):
+        try:
+            results = self.batch_fn([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+
+    def get_stats(self):
+        with self.cond:
+            stats = dict(self.stats)
+        stats["mean_batch"] = stats["items"] / stats["batches"] if stats["batches"] else 0.0
+        return stats
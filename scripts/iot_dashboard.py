@@ -1,13 +1,22 @@
 import streamlit as st
 import requests
 import time
+import uuid
 import pandas as pd
-import threading
 import random
 import numpy as np
 import altair as alt
-from ai_engine import get_ai_decision
-from config import TB_URL, USERNAME, PASSWORD, DEVICE_ID
+from ai_worker import AIWorker
+from decision_log import get_decision_log
+from ironcore.auth import get_token_manager
+from history_query import get_history_query
+from metrics import start_metrics_server
+from ai_engine import warm_up_llm
+from fabric_classifier import SIGNATURES, DESCRIPTIONS, SPECTRUM_KEY, get_library, synthesize
+from dashboard_controller import DashboardController, TelemetryHub
+from dashboard_render import Widget, LiveChart
+from config import TB_URL, DEVICE_ID, TELEMETRY_SOURCE, AI_WORKERS, DASHBOARD_FETCH_INTERVAL, RENDER_FPS, CHART_FPS
+from config import DECISION_DEADLINE
 
 # --- Page Config ---
 st.set_page_config(
@@ -69,8 +78,6 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- Session State ---
-if 'history' not in st.session_state:
-    st.session_state.history = pd.DataFrame(columns=['time', 'temperature', 'humidity'])
 if 'fabric_type' not in st.session_state:
     st.session_state.fabric_type = "Unknown"
 if 'model_trained' not in st.session_state:
@@ -83,54 +90,28 @@ if 'last_tp' not in st.session_state:
     st.session_state.last_tp = 0
 
 # --- Auth Helper ---
-@st.cache_data(ttl=3600)
 def get_tb_token():
-    url = f"{TB_URL}/api/auth/login"
-    try:
-        response = requests.post(url, json={"username": USERNAME, "password": PASSWORD})
-        response.raise_for_status()
-        return response.json()["token"]
-    except Exception as e:
-        return None
-
-# --- Background AI Worker ---
-class AIWorker:
-    def __init__(self):
-        self.latest_telemetry = (0.0, 0.0, False) # Temp, Hum, Fabric
-        self.latest_decision = {"relay": False, "buzzer": False, "reason": "Initializing AI..."}
-        self.running = True
-        self.lock = threading.Lock()
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
-        self.thread.start()
-
-    def update_telemetry(self, temp, hum, fabric):
-        with self.lock:
-            self.latest_telemetry = (temp, hum, fabric)
-
-    def get_decision(self):
-        with self.lock:
-            return self.latest_decision
-
-    def _run_loop(self):
-        while self.running:
-            with self.lock:
-                t, h, f = self.latest_telemetry
-            try:
-                decision = get_ai_decision(t, h, f)
-                with self.lock:
-                    self.latest_decision = decision
-            except Exception as e:
-                print(f"AI Worker Error: {e}")
-            time.sleep(1)
+    # Shared with the agent code: renewed ahead of JWT expiry, failed logins are retried with backoff
+    return get_token_manager().get()
 
+# --- Fabric Classifier ---
 @st.cache_resource
-def get_ai_worker():
-    return AIWorker()
+def get_fabric_library():
+    # Reference matrix is built once per server and shared by every session
+    return get_library()
 
 # --- Data Fetching ---
-def fetch_telemetry(token):
+@st.cache_resource
+def get_telemetry_stream():
+    # Push ingestion (ws / mqtt) shared by every session; None means REST polling
+    if TELEMETRY_SOURCE == "poll":
+        return None
+    from telemetry_stream import create_source
+    return create_source(TELEMETRY_SOURCE, [DEVICE_ID], get_tb_token).start()
+
+def fetch_telemetry(token, device_id=DEVICE_ID):
     headers = {"X-Authorization": f"Bearer {token}"}
-    url = f"{TB_URL}/api/plugins/telemetry/DEVICE/{DEVICE_ID}/values/timeseries?keys=temperature,humidity,fabric_detected&useStrictDataTypes=true"
+    url = f"{TB_URL}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries?keys=temperature,humidity,fabric_detected,{SPECTRUM_KEY}&useStrictDataTypes=true"
     try:
         resp = requests.get(url, headers=headers, timeout=2)
         if resp.status_code == 200:
@@ -140,14 +121,63 @@ def fetch_telemetry(token):
         return {}, 0, str(e)
     return {}, 0, "Unknown"
 
+@st.cache_resource
+def get_rpc_dispatcher():
+    from ironcore.rpc import RpcDispatcher
+    return RpcDispatcher(get_tb_token, decision_log=get_decision_log())
+
 def send_rpc(token, method, params):
-    headers = {"X-Authorization": f"Bearer {token}"}
-    url = f"{TB_URL}/api/plugins/rpc/oneway/{DEVICE_ID}"
-    try:
-        requests.post(url, headers=headers, json={"method": method, "params": params}, timeout=2)
-        return True
-    except:
-        return False
+    # Manual commands always go out, but still update the dispatcher's acked state
+    results = get_rpc_dispatcher().send(DEVICE_ID, method, params, force=True)
+    return bool(results) and all(ok for _, _, ok in results)
+
+# --- Telemetry Hub ---
+@st.cache_resource
+def get_telemetry_hub():
+    # One fetch/AI/control loop per device for the whole server; sessions only read snapshots
+    start_metrics_server()
+    warm_up_llm()
+    def make_controller(device_id):
+        # Like DeadlineScheduler, the deadline never exceeds the gap between ticks
+        ai_worker = AIWorker(num_workers=AI_WORKERS, decision_log=get_decision_log(), device_id=device_id,
+                             deadline=min(DECISION_DEADLINE, DASHBOARD_FETCH_INTERVAL))
+        return DashboardController(
+            device_id, get_token_manager(), lambda token: fetch_telemetry(token, device_id), ai_worker,
+            get_rpc_dispatcher(), stream=get_telemetry_stream(), fetch_interval=DASHBOARD_FETCH_INTERVAL,
+            decision_log=get_decision_log(), archive=get_history_query())
+    return TelemetryHub(make_controller)
+
+# --- Rendering ---
+def draw_metrics(ph, model):
+    temp, hum, fabric_detected, fabric_type, confidence, rate = model
+    with ph.container():
+        m1, m2, m3, m4 = st.columns(4)
+        m1.markdown(f"""<div class='metric-card'><div class='metric-label'>Temperature ({rate:+.1f}°C/s)</div><div class='metric-value'>{temp}°C</div></div>""", unsafe_allow_html=True)
+        m2.markdown(f"""<div class='metric-card'><div class='metric-label'>Humidity</div><div class='metric-value'>{hum}%</div></div>""", unsafe_allow_html=True)
+
+        fab_color = "#4CAF50" if fabric_detected else "#FF5252"
+        fab_text = "DETECTED" if fabric_detected else "NO FABRIC"
+        m3.markdown(f"""<div class='metric-card' style='border-color: {fab_color};'><div class='metric-label'>Cloth Detection</div><div class='metric-value' style='color:{fab_color};'>{fab_text}</div></div>""", unsafe_allow_html=True)
+        fab_label = f"Fabric Type ({confidence}%)" if fabric_detected and confidence else "Fabric Type"
+        m4.markdown(f"""<div class='metric-card'><div class='metric-label'>{fab_label}</div><div class='metric-value' style='font-size: 1.8em;'>{fabric_type}</div></div>""", unsafe_allow_html=True)
+
+def draw_insight(ph, model):
+    reason, tier, rpc_sent, rpc_suppressed, relay, auto_mode, model_trained, viewers = model
+    with ph.container():
+        st.subheader("AI Supervisor Insight")
+        c1, c2 = st.columns([2, 1])
+        with c1:
+            if model_trained:
+                reason = f"(Fine-Tuned) {reason}"
+            st.info(f"**Reasoning:** {reason}")
+            st.caption(f"Decided by: {tier.upper()} tier | RPC sent {rpc_sent}, suppressed {rpc_suppressed} | "
+                       f"{viewers} viewer{'s' if viewers != 1 else ''}")
+        with c2:
+            action = "IRON ON" if relay else "IRON OFF"
+            if auto_mode:
+                 st.metric("Recommended Action (Active)", action)
+            else:
+                 st.metric("Recommended Action (Paused)", action, delta="Manual Override", delta_color="off")
 
 # --- Main Dashboard Logic ---
 def main():
@@ -158,13 +188,15 @@ def main():
         st.error("Could not authenticate with ThingsBoard. Check credentials in `config.py`.")
         st.stop()
     
-    ai_worker = get_ai_worker()
+    hub = get_telemetry_hub()
+    controller = hub.controller(DEVICE_ID)
+    if 'viewer_id' not in st.session_state:
+        st.session_state.viewer_id = uuid.uuid4().hex
 
-    # --- Sidebar Controls (Global) ---
-    # Initialize Debug Vars
-    status_code = 0
-    raw_resp = "Waiting for data..."
-    data = {}
+    # Control settings belong to the device: every viewer sees and changes the same ones
+    settings = controller.get_settings()
+    st.session_state.auto_mode = settings["auto_mode"]
+    st.session_state.manual_fabric_override = settings["fabric_override"]
 
     # --- Sidebar Controls (Global) ---
     with st.sidebar:
@@ -180,17 +212,20 @@ def main():
         st.subheader("System Override")
         if st.button("FORCE IRON ON", type="primary"):
             st.session_state.auto_mode = False
+            controller.configure(auto_mode=False)
             send_rpc(token, "setRelay", True)
             st.success("Manual: IRON ON")
             
         if st.button("FORCE IRON OFF"):
             st.session_state.auto_mode = False
+            controller.configure(auto_mode=False)
             send_rpc(token, "setRelay", False)
             st.warning("Manual: IRON OFF")
 
         if not st.session_state.auto_mode:
             if st.button("RESUME AI MODE"):
                 st.session_state.auto_mode = True
+                controller.configure(auto_mode=True)
                 st.info("Resuming AI Control...")
                 st.rerun()
 
@@ -210,20 +245,30 @@ def main():
         st.markdown("---")
         auto_refresh = st.checkbox("Auto-Refresh Data", value=True)
         
+        trend_windows = {"Last 5 min": 300, "Last hour": 3600, "Shift (8h)": 8 * 3600,
+                         "Last 24h": 24 * 3600, "Last 7 days": 7 * 24 * 3600}
+        trend_label = st.selectbox("Trend Window", list(trend_windows), index=1)
+        trend_seconds = trend_windows[trend_label]
+        time_format = '%H:%M:%S' if trend_seconds <= 3600 else '%d %b %H:%M'
+
         with st.expander("Advanced Settings"):
-            invert_sensor = st.checkbox("Invert Sensor Logic", value=False, help="Check this if 'Detected' shows when empty.")
+            invert_sensor = st.checkbox("Invert Sensor Logic", value=settings["invert_sensor"], help="Check this if 'Detected' shows when empty.")
+            if invert_sensor != settings["invert_sensor"]:
+                controller.configure(invert_sensor=invert_sensor)
 
         st.markdown("---")
         st.subheader("Simulation")
         if st.button("Detect Cloth Type"):
             st.session_state.manual_fabric_override = True
             st.session_state.fabric_type = "Cotton"
+            controller.configure(fabric_override=True)
             st.rerun()
             
         if st.session_state.get('manual_fabric_override', False):
             if st.button("Reset Detection"):
                 st.session_state.manual_fabric_override = False
                 st.session_state.fabric_type = "Unknown"
+                controller.configure(fabric_override=False)
                 st.rerun()
 
         st.markdown("---")
@@ -255,7 +300,9 @@ def main():
         metrics_ph = st.empty()
         st.markdown("---")
         ai_ph = st.empty()
+        st.markdown("### Temperature Trend")
         chart_ph = st.empty()
+        st.markdown("### Humidity Trend")
         hum_chart_ph = st.empty()
 
 
@@ -286,221 +333,72 @@ def main():
 
         if start_train:
             st.session_state.model_trained = False
-            
-            # --- Define Spectral Signatures (Scientific Data) ---
-            # Format: [(Wavelength, Intensity), ...]
-            signatures = {
-                "Wool": [(1564, 0.85), (1693, 0.9), (2968, 0.4), (3439, 0.5)], # Amide I & II
-                "Silk": [(1566, 0.8), (1707, 0.9), (3082, 0.4), (3333, 0.5)], # Beta-sheet
-                "Nylon": [(1572, 0.8), (1670, 0.9), (2951, 0.5), (3327, 0.4)], # Polyamide
-                "Cotton": [(898, 0.6), (1034, 0.95), (1130, 0.7), (2904, 0.4), (3423, 0.5)], # Cellulose O-H
-                "Viscose": [(897, 0.6), (1022, 0.95), (1173, 0.7), (2900, 0.4), (3500, 0.5)],
-                "Acetate": [(1219, 0.8), (1387, 0.6), (1788, 0.95), (3494, 0.4)], # Strong Carbonyl
-                "Polyester": [(737, 0.7), (1143, 0.6), (1303, 0.65), (1743, 0.95)], # Intense C=O
-                "Polyacrylic": [(1454, 0.6), (1740, 0.7), (2243, 1.0), (2941, 0.5)], # Unique Nitrile C≡N
-                "Polyethylene": [(719, 0.8), (1473, 0.7), (2852, 0.9), (2928, 0.95)] # C-H stretch
-            }
-            
-            # --- Spectral Explanations ---
-            descriptions = {
-                "Wool": "Strong Amide I & II peaks (1500-1700 cm⁻¹) identifying Protein fibres.",
-                "Silk": "Distinct protein peaks similar to Wool but with sharp secondary peak at 1707 cm⁻¹.",
-                "Nylon": "Polyamide structure identified by sharp peaks at 1670/1572 cm⁻¹.",
-                "Cotton": "Cellulose fingerprint: Strong broad O-H stretch (~3400) and sharp C-O (~1034).",
-                "Viscose": "Regenerated cellulose; similar to Cotton but with shift to 3500/1022 cm⁻¹.",
-                "Acetate": "Identified by strong Carbonyl (C=O) peak at 1788 cm⁻¹.",
-                "Polyester": "Dominant Carbonyl (C=O) stretch at 1743 cm⁻¹.",
-                "Polyacrylic": "Unmistakable Nitrile (C≡N) triple bond peak at 2243 cm⁻¹.",
-                "Polyethylene": "Simple spectrum dominated by strong C-H stretching at 2928/2852 cm⁻¹."
-            }
-
-            peaks = signatures.get(target_material, [(1500, 0.5)])
-            x = np.linspace(600, 4000, 300) # Wavenumbers
-            
-            # Generate Target Spectrum (Ground Truth)
-            y_target = np.zeros_like(x)
-            for mu, amp in peaks:
-                # Add Gaussian peaks
-                y_target += amp * np.exp(-0.5 * ((x - mu) / 50)**2)
-            
+            library = get_fabric_library()
+            x = library.x
+
+            # Generate Target Spectrum (Ground Truth) and every rendered frame up front:
+            # target + noise that decreases over time, one frame per 20 epochs
+            y_target = synthesize(SIGNATURES[target_material], x)
+            frame_epochs = np.unique(np.r_[np.arange(20, epochs + 1, 20), epochs])
+            noise_levels = 0.5 * (1 - frame_epochs / epochs)
+            noise = np.random.normal(0, 1, size=(len(frame_epochs), len(x))) * noise_levels[:, None]
+            frames = np.clip(y_target + noise, 0, 1.2)
+            matches = library.classify(frames)   # one batched similarity pass for all frames
+
             status_ph.markdown(f"**Initializing IR Spectral Analysis for {target_material}...**")
-            st.info(f"**Spectral Feature Target:** {descriptions.get(target_material, 'Standard Profile')}")
-            
-            for i in range(1, epochs + 1):
-                progress = i / epochs
-                progress_bar.progress(progress)
-                
-                # Update every few frames for speed
-                if i % 20 == 0 or i == epochs:
-                    # Current State = Target + Noise that decreases over time
-                    noise_level = 0.5 * (1 - progress) # Noise reduces as it trains
-                    noise = np.random.normal(0, noise_level, size=x.shape)
-                    y_current = y_target + noise
-                    y_current = np.clip(y_current, 0, 1.2) # Clip to valid range
-                    
-                    # Prepare Data for Altair
-                    df_spectrum = pd.DataFrame({
-                        'Wavenumber (cm⁻¹)': x,
-                        'Absorbance': y_current,
-                        'Type': 'Real-Time Scan'
-                    })
-                    
-                    df_target = pd.DataFrame({
-                        'Wavenumber (cm⁻¹)': x,
-                        'Absorbance': y_target,
-                        'Type': 'Reference Signature'
-                    })
-                    
-                    df_chart = pd.concat([df_spectrum, df_target])
-                    
-                    chart = alt.Chart(df_chart).mark_line().encode(
-                        x=alt.X('Wavenumber (cm⁻¹)', scale=alt.Scale(domain=[600, 4000])),
-                        y=alt.Y('Absorbance', scale=alt.Scale(domain=[0, 1.2])),
-                        color='Type',
-                        tooltip=['Wavenumber (cm⁻¹)', 'Absorbance']
-                    ).properties(
-                        title=f"Epoch {i}/{epochs}: Fine-Tuning IR Pattern Match ({target_material})",
-                        height=350
-                    )
-                    
-                    training_chart_ph.altair_chart(chart, use_container_width=True)
-                    time.sleep(0.01)
+            st.info(f"**Spectral Feature Target:** {DESCRIPTIONS.get(target_material, 'Standard Profile')}")
+
+            # One DataFrame for the whole session; only the scan column changes per frame
+            df_chart = pd.DataFrame({'Reference Signature': y_target, 'Real-Time Scan': frames[0]},
+                                    index=pd.Index(x, name='Wavenumber (cm⁻¹)'))
+            for epoch, frame, match in zip(frame_epochs, frames, matches):
+                progress_bar.progress(epoch / epochs)
+                df_chart['Real-Time Scan'] = frame
+                status_ph.markdown(f"**Epoch {epoch}/{epochs}: Fine-Tuning IR Pattern Match ({target_material})** | "
+                                   f"classified as {match.fabric} ({match.confidence:.1%})")
+                training_chart_ph.line_chart(df_chart, height=350)
+                time.sleep(0.01)
 
             st.session_state.model_trained = True
-            st.success(f"Training Complete! Model now captures **{target_material}** spectral signature with 99.8% accuracy.")
-
-
-    # --- Main Loop (Updates Tab 1 Placeholders) ---
-    last_rpc_time = 0
+            final = matches[-1]
+            st.success(f"Training Complete! Model now captures **{target_material}** spectral signature "
+                       f"(matched {final.fabric}, {final.confidence:.1%} confidence across {len(library)} references).")
+
+
+    # --- Render Loop (Updates Tab 1 Placeholders) ---
+    # Fetching and control run on the hub's per-device thread; this loop only
+    # draws its latest snapshot, at RENDER_FPS, and only what changed.
+    metrics = Widget(metrics_ph, draw_metrics)
+    insight = Widget(ai_ph, draw_insight)
+    temp_chart = LiveChart(chart_ph, 'temperature', '#00C9FF', 'Temperature (°C)', alt.Scale(zero=False),
+                           time_format, trend_seconds, min_interval=1.0 / CHART_FPS)
+    hum_chart = LiveChart(hum_chart_ph, 'humidity', '#4CAF50', 'Humidity (%)', alt.Scale(domain=[0, 100]),
+                          time_format, trend_seconds, min_interval=1.0 / CHART_FPS)
+    frame = 1.0 / RENDER_FPS
 
     while True:
-        # 1. Fetch Data
-        data, status_code, raw_resp = fetch_telemetry(token)
-        try:
-            temp_list = data.get('temperature', [{'value': 0}])
-            hum_list = data.get('humidity', [{'value': 0}])
-            fab_list = data.get('fabric_detected', [{'value': False}])
-
-            current_temp = float(temp_list[0]['value'])
-            current_hum = float(hum_list[0]['value'])
-
-            # Fabric bool parsing safely
-            fab_val = fab_list[0]['value']
-            raw_detected = False
-            if isinstance(fab_val, str):
-                raw_detected = fab_val.lower() == 'true'
-            else:
-                raw_detected = bool(fab_val)
-            
-            # Apply Inversion if checked
-            if invert_sensor:
-                fabric_detected = not raw_detected
-            else:
-                fabric_detected = raw_detected
-
-            # --- SIMULATION OVERRIDE ---
-            if st.session_state.get('manual_fabric_override', False):
-                fabric_detected = True
-                st.session_state.fabric_type = "Cotton"
-
-            # Sync Fabric Type
-            if not fabric_detected:
-                st.session_state.fabric_type = "Unknown"
-            
-            # Fetch Real Fabric Type (New Firmware Feature)
-            ft_list = data.get('fabric_type', [{'value': 'Unknown'}])
-            real_fabric_type = ft_list[0]['value']
-
-            # --- AUTO-SCAN LOGIC ---
-            if fabric_detected:
-                # Force Cotton for all detected fabrics as per user request
-                st.session_state.fabric_type = "Cotton"
-            
-            
-            st.session_state.last_fabric_detected = fabric_detected
-            
-            # Update Heartbeat
-            st.session_state.last_tp = time.time()
-            ts = pd.Timestamp.now()
-        except:
-            current_temp, current_hum, fabric_detected = 0, 0, False
-            ts = pd.Timestamp.now()
-
-        # 2. Logic & AI
-        ai_worker.update_telemetry(current_temp, current_hum, fabric_detected)
-        ai_result = ai_worker.get_decision()
-
-        # 3. Control Loop (Auto Mode)
-        if st.session_state.auto_mode:
-            target_relay = ai_result.get('relay', False)
-            if time.time() - last_rpc_time > 2.0:
-                send_rpc(token, "setRelay", target_relay)
-                
-                # BUG FIX: Only buzz if critically hot. Ignore "AI hallucinations".
-                ai_wants_buzzer = ai_result.get('buzzer', False)
-                if ai_wants_buzzer and current_temp > 170.0:
-                     send_rpc(token, "setBuzzer", True)
-                
-                last_rpc_time = time.time()
-
-        # 4. Update History
-        new_row = pd.DataFrame({'time': [ts], 'temperature': [current_temp], 'humidity': [current_hum]})
-        st.session_state.history = pd.concat([st.session_state.history, new_row]).tail(100)
-
-        # 5. Render Tab 1 (Dashboard)
-        with metrics_ph.container():
-            m1, m2, m3, m4 = st.columns(4)
-            m1.markdown(f"""<div class='metric-card'><div class='metric-label'>Temperature</div><div class='metric-value'>{current_temp:.1f}°C</div></div>""", unsafe_allow_html=True)
-            m2.markdown(f"""<div class='metric-card'><div class='metric-label'>Humidity</div><div class='metric-value'>{current_hum:.1f}%</div></div>""", unsafe_allow_html=True)
-            
-            fab_color = "#4CAF50" if fabric_detected else "#FF5252"
-            fab_text = "DETECTED" if fabric_detected else "NO FABRIC"
-            m3.markdown(f"""<div class='metric-card' style='border-color: {fab_color};'><div class='metric-label'>Cloth Detection</div><div class='metric-value' style='color:{fab_color};'>{fab_text}</div></div>""", unsafe_allow_html=True)
-            m4.markdown(f"""<div class='metric-card'><div class='metric-label'>Fabric Type</div><div class='metric-value' style='font-size: 1.8em;'>{st.session_state.fabric_type}</div></div>""", unsafe_allow_html=True)
-
-        with ai_ph.container():
-            st.subheader("AI Supervisor Insight")
-            c1, c2 = st.columns([2, 1])
-            with c1:
-                reason = ai_result.get('reason', 'Processing...')
-                if st.session_state.model_trained:
-                    reason = f"(Fine-Tuned) {reason}"
-                st.info(f"**Reasoning:** {reason}")
-            with c2:
-                action = "IRON OFF"
-                if ai_result.get('relay'):
-                    action = "IRON ON"
-                
-                if st.session_state.auto_mode:
-                     st.metric("Recommended Action (Active)", action)
-                else:
-                     st.metric("Recommended Action (Paused)", action, delta="Manual Override", delta_color="off")
-
-        with chart_ph.container():
-            st.markdown("### Temperature Trend")
-            if not st.session_state.history.empty:
-                chart = alt.Chart(st.session_state.history).mark_line(color='#00C9FF').encode(
-                    x=alt.X('time:T', axis=alt.Axis(format='%H:%M:%S', title='Time')),
-                    y=alt.Y('temperature:Q', scale=alt.Scale(zero=False), title='Temperature (°C)'),
-                    tooltip=['time', 'temperature', 'humidity']
-                ).properties(height=300)
-                st.altair_chart(chart, use_container_width=True)
-
-        with hum_chart_ph.container():
-            st.markdown("### Humidity Trend")
-            if not st.session_state.history.empty:
-                chart_h = alt.Chart(st.session_state.history).mark_line(color='#4CAF50').encode(
-                    x=alt.X('time:T', axis=alt.Axis(format='%H:%M:%S', title='Time')),
-                    y=alt.Y('humidity:Q', scale=alt.Scale(domain=[0, 100]), title='Humidity (%)'),
-                    tooltip=['time', 'temperature', 'humidity']
-                ).properties(height=300)
-                st.altair_chart(chart_h, use_container_width=True)
+        started = time.time()
+        view = hub.snapshot(DEVICE_ID, st.session_state.viewer_id)
+        st.session_state.last_tp = view["last_tp"]
+        st.session_state.last_fabric_detected = view["fabric_detected"]
+        st.session_state.fabric_type = view["fabric_type"]
+
+        confidence = view["fabric_confidence"]
+        metrics.update((f"{view['temp']:.1f}", f"{view['hum']:.1f}", view["fabric_detected"], view["fabric_type"],
+                        round(confidence * 100) if confidence else None, round(view["temp_rate"], 1)))
+        ai_result = view["ai_result"]
+        rpc_stats = view["rpc_stats"]
+        insight.update((ai_result.get('reason', 'Processing...'), ai_result.get('tier', 'llm'),
+                        rpc_stats['sent'], rpc_stats['suppressed'], bool(ai_result.get('relay')),
+                        controller.get_settings()["auto_mode"], st.session_state.model_trained,
+                        hub.viewer_count(DEVICE_ID)))
+        temp_chart.update(controller)
+        hum_chart.update(controller)
 
         # Loop Control
         if not auto_refresh:
             break
-        
-        time.sleep(1)
+        time.sleep(max(0.0, frame - (time.time() - started)))
 
 if __name__ == "__main__":
     main()
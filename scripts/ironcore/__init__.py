@@ -0,0 +1,30 @@
+"""Shared core of the agent, fleet runner and dashboard.
+
+Telemetry parsing, the deterministic decision rules, streaming signal
+statistics, RPC dispatch and ThingsBoard auth, with no
+streamlit/pandas/numpy/ollama at import time. Names are resolved on first
+access, so `import ironcore` itself costs nothing and
+`from ironcore import parse_telemetry` loads only telemetry.py.
+"""
+
+import importlib
+
+_EXPORTS = {
+    "TELEMETRY_KEYS": "telemetry", "telemetry_url": "telemetry", "telemetry_ts": "telemetry",
+    "rpc_url": "telemetry", "parse_telemetry": "telemetry",
+    "OVERHEAT_TEMP": "rules", "HEAT_BELOW_TEMP": "rules", "COOL_ABOVE_TEMP": "rules",
+    "rule_decision": "rules", "rule_decisions": "rules", "offline_decision": "rules",
+    "RpcDispatcher": "rpc", "SAFETY_COMMANDS": "rpc",
+    "SignalBank": "signals", "Signals": "signals", "get_signal_bank": "signals", "debounce_decision": "signals",
+    "poll_interval": "cadence",
+    "TokenManager": "auth", "get_token_manager": "auth", "jwt_expiry": "auth",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module 'ironcore' has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
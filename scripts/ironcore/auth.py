@@ -0,0 +1,166 @@
+import atexit
+import base64
+import json
+import threading
+import time
+
+import requests
+
+from config import TB_URL, USERNAME, PASSWORD, TOKEN_REFRESH_MARGIN, TOKEN_MAX_BACKOFF
+
+def jwt_expiry(token):
+    """`exp` claim (epoch seconds) of a JWT, or None if it can't be decoded."""
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return None
+
+class TokenManager:
+    """ThingsBoard JWT shared by every loop, worker and device in the process.
+
+    A background thread renews the token `refresh_margin` seconds before its
+    `exp` claim, using the refresh token (POST /api/auth/token) and falling
+    back to a full login, so callers never see an expired token in normal
+    operation. Renewals are serialised behind one lock: concurrent callers
+    that find an expired token, or report a 401 via invalidate(), wait for a
+    single login instead of each starting their own. Failed logins back off
+    exponentially up to `max_backoff` and are never cached.
+    """
+
+    def __init__(self, url=TB_URL, username=USERNAME, password=PASSWORD, refresh_margin=300.0,
+                 min_backoff=1.0, max_backoff=300.0, fallback_ttl=3600.0, timeout=5, clock=time.time):
+        self.url = url
+        self.username = username
+        self.password = password
+        self.refresh_margin = refresh_margin
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.fallback_ttl = fallback_ttl   # for tokens without a readable exp
+        self.timeout = timeout
+        self.clock = clock
+        self.session = requests.Session()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.token = None
+        self.refresh_token = None
+        self.expires_at = 0.0
+        self.refresh_at = 0.0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        self.thread = None
+        self.running = False
+        self.stats = {"logins": 0, "refreshes": 0, "failures": 0, "invalidations": 0}
+
+    # --- Callers ---
+    def get(self, block=True):
+        """Current token; renews first if it is missing or expired (unless block=False)."""
+        token = self.token
+        if token and self.clock() < self.expires_at:
+            return token
+        if not block:
+            return token
+        return self._renew(token)
+
+    __call__ = get   # usable directly as a token_provider
+
+    def invalidate(self, stale_token):
+        """Report a 401 for `stale_token`; renews unless someone already has."""
+        with self.lock:
+            self.stats["invalidations"] += 1
+            if self.token == stale_token:
+                self.expires_at = 0.0
+        return self._renew(stale_token)
+
+    # --- Renewal ---
+    def _renew(self, stale_token):
+        with self.lock:
+            if self.token != stale_token and self.clock() < self.expires_at:
+                return self.token   # another caller renewed while we waited
+            if self.clock() < self.retry_at:
+                return self.token   # backing off; keep serving what we have
+            self._fetch()
+            self.wakeup.set()
+            return self.token
+
+    def _fetch(self):
+        """One refresh-or-login attempt. Caller holds the lock."""
+        data = None
+        if self.refresh_token:
+            data = self._post("/api/auth/token", {"refreshToken": self.refresh_token})
+            if data:
+                self.stats["refreshes"] += 1
+        if data is None:
+            data = self._post("/api/auth/login", {"username": self.username, "password": self.password})
+            if data:
+                self.stats["logins"] += 1
+        if data is None:
+            self.stats["failures"] += 1
+            self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+            self.retry_at = self.clock() + self.backoff
+            print(f"Login failed, retrying in {self.backoff:.0f}s")
+            return False
+        now = self.clock()
+        self.token = data["token"]
+        self.refresh_token = data.get("refreshToken") or self.refresh_token
+        self.expires_at = jwt_expiry(self.token) or now + self.fallback_ttl
+        ttl = self.expires_at - now
+        self.refresh_at = now + max(ttl - self.refresh_margin, ttl / 2)   # short-lived tokens: halfway
+        self.backoff = 0.0
+        self.retry_at = 0.0
+        return True
+
+    def _post(self, path, body):
+        try:
+            resp = self.session.post(f"{self.url}{path}", json=body, timeout=self.timeout)
+            resp.raise_for_status()
+            return resp.json()
+        except Exception as e:
+            print(f"Auth request {path} failed: {e}")
+            return None
+
+    def _run(self):
+        while self.running:
+            with self.lock:
+                if self.clock() < self.retry_at:
+                    wait = self.retry_at - self.clock()
+                else:
+                    wait = self.refresh_at - self.clock()
+                    if wait <= 0:
+                        self._fetch()
+                        continue
+            self.wakeup.wait(timeout=max(wait, 0.05))
+            self.wakeup.clear()
+
+    def start(self):
+        """Log in now and keep the token renewed ahead of expiry in the background."""
+        if self.thread is None:
+            self.running = True
+            self.get()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["expires_in"] = max(0.0, self.expires_at - self.clock()) if self.token else None
+            stats["backoff"] = self.backoff
+        return stats
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_token_manager():
+    """Process-wide token manager shared by the agent loops, fleet mode and the dashboard."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = TokenManager(refresh_margin=TOKEN_REFRESH_MARGIN, max_backoff=TOKEN_MAX_BACKOFF).start()
+            atexit.register(_shared.stop)
+        return _shared
@@ -0,0 +1,30 @@
+from ironcore.rules import OVERHEAT_TEMP, HEAT_BELOW_TEMP, COOL_ABOVE_TEMP
+from config import POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_ACTIVE_INTERVAL, POLL_GUARD_BAND, POLL_LOOKAHEAD
+
+# --- Adaptive Poll Interval ---
+def poll_interval(signals, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL,
+                  active_interval=POLL_ACTIVE_INTERVAL):
+    """Seconds until a device should be polled (and decided for) again.
+
+    Driven by the device's ironcore.signals state:
+      - unknown, overheated, or within POLL_GUARD_BAND of OVERHEAT_TEMP:
+        `min_interval`
+      - heading for a threshold (the overheat lockout, or with fabric the
+        120/150C band edges): at least POLL_LOOKAHEAD samples before it is
+        reached at the current rate of change
+      - fabric on the board, or a hot iron without fabric: no slower than
+        `active_interval`
+      - cold, idle and not heating: `max_interval`
+    """
+    if signals is None or signals.overheat or signals.temp >= OVERHEAT_TEMP - POLL_GUARD_BAND:
+        return min_interval
+    temp, rate = signals.temp, signals.rate
+    interval = max_interval
+    if signals.fabric or temp > COOL_ABOVE_TEMP:
+        interval = active_interval
+    thresholds = (OVERHEAT_TEMP, HEAT_BELOW_TEMP, COOL_ABOVE_TEMP) if signals.fabric else (OVERHEAT_TEMP,)
+    for threshold in thresholds:
+        distance = threshold - temp
+        if distance * rate > 0:   # moving towards it
+            interval = min(interval, distance / rate / POLL_LOOKAHEAD)
+    return min(max(interval, min_interval), max_interval)
@@ -0,0 +1,119 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ironcore.telemetry import rpc_url
+from metrics import RPC_SECONDS, ERRORS
+
+# Commands that make the iron safer are never held back by the coalescing window
+SAFETY_COMMANDS = {("setRelay", False), ("setBuzzer", True)}
+
+class RpcDispatcher:
+    """Change-only ThingsBoard RPC dispatch.
+
+    Remembers the last acknowledged value of every (device, method) and only
+    sends a command when the value changes or `keepalive` seconds have passed.
+    Commands submitted for the same device/method before a flush collapse into
+    the latest one, and non-safety changes arriving within `coalesce_window`
+    of the previous send are held back so relay/buzzer flapping becomes a
+    single command. All requests share one pooled keep-alive session.
+    """
+
+    def __init__(self, token_provider, keepalive=30.0, coalesce_window=0.5, pool_size=20, timeout=2,
+                 decision_log=None, clock=time.time):
+        self.token_provider = token_provider
+        self.clock = clock
+        self.decision_log = decision_log
+        self.keepalive = keepalive
+        self.coalesce_window = coalesce_window
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.pending = {}     # device_id -> {method: (params, force)}
+        self.acked = {}       # (device_id, method) -> (params, acked_at)
+        self.last_sent = {}   # device_id -> time of last send
+        self.stats = {"submitted": 0, "sent": 0, "suppressed": 0, "coalesced": 0, "failed": 0}
+
+    def submit(self, device_id, method, params, force=False):
+        with self.lock:
+            self.stats["submitted"] += 1
+            queue = self.pending.setdefault(device_id, {})
+            if method in queue:
+                self.stats["coalesced"] += 1
+                force = force or queue[method][1]
+            queue[method] = (params, force)
+
+    def take(self, device_id, now=None):
+        """Pop the commands for `device_id` that actually need sending."""
+        now = self.clock() if now is None else now
+        with self.lock:
+            queue = self.pending.get(device_id)
+            if not queue:
+                return []
+            in_window = now - self.last_sent.get(device_id, 0) < self.coalesce_window
+            commands = []
+            for method, (params, force) in list(queue.items()):
+                acked = self.acked.get((device_id, method))
+                if not force and acked and acked[0] == params and now - acked[1] < self.keepalive:
+                    self.stats["suppressed"] += 1
+                    del queue[method]
+                    continue
+                if not force and in_window and (method, params) not in SAFETY_COMMANDS:
+                    continue  # stays pending; a newer submit may still replace it
+                commands.append((method, params))
+                del queue[method]
+            if commands:
+                self.last_sent[device_id] = now
+            return commands
+
+    def ack(self, device_id, method, params, ok):
+        with self.lock:
+            if ok:
+                self.acked[(device_id, method)] = (params, self.clock())
+                self.stats["sent"] += 1
+            else:
+                self.stats["failed"] += 1
+        if self.decision_log:
+            self.decision_log.log_rpc(device_id, method, params, ok)
+
+    def invalidate(self, device_id):
+        """Forget acknowledged state, e.g. after the device reconnects or reboots."""
+        with self.lock:
+            for key in [k for k in self.acked if k[0] == device_id]:
+                del self.acked[key]
+
+    def post(self, device_id, method, params):
+        headers = {"X-Authorization": f"Bearer {self.token_provider()}"}
+        try:
+            with RPC_SECONDS.time(method=method):
+                resp = self.session.post(rpc_url(device_id), headers=headers,
+                                         json={"method": method, "params": params}, timeout=self.timeout)
+            if resp.status_code != 200:
+                ERRORS.inc(stage="rpc")
+                print(f"RPC {method} Failed: {resp.status_code} - {resp.text}")
+            return resp.status_code == 200
+        except Exception as e:
+            ERRORS.inc(stage="rpc")
+            print(f"RPC Error: {e}")
+            return False
+
+    def flush(self, device_id):
+        results = []
+        for method, params in self.take(device_id):
+            ok = self.post(device_id, method, params)
+            self.ack(device_id, method, params, ok)
+            results.append((method, params, ok))
+        return results
+
+    def send(self, device_id, method, params, force=False):
+        self.submit(device_id, method, params, force=force)
+        return self.flush(device_id)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
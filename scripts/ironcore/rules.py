@@ -0,0 +1,57 @@
+# Deterministic decision rules shared by the agent, fleet, dashboard and
+# simulator. Pure Python with no third-party imports at module load.
+
+# --- Rule Thresholds (mirror firmware/src/config.h + TEACHER_PROMPT) ---
+OVERHEAT_TEMP = 170.0   # OFFLINE_TEMP_THRESHOLD on the ESP32
+HEAT_BELOW_TEMP = 120.0
+COOL_ABOVE_TEMP = 150.0
+
+# --- Rules Tier ---
+def rule_decision(temp, humidity, fabric_detected):
+    """Settle the clear-cut cases of TEACHER_PROMPT without the LLM.
+
+    Mirrors the firmware OfflineDecisionEngine. Returns None when the sample
+    sits in the 120-150C hysteresis band and needs the LLM.
+    """
+    if temp > OVERHEAT_TEMP:
+        return {"relay": False, "buzzer": True, "reason": f"Overheat protection: {temp:.1f}C is above {OVERHEAT_TEMP:.0f}C."}
+    if not fabric_detected:
+        return {"relay": False, "buzzer": False, "reason": "Safety first: no fabric detected, heater stays off."}
+    if temp < HEAT_BELOW_TEMP:
+        return {"relay": True, "buzzer": False, "reason": f"Heating up: {temp:.1f}C is below {HEAT_BELOW_TEMP:.0f}C."}
+    if temp > COOL_ABOVE_TEMP:
+        return {"relay": False, "buzzer": False, "reason": f"Cooling down: {temp:.1f}C is above {COOL_ABOVE_TEMP:.0f}C."}
+    return None
+
+def rule_decisions(temps, humidities, fabrics):
+    """Vectorized rule_decision over arrays of samples.
+
+    Returns (relay, buzzer, resolved) boolean arrays; rows where resolved is
+    False fall in the hysteresis band and must be escalated to the LLM.
+    """
+    import numpy as np
+
+    temps = np.asarray(temps, dtype=float)
+    fabrics = np.asarray(fabrics, dtype=bool)
+
+    overheat = temps > OVERHEAT_TEMP
+    heat = fabrics & ~overheat & (temps < HEAT_BELOW_TEMP)
+    cool = fabrics & ~overheat & (temps > COOL_ABOVE_TEMP)
+    resolved = overheat | ~fabrics | heat | cool
+    return heat, overheat, resolved
+
+# --- Offline Fallback ---
+def offline_decision(temp, humidity, fabric_detected):
+    """Port of the firmware OfflineDecisionEngine (firmware/src/offline_ai.cpp).
+
+    What the iron itself does without a network: heat with fabric present up
+    to OFFLINE_TEMP_THRESHOLD, alarm above it. Used when a decision has to be
+    made before the tiers above can answer. Always returns a decision.
+    """
+    if not fabric_detected:
+        if temp > OVERHEAT_TEMP:
+            return {"relay": False, "buzzer": True, "reason": "Cooldown req!", "tier": "offline"}
+        return {"relay": False, "buzzer": False, "reason": "No Fabric", "tier": "offline"}
+    if temp < OVERHEAT_TEMP:
+        return {"relay": True, "buzzer": False, "reason": "Heating (Safe)", "tier": "offline"}
+    return {"relay": False, "buzzer": True, "reason": "Overheat Alert!", "tier": "offline"}
@@ -0,0 +1,160 @@
+import math
+import threading
+import time
+from array import array
+from collections import namedtuple
+
+from ironcore.rules import OVERHEAT_TEMP
+from config import SIGNAL_TAU, RATE_TAU, FABRIC_VOTES, OVERHEAT_VOTES
+
+# Streaming per-device signal statistics. Every sample updates a handful of
+# running values in O(1); nothing keeps or rescans a history window.
+
+Signals = namedtuple("Signals", "temp mean std rate eta_overheat fabric overheat samples")
+
+def debounce_decision(decision, signals):
+    """Only let a decision sound the buzzer once the overheat is confirmed.
+
+    The relay is left alone: switching the heater off on a single hot
+    reading is the safe direction, a buzzer on one is a false alarm.
+    Without signals (no parsable sample) nothing is confirmed.
+    """
+    if not decision.get('buzzer') or (signals is not None and signals.overheat):
+        return decision
+    return {**decision, 'buzzer': False}
+
+class SignalBank:
+    """Running statistics for many devices in flat arrays, one slot per device.
+
+    Per sample (time-aware, so irregular polling is handled):
+      mean / std   exponentially weighted over `tau` seconds
+      rate         smoothed rate of rise in C/s over `rate_tau` seconds
+      eta_overheat seconds until OVERHEAT_TEMP at the current rate (inf if not rising)
+      fabric       set by a majority of the last `fabric_votes` fabric readings,
+                   cleared by any single reading without fabric (heater off
+                   is the safe direction and is never delayed)
+      overheat     set when `overheat_votes` of the last 3 readings are above
+                   OVERHEAT_TEMP, cleared once none of them are
+
+    State lives in `array` columns (about 70 bytes per device) rather than
+    per-device objects; columns() hands them to numpy for fleet-wide views.
+    A sample with the same timestamp as the previous one is a repeat of it
+    and only returns the current state; an older one restarts the device's
+    statistics.
+    """
+
+    def __init__(self, tau=SIGNAL_TAU, rate_tau=RATE_TAU, fabric_votes=FABRIC_VOTES, overheat_votes=OVERHEAT_VOTES):
+        if not 1 <= fabric_votes <= 31:
+            raise ValueError(f"fabric_votes must be between 1 and 31, got {fabric_votes}")
+        self.tau = tau
+        self.rate_tau = rate_tau
+        self.fabric_mask = (1 << fabric_votes) - 1
+        self.fabric_on = fabric_votes // 2 + 1
+        self.overheat_votes = min(max(overheat_votes, 1), 3)
+        self.slots = {}                 # device_id -> index into the columns
+        self.lock = threading.Lock()
+        self.ts = array('d')
+        self.last = array('d')
+        self.mean = array('d')
+        self.var = array('d')
+        self.rate = array('d')
+        self.fabric_bits = array('L')   # newest reading in bit 0
+        self.overheat_bits = array('L')
+        self.flags = array('B')         # bit 0 fabric, bit 1 overheat
+        self.count = array('L')
+
+    def _slot(self, device_id):
+        slot = self.slots.get(device_id)
+        if slot is None:
+            slot = self.slots[device_id] = len(self.count)
+            for column in (self.ts, self.last, self.mean, self.var, self.rate):
+                column.append(0.0)
+            for column in (self.fabric_bits, self.overheat_bits, self.flags, self.count):
+                column.append(0)
+        return slot
+
+    def update(self, device_id, temp, fabric, ts=None):
+        """Fold one sample (ts in epoch seconds, default now) in and return the device's Signals."""
+        ts = time.time() if ts is None else ts
+        fabric = bool(fabric)
+        hot = temp > OVERHEAT_TEMP
+        with self.lock:
+            i = self._slot(device_id)
+            if self.count[i] and ts == self.ts[i]:
+                return self._signals(i)
+            if self.count[i] == 0 or ts < self.ts[i]:
+                # First sample (or the clock went back, e.g. the device rebooted)
+                # seeds every estimate and fills both vote windows
+                self.mean[i] = temp
+                self.var[i] = self.rate[i] = 0.0
+                self.fabric_bits[i] = self.fabric_mask if fabric else 0
+                self.overheat_bits[i] = 0b111 if hot else 0
+                self.flags[i] = fabric | (hot << 1)
+            else:
+                dt = ts - self.ts[i]
+                alpha = 1.0 - math.exp(-dt / self.tau)
+                delta = temp - self.mean[i]
+                self.mean[i] += alpha * delta
+                self.var[i] = (1.0 - alpha) * (self.var[i] + alpha * delta * delta)
+                beta = 1.0 - math.exp(-dt / self.rate_tau)
+                self.rate[i] += beta * ((temp - self.last[i]) / dt - self.rate[i])
+
+                bits = self.fabric_bits[i] = ((self.fabric_bits[i] << 1) | fabric) & self.fabric_mask
+                hot_bits = self.overheat_bits[i] = ((self.overheat_bits[i] << 1) | hot) & 0b111
+                if not fabric:
+                    flags = self.flags[i] & ~1
+                elif bits.bit_count() >= self.fabric_on:
+                    flags = self.flags[i] | 1
+                else:
+                    flags = self.flags[i]
+                if hot_bits.bit_count() >= self.overheat_votes:
+                    flags |= 2
+                elif not hot_bits:
+                    flags &= ~2
+                self.flags[i] = flags
+            self.ts[i] = ts
+            self.last[i] = temp
+            self.count[i] += 1
+            return self._signals(i)
+
+    def _signals(self, i):
+        temp, rate = self.last[i], self.rate[i]
+        if temp > OVERHEAT_TEMP:
+            eta = 0.0
+        elif rate > 1e-3:
+            eta = (OVERHEAT_TEMP - temp) / rate
+        else:
+            eta = math.inf
+        flags = self.flags[i]
+        return Signals(temp, self.mean[i], math.sqrt(self.var[i]), rate, eta,
+                       bool(flags & 1), bool(flags & 2), self.count[i])
+
+    def get(self, device_id):
+        """Latest Signals for a device without adding a sample, or None if never seen."""
+        with self.lock:
+            i = self.slots.get(device_id)
+            return self._signals(i) if i is not None and self.count[i] else None
+
+    def columns(self):
+        """numpy copies of the float state columns, indexed by slot (see `slots`)."""
+        import numpy as np
+
+        with self.lock:
+            # Copied: a live buffer view would stop the arrays from growing
+            return {name: np.frombuffer(getattr(self, name), dtype=np.float64).copy()
+                    for name in ("ts", "last", "mean", "var", "rate")}
+
+    def get_stats(self):
+        with self.lock:
+            return {"devices": len(self.slots), "samples": sum(self.count)}
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def get_signal_bank():
+    """Process-wide bank shared by the agent loop, fleet mode and the dashboard."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = SignalBank()
+        return _shared
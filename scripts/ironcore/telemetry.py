@@ -0,0 +1,39 @@
+from config import TB_URL
+
+# --- Telemetry / RPC Helpers ---
+TELEMETRY_KEYS = "temperature,humidity,fabric_detected"
+
+def telemetry_url(device_id):
+    # API: /api/plugins/telemetry/{entityType}/{entityId}/values/timeseries
+    return f"{TB_URL}/api/plugins/telemetry/DEVICE/{device_id}/values/timeseries?keys={TELEMETRY_KEYS}&useStrictDataTypes=true"
+
+def telemetry_ts(data):
+    """Newest sample timestamp (epoch ms) in a timeseries response, 0 if absent."""
+    return max((series[0].get('ts', 0) for series in data.values() if series), default=0)
+
+def rpc_url(device_id):
+    return f"{TB_URL}/api/plugins/rpc/oneway/{device_id}"
+
+def parse_telemetry(data):
+    def get_val(key, default=0):
+        series = data.get(key, [])
+        if not series:
+            return default
+        val = series[0].get('value')
+        if val is None:
+            return default
+        return float(val)
+
+    def get_bool(key, default=False):
+        series = data.get(key, [])
+        if not series:
+            return default
+        val = series[0].get('value')
+        if val is None:
+            return default
+        return str(val).lower() == 'true'
+
+    temp = get_val('temperature', 0)
+    hum = get_val('humidity', 0)
+    fabric = get_bool('fabric_detected', False)
+    return temp, hum, fabric
@@ -0,0 +1,276 @@
+import bisect
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as Tally
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_PORT, PROFILE_HZ
+
+# In-process instrumentation for the control loops: Prometheus-style counters
+# and histograms, a /metrics endpoint, and an optional sampling profiler.
+# Everything here is lock-protected and cheap enough for the hot path
+# (one bisect and two adds per observation).
+
+PREFIX = "smartiron_"
+
+# Seconds; covers sub-millisecond cache/rules work up to multi-second LLM calls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _label_text(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}   # label key -> count
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_text(key)} {value}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket latency histogram (seconds), optionally split by labels."""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.series = {}   # label key -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, seconds, **labels):
+        key = _label_key(labels)
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            counts = self.series.get(key)
+            if counts is None:
+                counts = self.series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[i] += 1
+            counts[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def summary(self, **labels):
+        """count / mean / p50 / p95 / p99 (bucket upper bounds) for one label set."""
+        with self.lock:
+            counts = list(self.series.get(_label_key(labels), []))
+        if not counts or not sum(counts[:-1]):
+            return {"count": 0}
+        total = sum(counts[:-1])
+        bounds = self.buckets + (float("inf"),)
+
+        def quantile(q):
+            running = 0
+            for bound, count in zip(bounds, counts):
+                running += count
+                if running >= q * total:
+                    return bound
+            return bounds[-1]
+
+        return {"count": total, "mean": counts[-1] / total,
+                "p50": quantile(0.5), "p95": quantile(0.95), "p99": quantile(0.99)}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = {key: list(counts) for key, counts in self.series.items()}
+        for key, counts in sorted(series.items()):
+            running = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                running += count
+                lines.append(f"{self.name}_bucket{_label_text(key, [('le', bound)])} {running}")
+            lines.append(f"{self.name}_sum{_label_text(key)} {counts[-1]:.6f}")
+            lines.append(f"{self.name}_count{_label_text(key)} {running}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+
+    def _get(self, cls, name, help, **kwargs):
+        name = PREFIX + name
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help="", buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+# --- Hot-path metrics ---
+FETCH_SECONDS = REGISTRY.histogram("telemetry_fetch_seconds", "ThingsBoard telemetry request latency")
+LLM_SECONDS = REGISTRY.histogram("llm_inference_seconds", "ollama chat call latency (full generation)")
+PARSE_SECONDS = REGISTRY.histogram("llm_parse_seconds", "Time spent extracting the decision JSON")
+RPC_SECONDS = REGISTRY.histogram("rpc_seconds", "ThingsBoard one-way RPC latency")
+TICK_SECONDS = REGISTRY.histogram("tick_seconds", "Fetch + decide + actuate duration of one loop tick")
+JITTER_SECONDS = REGISTRY.histogram("loop_jitter_seconds", "How late a tick started relative to its cadence")
+ERRORS = REGISTRY.counter("errors_total", "Errors by stage")
+TOKEN_REFRESHES = REGISTRY.counter("token_refreshes_total", "Token renewals triggered by a 401")
+FALLBACKS = REGISTRY.counter("fallback_decisions_total", "Safe-off decisions produced by a failed inference")
+DECISIONS = REGISTRY.counter("decisions_total", "Decisions by tier")
+
+class LoopTimer:
+    """Tick duration and start-time jitter for a loop with a nominal `interval`.
+
+    `interval` may be changed between ticks (adaptive loops); the next
+    tick is due `interval` after the previous one started.
+    """
+
+    def __init__(self, loop, interval):
+        self.loop = loop
+        self.interval = interval
+        self.last_start = None
+
+    @contextmanager
+    def tick(self):
+        started = time.perf_counter()
+        if self.last_start is not None:
+            JITTER_SECONDS.observe(max(0.0, started - self.last_start - self.interval), loop=self.loop)
+        try:
+            yield
+        finally:
+            TICK_SECONDS.observe(time.perf_counter() - started, loop=self.loop)
+            self.last_start = started
+
+# --- Sampling Profiler ---
+class SamplingProfiler:
+    """Samples every thread's stack `hz` times a second; no tracing overhead.
+
+    Stacks are kept in collapsed form ("outer;inner;leaf count"), which is
+    what flamegraph tools read. Sampling only looks at `sys._current_frames()`,
+    so the control loops themselves run unmodified.
+    """
+
+    def __init__(self, hz=PROFILE_HZ or 100, max_depth=40):
+        self.interval = 1.0 / hz
+        self.max_depth = max_depth
+        self.stacks = Tally()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, daemon=True, name="sampling-profiler")
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        own = threading.get_ident()
+        while self.running:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = traceback.extract_stack(frame, limit=self.max_depth)
+                key = ";".join(f"{f.name} ({f.filename.rsplit('/', 1)[-1]}:{f.lineno})" for f in stack)
+                with self.lock:
+                    self.stacks[key] += 1
+                    self.samples += 1
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        with self.lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def top(self, n=20):
+        """Leaf frames with the most samples, as (frame, share of samples)."""
+        leaves = Tally()
+        with self.lock:
+            for stack, count in self.stacks.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            total = self.samples or 1
+        return [(frame, count / total) for frame, count in leaves.most_common(n)]
+
+# --- HTTP Endpoint ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            body = REGISTRY.render()
+        elif path == "/profile" and self.server.profiler is not None:
+            body = self.server.profiler.collapsed()
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+_server = None
+_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT, profile_hz=PROFILE_HZ):
+    """Serve /metrics (and /profile when profiling) on localhost; once per process.
+
+    Does nothing when `port` is 0. Returns the server, or None.
+    """
+    global _server
+    with _server_lock:
+        if _server is not None or not port:
+            return _server
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint disabled: {e}")
+            return None
+        server.daemon_threads = True
+        server.profiler = SamplingProfiler(hz=profile_hz).start() if profile_hz else None
+        threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+        print(f"Metrics on http://127.0.0.1:{server.server_address[1]}/metrics")
+        _server = server
+        return server
@@ -0,0 +1,171 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from ai_engine import get_ai_decision
+from ironcore.rules import rule_decision, offline_decision
+from metrics import DECISIONS, JITTER_SECONDS
+from config import CONTROL_INTERVAL, DECISION_DEADLINE, LATE_POLICY, MAX_INFLIGHT
+
+LATE_POLICIES = ("discard", "apply")
+
+def fallback_decision(temp, humidity, fabric_detected, fallback=offline_decision):
+    """Decision for a sample the tiers did not answer in time: the rules, else `fallback`."""
+    # The rules still apply without the tiers above them: offline_decision
+    # heats all the way to 170C and must only settle the hysteresis band
+    decision = rule_decision(temp, humidity, fabric_detected)
+    if decision is None:
+        decision = fallback(temp, humidity, fabric_detected)
+    else:
+        decision["tier"] = "rules"
+    DECISIONS.inc(tier=decision.get("tier", "offline"))
+    return decision
+
+class DeadlineScheduler:
+    """Fixed-cadence control loop with a hard per-decision deadline.
+
+    run() starts ticks on an absolute schedule (start + k * interval), so a
+    slow tick delays only itself instead of shifting every later one; ticks
+    that are already missed are skipped, never bunched up.
+
+    decide() runs the normal tier chain on a worker thread and waits at most
+    `deadline` seconds. If it has not answered by then, the rules tier
+    decides instead and, in the hysteresis band it leaves open, the
+    firmware's offline rules, so the relay state is always refreshed within
+    the deadline. The late answer is still cached by the tiers (so the
+    next tick usually hits the cache) and then, per `late_policy`:
+
+      discard  never actuate on it (default).
+      apply    actuate on it through `on_actuation`, but only if no newer
+               decision has been made for that device in the meantime.
+
+    Streamed early actuations are held to the same rule: they only pass
+    through while the tick is still within its deadline. If `max_inflight`
+    inferences are already running, new ticks go straight to the fallback
+    instead of queueing behind them.
+
+    The deadline never exceeds the current interval, including when
+    adaptive polling changes it between ticks. Decisions run on `pool`
+    (a ThreadPoolExecutor unless given; simulate.py passes a virtual-time
+    one).
+    """
+
+    def __init__(self, decide=get_ai_decision, fallback=offline_decision, interval=CONTROL_INTERVAL,
+                 deadline=DECISION_DEADLINE, late_policy=LATE_POLICY, max_inflight=MAX_INFLIGHT, name="agent",
+                 pool=None):
+        if late_policy not in LATE_POLICIES:
+            raise ValueError(f"late_policy must be one of {LATE_POLICIES}, got {late_policy!r}")
+        self.decide_fn = decide
+        self.fallback = fallback
+        self.max_deadline = deadline
+        self.set_interval(interval)
+        self.late_policy = late_policy
+        self.name = name
+        self.pool = pool or ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="decide")
+        self.slots = threading.Semaphore(max_inflight)
+        self.lock = threading.Lock()
+        self.seq = {}   # device_id -> number of the newest decision made
+        self.stats = {"on_time": 0, "missed": 0, "busy": 0, "late_applied": 0, "late_discarded": 0,
+                      "early_blocked": 0, "skipped_ticks": 0}
+
+    # --- Decisions ---
+    def decide(self, temp, humidity, fabric_detected, on_actuation=None, device_id=None):
+        """Decision within `deadline` seconds, from the tiers if they make it, else the fallback."""
+        with self.lock:
+            seq = self.seq[device_id] = self.seq.get(device_id, 0) + 1
+        expired = threading.Event()
+
+        def gated_actuation(fields):
+            if expired.is_set():
+                self._count("early_blocked")
+            elif on_actuation:
+                on_actuation(fields)
+
+        if not self.slots.acquire(blocking=False):
+            self._count("busy")
+            return self._fall_back(temp, humidity, fabric_detected)
+        future = self.pool.submit(self.decide_fn, temp, humidity, fabric_detected, gated_actuation)
+        future.add_done_callback(lambda f: self.slots.release())
+        try:
+            decision = future.result(timeout=self.deadline)
+            self._count("on_time")
+            return decision
+        except FutureTimeout:
+            expired.set()
+            self._count("missed")
+            future.add_done_callback(
+                lambda f: self._on_late(f, device_id, seq, on_actuation))
+            return self._fall_back(temp, humidity, fabric_detected)
+
+    def _fall_back(self, temp, humidity, fabric_detected):
+        return fallback_decision(temp, humidity, fabric_detected, self.fallback)
+
+    def _on_late(self, future, device_id, seq, on_actuation):
+        if future.exception() is not None:
+            return
+        decision = future.result()
+        with self.lock:
+            current = self.seq.get(device_id) == seq
+        if self.late_policy == "apply" and current and on_actuation and not decision.get("fallback"):
+            self._count("late_applied")
+            on_actuation(decision)
+        else:
+            self._count("late_discarded")
+
+    # --- Cadence ---
+    def set_interval(self, interval):
+        """Change the gap between ticks; the decision deadline shrinks with it."""
+        self.interval = interval
+        self.deadline = min(self.max_deadline, interval)
+
+    def run(self, tick, should_continue=lambda: True, next_interval=None):
+        """Call `tick()` every `interval` seconds on an absolute, drift-free schedule.
+
+        With `next_interval`, the gap after each tick is `next_interval()`
+        instead (adaptive polling, see ironcore.cadence).
+        """
+        due = time.monotonic()
+        while should_continue():
+            now = time.monotonic()
+            if now < due:
+                time.sleep(due - now)
+                now = time.monotonic()
+            JITTER_SECONDS.observe(now - due, loop=self.name)
+            tick()
+            if next_interval:
+                self.set_interval(next_interval())
+            interval = self.interval
+            due += interval
+            now = time.monotonic()
+            if now > due:
+                # Overran one or more slots: resume on the next boundary instead of bursting
+                missed = int((now - due) // interval) + 1
+                self._count("skipped_ticks", missed)
+                due += missed * interval
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def stop(self):
+        self.pool.shutdown(wait=False)
+
+if __name__ == "__main__":
+    # Check: neither a busy scheduler nor a missed deadline heats an iron past the rules
+    def slow_decide(temp, humidity, fabric_detected, on_actuation=None):
+        time.sleep(0.2)
+        return {"relay": True, "buzzer": False, "reason": "late"}
+
+    scheduler = DeadlineScheduler(decide=slow_decide, interval=1.0, deadline=0.05, max_inflight=1)
+    missed = scheduler.decide(160, 50, True, device_id="check")
+    busy = scheduler.decide(160, 50, True, device_id="check")
+    band = scheduler.decide(135, 50, True, device_id="check")
+    for decision in (missed, busy):
+        assert not decision["relay"] and decision["tier"] == "rules", decision
+    assert band["tier"] == "offline", band
+    print(scheduler.get_stats())
+    scheduler.stop()
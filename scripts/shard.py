@@ -0,0 +1,337 @@
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import time
+
+from config import SHARD_WORKERS, LEASE_DB, LEASE_TTL, NODE_ID
+
+# Sharded fleet supervision. Every worker process (on this node or any other
+# node sharing the lease store) runs a FleetSupervisor for the devices that
+# a consistent-hash ring over the live workers assigns to it, and only
+# actuates an iron while it holds that iron's lease:
+#
+#   - workers heartbeat into the store; the ring is built from the workers
+#     whose heartbeat is younger than the lease TTL
+#   - a worker claims (or renews) leases for its ring share every TTL/3 and
+#     releases the ones the ring has moved elsewhere, after it has stopped
+#     actuating them
+#   - a lease can only be taken over once it has expired, so a device has at
+#     most one owner; a worker that cannot renew stops actuating when its own
+#     copy of the expiry passes, before anyone else can take over
+#   - when a worker dies its heartbeat and leases lapse, the ring shrinks and
+#     the survivors pick its devices up within about one TTL. In between the
+#     irons run on their own firmware offline rules.
+#
+# LeaseStore is SQLite so the whole thing runs locally (one file shared by
+# the worker processes). It uses rollback journaling, which unlike WAL needs
+# no shared memory, so nodes can share it over a network filesystem, but the
+# one-owner guarantee is then only as good as that filesystem's byte-range
+# locks (broken or disabled on many NFS/SMB setups). Across hosts a
+# coordination service (etcd, Consul, ZooKeeper) slots in behind the same
+# methods in production.
+
+class HashRing:
+    """Consistent hashing of device IDs onto worker IDs, with virtual nodes."""
+
+    def __init__(self, workers, vnodes=64):
+        self.workers = sorted(set(workers))
+        self.points = sorted((self._hash(f"{worker}#{v}"), worker) for worker in self.workers for v in range(vnodes))
+        self.keys = [point for point, _ in self.points]
+
+    @staticmethod
+    def _hash(key):
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def owner(self, device_id):
+        if not self.points:
+            return None
+        i = bisect.bisect(self.keys, self._hash(device_id)) % len(self.points)
+        return self.points[i][1]
+
+class LeaseStore:
+    """Worker heartbeats and per-device leases in one SQLite file.
+
+    Every mutation runs in a BEGIN IMMEDIATE transaction, so concurrent
+    workers serialize on the write lock and a lease is never granted twice.
+    `epoch` bumps on every change of owner, so a worker can tell that a
+    device it holds again was owned by someone else in between. It is not
+    a fencing token: ThingsBoard does not check it, and an RPC already on
+    the wire when a lease moves can still land after the new owner's.
+    """
+
+    def __init__(self, path=LEASE_DB, clock=time.time):
+        self.path = path
+        self.clock = clock
+        # Workers call in from asyncio.to_thread, one call at a time
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        # Not WAL: its shared-memory index only works for processes on one host
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS workers (
+                worker_id TEXT PRIMARY KEY, node TEXT NOT NULL, pid INTEGER, heartbeat_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS leases (
+                device_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL,
+                epoch INTEGER NOT NULL DEFAULT 1);
+            CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner);
+        """)
+
+    def close(self):
+        self.db.close()
+
+    def _transaction(self, fn):
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(self.clock())
+            self.db.execute("COMMIT")
+            return result
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def heartbeat(self, worker_id, node, ttl):
+        """Record that `worker_id` is alive; returns the IDs of all live workers."""
+        def fn(now):
+            self.db.execute("INSERT INTO workers VALUES (?, ?, ?, ?) ON CONFLICT (worker_id) DO UPDATE SET "
+                            "node = excluded.node, pid = excluded.pid, heartbeat_at = excluded.heartbeat_at",
+                            (worker_id, node, os.getpid(), now))
+            return [row[0] for row in self.db.execute(
+                "SELECT worker_id FROM workers WHERE heartbeat_at > ? ORDER BY worker_id", (now - ttl,))]
+        return self._transaction(fn)
+
+    def claim(self, worker_id, device_ids, ttl):
+        """Renew or take (if free / expired) the leases on `device_ids`.
+
+        Returns {device_id: (expires_at, epoch)} for every lease `worker_id`
+        now holds, including ones it holds but did not ask for.
+        """
+        def fn(now):
+            self.db.executemany(
+                "INSERT INTO leases (device_id, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (device_id) DO UPDATE SET "
+                "epoch = epoch + (owner != excluded.owner), owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                [(device_id, worker_id, now + ttl, now) for device_id in device_ids])
+            return {device_id: (expires_at, epoch) for device_id, expires_at, epoch in self.db.execute(
+                "SELECT device_id, expires_at, epoch FROM leases WHERE owner = ? AND expires_at > ?",
+                (worker_id, now))}
+        return self._transaction(fn)
+
+    def release(self, worker_id, device_ids):
+        """Give up leases now so the next owner does not have to wait for them to expire."""
+        self._transaction(lambda now: self.db.executemany(
+            "UPDATE leases SET expires_at = 0 WHERE owner = ? AND device_id = ?",
+            [(worker_id, device_id) for device_id in device_ids]))
+
+    def leave(self, worker_id):
+        """Release everything and drop out of the ring (clean shutdown)."""
+        def fn(now):
+            self.db.execute("UPDATE leases SET expires_at = 0 WHERE owner = ?", (worker_id,))
+            self.db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+        self._transaction(fn)
+
+    def status(self, ttl=LEASE_TTL):
+        """{worker_id: {"node", "alive", "leases"}} plus unowned/expired leases under None."""
+        now = self.clock()
+        status = {worker_id: {"node": node, "pid": pid, "alive": heartbeat_at > now - ttl, "leases": 0}
+                  for worker_id, node, pid, heartbeat_at in self.db.execute("SELECT * FROM workers")}
+        status[None] = {"leases": 0}
+        for owner, live, n in self.db.execute(
+                "SELECT owner, expires_at > ?, COUNT(*) FROM leases GROUP BY owner, expires_at > ?", (now, now)):
+            key = owner if live and owner in status else None
+            status[key]["leases"] += n
+        return status
+
+class ShardWorker:
+    """One process' share of the fleet: a FleetSupervisor whose device set follows the ring.
+
+    Leases are renewed every ttl/3. The guard handed to the supervisor
+    allows an actuation only while this worker's own view of the lease has
+    at least `margin` seconds left, so a stalled or partitioned worker goes
+    quiet before its lease can be given to someone else. Devices the ring
+    moves away are dropped from the guard and the fleet before their
+    leases are released.
+    """
+
+    def __init__(self, worker_id, device_ids, lease_db=LEASE_DB, ttl=LEASE_TTL, node=NODE_ID, **fleet_kwargs):
+        self.worker_id = worker_id
+        self.device_ids = list(dict.fromkeys(device_ids))
+        self.lease_db = lease_db
+        self.ttl = ttl
+        self.margin = ttl / 3
+        self.node = node or socket.gethostname()
+        self.fleet_kwargs = fleet_kwargs
+        self.leases = {}       # device_id -> (expires_at, epoch)
+        self.ring = None
+        self.stats = {"claims": 0, "acquired": 0, "released": 0, "rebalances": 0, "store_errors": 0}
+
+    def holds(self, device_id):
+        lease = self.leases.get(device_id)
+        return lease is not None and lease[0] - time.time() > self.margin
+
+    def _drop(self, fleet, device_ids):
+        for device_id in device_ids:
+            self.leases.pop(device_id, None)
+        fleet.remove_devices(device_ids)
+
+    async def _sync(self, store, fleet):
+        """One heartbeat + release/claim round (the store is blocking, so it runs on threads)."""
+        workers = await asyncio.to_thread(store.heartbeat, self.worker_id, self.node, self.ttl)
+        if self.ring is None or self.ring.workers != workers:
+            self.ring = HashRing(workers)
+            self.stats["rebalances"] += 1
+        wanted = [device_id for device_id in self.device_ids if self.ring.owner(device_id) == self.worker_id]
+        unwanted = [device_id for device_id in self.leases if self.ring.owner(device_id) != self.worker_id]
+        if unwanted:
+            # Stop actuating first: once released, the new owner may start right away
+            self._drop(fleet, unwanted)
+            await asyncio.to_thread(store.release, self.worker_id, unwanted)
+            self.stats["released"] += len(unwanted)
+        self.stats["claims"] += 1
+        leases = await asyncio.to_thread(store.claim, self.worker_id, wanted, self.ttl)
+
+        # A new epoch means someone else owned the device in between: start it afresh
+        lost = [device_id for device_id, (_, epoch) in self.leases.items()
+                if device_id not in leases or leases[device_id][1] != epoch]
+        self._drop(fleet, lost)
+        gained = [device_id for device_id in leases if device_id not in self.leases]
+        self.leases.update(leases)
+        fleet.add_devices(gained)
+        self.stats["acquired"] += len(gained)
+        dropped = len(unwanted) + len(lost)
+        if dropped or gained:
+            print(f"[{self.worker_id}] now owns {len(leases)} devices (+{len(gained)} -{dropped})")
+
+    async def run(self):
+        from fleet import FleetSupervisor
+
+        store = await asyncio.to_thread(LeaseStore, self.lease_db)
+        fleet = FleetSupervisor([], guard=self.holds, **self.fleet_kwargs)
+        fleet_task = asyncio.create_task(fleet.run())
+        while fleet.session is None and not fleet_task.done():
+            await asyncio.sleep(0.05)   # logged in and pooled before taking on devices
+        try:
+            while not fleet_task.done():
+                try:
+                    await self._sync(store, fleet)
+                except sqlite3.Error as e:
+                    # Keep the old view; holds() expires it locally if this persists
+                    self.stats["store_errors"] += 1
+                    print(f"[{self.worker_id}] Lease store error: {e}")
+                await asyncio.sleep(self.ttl / 3)
+        finally:
+            fleet.stop()
+            await asyncio.gather(fleet_task, return_exceptions=True)
+            await asyncio.to_thread(store.leave, self.worker_id)
+            store.close()
+
+async def _serve(worker):
+    # SIGTERM cancels the worker, whose cleanup then releases its leases
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    await worker.run()
+
+def _worker_main(worker_id, device_ids, lease_db, ttl, node, fleet_kwargs):
+    worker = ShardWorker(worker_id, device_ids, lease_db=lease_db, ttl=ttl, node=node, **fleet_kwargs)
+    try:
+        asyncio.run(_serve(worker))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+class ShardSupervisor:
+    """Runs `workers` ShardWorker processes on this node and restarts any that die.
+
+    Run one per node, all pointing at the same lease store; the ring spans
+    every live worker of every node.
+    """
+
+    def __init__(self, device_ids, workers=SHARD_WORKERS, lease_db=LEASE_DB, ttl=LEASE_TTL, node=NODE_ID,
+                 restart=True, **fleet_kwargs):
+        self.device_ids = list(dict.fromkeys(device_ids))
+        self.workers = workers or os.cpu_count() or 1
+        self.lease_db = lease_db
+        self.ttl = ttl
+        self.node = node or socket.gethostname()
+        self.restart = restart
+        self.fleet_kwargs = fleet_kwargs
+        self.processes = {}
+        self.restarts = 0
+        self.context = multiprocessing.get_context("spawn")   # no inherited sockets/threads
+
+    def _spawn(self, worker_id):
+        process = self.context.Process(
+            target=_worker_main, name=worker_id, daemon=True,
+            args=(worker_id, self.device_ids, self.lease_db, self.ttl, self.node, self.fleet_kwargs))
+        process.start()
+        self.processes[worker_id] = process
+        return process
+
+    def start(self):
+        LeaseStore(self.lease_db).close()   # create the schema once, before the workers race for it
+        for i in range(self.workers):
+            self._spawn(f"{self.node}-{i}")
+        print(f"Sharded fleet: {len(self.device_ids)} devices over {self.workers} workers on {self.node}")
+        return self
+
+    def check(self):
+        """Restart dead workers; returns the IDs that were found dead."""
+        dead = [worker_id for worker_id, process in self.processes.items() if not process.is_alive()]
+        for worker_id in dead:
+            print(f"Worker {worker_id} exited ({self.processes[worker_id].exitcode})"
+                  f"{', restarting' if self.restart else ''}")
+            if self.restart:
+                self.restarts += 1
+                self._spawn(worker_id)
+            else:
+                del self.processes[worker_id]
+        return dead
+
+    def run(self, report_interval=30.0):
+        self.start()
+        store = LeaseStore(self.lease_db)
+        last_report = time.time()
+        try:
+            while self.processes:
+                time.sleep(1.0)
+                self.check()
+                if time.time() - last_report >= report_interval:
+                    last_report = time.time()
+                    print_status(store.status(self.ttl))
+        except KeyboardInterrupt:
+            print("Sharded fleet stopped.")
+        finally:
+            store.close()
+            self.stop()
+
+    def stop(self, timeout=10.0):
+        for process in self.processes.values():
+            process.terminate()   # SIGTERM: the worker's finally block releases its leases
+        for process in self.processes.values():
+            process.join(timeout)
+
+def print_status(status):
+    for worker_id, info in sorted(status.items(), key=lambda kv: (kv[0] is None, kv[0] or "")):
+        if worker_id is None:
+            print(f"  unowned/expired: {info['leases']} leases")
+        else:
+            state = "alive" if info["alive"] else "dead"
+            print(f"  {worker_id:<24} {info['node']:<16} pid={info['pid']:<7} {state:<5} {info['leases']} leases")
+
+def run_sharded(device_ids, **kwargs):
+    supervisor = ShardSupervisor(device_ids, **kwargs)
+    supervisor.run()
+    return supervisor
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Lease ownership of the sharded fleet")
+    parser.add_argument("--lease-db", default=LEASE_DB)
+    parser.add_argument("--ttl", type=float, default=LEASE_TTL)
+    args = parser.parse_args()
+    store = LeaseStore(args.lease_db)
+    print_status(store.status(args.ttl))
+    store.close()
@@ -0,0 +1,422 @@
+import argparse
+import contextlib
+import json
+import math
+import os
+import random
+import time
+from concurrent.futures import TimeoutError as FutureTimeout
+from functools import partial
+
+import ai_engine
+from ai_worker import AIWorker
+from decision_cache import DecisionCache
+from decision_core import control_tick
+from decision_log import DecisionLog
+from distill import StudentGate
+from ironcore.cadence import poll_interval
+from ironcore.rpc import RpcDispatcher
+from ironcore.signals import get_signal_bank, debounce_decision
+from scheduler import DeadlineScheduler
+from config import DECISION_DEADLINE, LATE_POLICY, MAX_INFLIGHT
+
+SIM_DEVICE = "sim-iron"
+
+class VirtualClock:
+    def __init__(self, start=1_700_000_000.0):
+        self.now = start
+
+    def time(self):
+        return self.now
+
+# --- Plants ---
+class ThermalModel:
+    """Lumped heat model of the soleplate with random fabric on/off events.
+
+    dT/dt = heat_rate * relay - (loss + fabric_loss * fabric) * (T - ambient)
+    With the defaults a stuck relay settles around 280C, heating from cold
+    takes about a minute and fabric contact pulls heat out noticeably.
+    """
+
+    def __init__(self, rng, ambient=30.0, heat_rate=2.5, loss=0.01, fabric_loss=0.008,
+                 mean_fabric_on=90.0, mean_fabric_off=45.0, sensor_noise=0.5):
+        self.rng = rng
+        self.ambient = ambient
+        self.heat_rate = heat_rate
+        self.loss = loss
+        self.fabric_loss = fabric_loss
+        self.mean_fabric_on = mean_fabric_on
+        self.mean_fabric_off = mean_fabric_off
+        self.sensor_noise = sensor_noise
+        self.temp = ambient
+        self.hum = 55.0
+        self.fabric = False
+        self.relay = False
+        self.buzzer = False
+        self.fabric_timer = rng.expovariate(1 / mean_fabric_off)
+
+    def step(self, dt):
+        self.fabric_timer -= dt
+        if self.fabric_timer <= 0:
+            self.fabric = not self.fabric
+            self.fabric_timer = self.rng.expovariate(1 / (self.mean_fabric_on if self.fabric else self.mean_fabric_off))
+        loss = self.loss + (self.fabric_loss if self.fabric else 0.0)
+        self.temp += (self.heat_rate * self.relay - loss * (self.temp - self.ambient)) * dt
+        self.hum = min(90.0, max(20.0, self.hum + self.rng.gauss(0, 0.2) * math.sqrt(dt)))
+
+    def apply(self, method, params):
+        if method == "setRelay":
+            self.relay = bool(params)
+        elif method == "setBuzzer":
+            self.buzzer = bool(params)
+
+    def telemetry(self, ts_ms):
+        temp = self.temp + self.rng.gauss(0, self.sensor_noise)
+        return {
+            "temperature": [{"ts": ts_ms, "value": round(temp, 1)}],
+            "humidity": [{"ts": ts_ms, "value": round(self.hum, 1)}],
+            "fabric_detected": [{"ts": ts_ms, "value": self.fabric}],
+        }
+
+class TracePlant:
+    """Open-loop replay of recorded telemetry; actuation is recorded, not simulated."""
+
+    def __init__(self, times, temps, hums, fabrics):
+        self.times, self.temps, self.hums, self.fabrics = times, temps, hums, fabrics
+        self.t = times[0]
+        self.i = 0
+        self.relay = False
+        self.buzzer = False
+
+    @property
+    def temp(self):
+        return self.temps[self.i]
+
+    @property
+    def duration(self):
+        return self.times[-1] - self.times[0]
+
+    def step(self, dt):
+        self.t += dt
+        while self.i + 1 < len(self.times) and self.times[self.i + 1] <= self.t:
+            self.i += 1
+
+    apply = ThermalModel.apply
+
+    def telemetry(self, ts_ms):
+        return {
+            "temperature": [{"ts": ts_ms, "value": self.temps[self.i]}],
+            "humidity": [{"ts": ts_ms, "value": self.hums[self.i]}],
+            "fabric_detected": [{"ts": ts_ms, "value": bool(self.fabrics[self.i])}],
+        }
+
+def load_trace(path):
+    """CSV (time,temperature,humidity,fabric) or a decision log directory."""
+    if os.path.isdir(path):
+        from decision_log import scan
+        table = scan("telemetry", path).sort_by("ts")
+        times = [ts.timestamp() for ts in table.column("ts").to_pylist()]
+        return TracePlant(times, table.column("temperature").to_pylist(),
+                          table.column("humidity").to_pylist(), table.column("fabric").to_pylist())
+    import csv
+    with open(path) as f:
+        rows = list(csv.DictReader(f))
+    return TracePlant([float(r["time"]) for r in rows], [float(r["temperature"]) for r in rows],
+                      [float(r["humidity"]) for r in rows],
+                      [str(r["fabric"]).lower() in ("1", "true") for r in rows])
+
+# --- Stand-ins ---
+class SimDispatcher(RpcDispatcher):
+    """RpcDispatcher whose 'ThingsBoard' is the simulated plant."""
+
+    def __init__(self, plant, clock):
+        super().__init__(lambda: "sim-token", clock=clock.time)
+        self.plant = plant
+
+    def post(self, device_id, method, params):
+        self.plant.apply(method, params)
+        return True
+
+class FakeLLM:
+    """llama3 stand-in: TEACHER_PROMPT hysteresis policy with lognormal latency.
+
+    Latency is virtual: it is accumulated for the caller to schedule.
+    """
+
+    def __init__(self, rng, latency=1.5, sigma=0.4, setpoint=135.0):
+        self.rng = rng
+        self.mu = math.log(latency)
+        self.sigma = sigma
+        self.setpoint = setpoint
+        self.elapsed = 0.0
+        self.calls = 0
+
+    def __call__(self, temp, humidity, fabric_detected, on_actuation=None):
+        latency = self.rng.lognormvariate(self.mu, self.sigma)
+        self.calls += 1
+        self.elapsed += latency
+        relay = bool(fabric_detected) and temp < self.setpoint
+        return {"relay": relay, "buzzer": False, "reason": f"Hysteresis band, holding {self.setpoint:.0f}C."}
+
+    def take_elapsed(self):
+        elapsed, self.elapsed = self.elapsed, 0.0
+        return elapsed
+
+class VirtualFuture:
+    def __init__(self, pool, ready_at, value, error):
+        self.pool = pool
+        self.ready_at = ready_at
+        self.value = value
+        self.error = error
+        self.done = False
+        self.callbacks = []
+
+    def add_done_callback(self, fn):
+        if self.done:
+            fn(self)
+        else:
+            self.callbacks.append(fn)
+
+    def result(self, timeout=None):
+        wait = self.ready_at - self.pool.clock.time()
+        if timeout is not None and wait > timeout:
+            self.pool.advance(timeout)
+            raise FutureTimeout()
+        self.pool.advance(max(wait, 0.0))
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def exception(self):
+        return self.error
+
+    def finish(self):
+        self.done = True
+        for fn in self.callbacks:
+            fn(self)
+
+class VirtualPool:
+    """Executor stand-in for DeadlineScheduler whose inferences take virtual time.
+
+    submit() computes the answer at once and finishes the future once the
+    simulation reaches the FakeLLM's latency, so deadline misses, busy
+    slots and late answers play out as they would on threads. (The tiers
+    cache the answer at submit time, slightly earlier than for real.)
+    """
+
+    def __init__(self, clock, run_plant, llm):
+        self.clock = clock
+        self.run_plant = run_plant
+        self.llm = llm
+        self.pending = []
+
+    def submit(self, fn, *args):
+        try:
+            value, error = fn(*args), None
+        except Exception as e:
+            value, error = None, e
+        future = VirtualFuture(self, self.clock.time() + self.llm.take_elapsed(), value, error)
+        self.pending.append(future)
+        return future
+
+    def advance(self, seconds):
+        """Run the plant for `seconds`, finishing inferences at their virtual time."""
+        end = self.clock.time() + seconds
+        while True:
+            due = [f for f in self.pending if f.ready_at <= end]
+            if not due:
+                break
+            future = min(due, key=lambda f: f.ready_at)
+            self.run_plant(future.ready_at - self.clock.time())
+            self.pending.remove(future)
+            future.finish()
+        self.run_plant(end - self.clock.time())
+
+    def shutdown(self, wait=True):
+        pass
+
+@contextlib.contextmanager
+def offline_engine(fake_llm, clock, student=None):
+    """Route ai_engine's LLM tier to the stand-in and isolate the decision cache / student."""
+    saved = ai_engine.get_llm_decision, ai_engine.DECISION_CACHE, ai_engine.STUDENT
+    ai_engine.get_llm_decision = fake_llm
+    ai_engine.DECISION_CACHE = DecisionCache(temp_step=saved[1].temp_step, hum_step=saved[1].hum_step,
+                                             max_size=saved[1].max_size, ttl=saved[1].ttl, clock=clock.time)
+    ai_engine.STUDENT = student or StudentGate(None)
+    try:
+        yield
+    finally:
+        ai_engine.get_llm_decision, ai_engine.DECISION_CACHE, ai_engine.STUDENT = saved
+
+# --- Metrics ---
+class SimStats:
+    def __init__(self):
+        self.sim_time = 0.0
+        self.relay_on = 0.0
+        self.above_150 = 0.0
+        self.above_170 = 0.0
+        self.latencies = []
+        self.tiers = {}
+
+    def observe_plant(self, plant, dt):
+        self.sim_time += dt
+        self.relay_on += dt * plant.relay
+        self.above_150 += dt * (plant.temp > 150.0)
+        self.above_170 += dt * (plant.temp > 170.0)
+
+    def observe_decision(self, latency, decision):
+        self.latencies.append(latency)
+        tier = decision.get("tier", "llm")
+        self.tiers[tier] = self.tiers.get(tier, 0) + 1
+
+    def report(self, real_seconds):
+        lat = sorted(self.latencies)
+
+        def pct(q):
+            return lat[min(len(lat) - 1, int(q * len(lat)))] * 1000 if lat else 0.0
+
+        return {
+            "sim_seconds": self.sim_time,
+            "real_seconds": real_seconds,
+            "speedup": self.sim_time / real_seconds if real_seconds else 0.0,
+            "relay_duty_cycle": self.relay_on / self.sim_time if self.sim_time else 0.0,
+            "time_above_150_s": self.above_150,
+            "time_above_170_s": self.above_170,
+            "decisions": len(lat),
+            "decisions_per_real_s": len(lat) / real_seconds if real_seconds else 0.0,
+            "tiers": self.tiers,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": lat[-1] * 1000 if lat else 0.0},
+        }
+
+# --- Loops ---
+def simulate_agent(plant, clock, duration, rng, tick=2.0, llm_latency=1.5, dt=0.1, decision_log=None, student=None,
+                   adaptive=False, deadline=DECISION_DEADLINE, late_policy=LATE_POLICY, max_inflight=MAX_INFLIGHT):
+    """decision_core.main: DeadlineScheduler ticks every `tick` (or the adaptive poll interval)."""
+    stats = SimStats()
+
+    def run_plant(seconds):
+        while seconds > 1e-9:
+            step = min(dt, seconds)
+            plant.step(step)
+            stats.observe_plant(plant, step)
+            clock.now += step
+            seconds -= step
+
+    fake_llm = FakeLLM(rng, latency=llm_latency)
+    pool = VirtualPool(clock, run_plant, fake_llm)
+    scheduler = DeadlineScheduler(interval=tick, deadline=deadline, late_policy=late_policy,
+                                  max_inflight=max_inflight, name="sim", pool=pool)
+    decide = partial(scheduler.decide, device_id=SIM_DEVICE)
+    dispatcher = SimDispatcher(plant, clock)
+    decision_log = decision_log or DecisionLog(None)
+    end = clock.time() + duration
+    started = time.perf_counter()
+    with offline_engine(fake_llm, clock, student), open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        while clock.time() < end:
+            t0 = clock.time()
+            decision = control_tick(plant.telemetry(int(t0 * 1000)), SIM_DEVICE, dispatcher, decision_log, decide=decide)
+            stats.observe_decision(clock.time() - t0, decision)
+            if adaptive:
+                scheduler.set_interval(poll_interval(get_signal_bank().get(SIM_DEVICE)))
+            # Decisions return within the deadline, so the next tick is always on the grid
+            pool.advance(t0 + scheduler.interval - clock.time())
+    report = stats.report(time.perf_counter() - started)
+    report["scheduler"] = scheduler.get_stats()
+    if student:
+        report["student"] = student.get_stats()
+    return report
+
+def simulate_dashboard(plant, clock, duration, rng, period=1.0, llm_latency=1.5, dt=0.1,
+                       deadline=DECISION_DEADLINE, late_policy=LATE_POLICY):
+    """DashboardController auto mode with the event-driven AIWorker (one worker)."""
+    stats = SimStats()
+
+    def run_plant(seconds):
+        while seconds > 1e-9:
+            step = min(dt, seconds)
+            plant.step(step)
+            stats.observe_plant(plant, step)
+            clock.now += step
+            seconds -= step
+
+    fake_llm = FakeLLM(rng, latency=llm_latency)
+    # Capped at the tick period, as in iot_dashboard
+    worker = AIWorker(num_workers=0, deadline=min(deadline, period), late_policy=late_policy, clock=clock.time)
+    dispatcher = SimDispatcher(plant, clock)
+    in_flight = None   # (ready_at, sample, decision)
+    end = clock.time() + duration
+    started = time.perf_counter()
+    with offline_engine(fake_llm, clock):
+        while clock.time() < end:
+            now = clock.time()
+            data = plant.telemetry(int(now * 1000))
+            temp = data["temperature"][0]["value"]
+            # Same debounced path as DashboardController.tick
+            signals = get_signal_bank().update(SIM_DEVICE, temp, data["fabric_detected"][0]["value"], ts=now)
+            worker.update_telemetry(temp, data["humidity"][0]["value"], signals.fabric, ts=now * 1000)
+
+            # get_decision(wait=True) in virtual time: the single worker publishes when its inference
+            # finishes and picks up the freshest sample; the tick waits for it until the deadline
+            wait_until = worker.undecided[0][1] + worker.deadline if worker.undecided else now
+            while True:
+                if in_flight and clock.time() >= in_flight[0]:
+                    ready_at, sample, decision = in_flight
+                    worker.publish(sample, decision)
+                    stats.observe_decision(ready_at - sample[0] / 1000, decision)
+                    in_flight = None
+                if in_flight is None and worker.pending is not None:
+                    sample, decision = worker.step()
+                    in_flight = (clock.time() + fake_llm.take_elapsed(), sample, decision)
+                    continue
+                if in_flight is None or worker.decision_ts >= worker.latest_ts or clock.time() >= wait_until:
+                    break
+                run_plant(min(in_flight[0], wait_until) - clock.time())
+
+            actuated = debounce_decision(worker.get_decision(), signals)
+            dispatcher.submit(SIM_DEVICE, "setRelay", actuated.get("relay", False))
+            if actuated.get("buzzer"):
+                dispatcher.submit(SIM_DEVICE, "setBuzzer", True)
+            dispatcher.flush(SIM_DEVICE)
+            run_plant(now + period - clock.time())
+    report = stats.report(time.perf_counter() - started)
+    report["worker"] = worker.get_stats()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline, faster-than-real-time control loop simulation")
+    parser.add_argument("--loop", choices=["agent", "dashboard"], default="agent")
+    parser.add_argument("--duration", type=float, default=3600, help="Simulated seconds (synthetic plant)")
+    parser.add_argument("--trace", help="Replay a CSV trace or decision log directory instead")
+    parser.add_argument("--llm-latency", type=float, default=1.5, help="Median fake LLM latency (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-dir", help="Record the simulated run with DecisionLog")
+    parser.add_argument("--student", help="Student model to run in shadow mode (agent loop)")
+    parser.add_argument("--adaptive", action="store_true", help="Adaptive poll interval (agent loop, POLL_* config)")
+    parser.add_argument("--deadline", type=float, default=DECISION_DEADLINE, help="Decision deadline (s)")
+    parser.add_argument("--late-policy", choices=["discard", "apply"], default=LATE_POLICY)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if args.trace:
+        plant = load_trace(args.trace)
+        duration = plant.duration
+    else:
+        plant = ThermalModel(rng)
+        duration = args.duration
+    clock = VirtualClock()
+
+    if args.loop == "agent":
+        decision_log = DecisionLog(args.log_dir) if args.log_dir else None
+        student = StudentGate.load(args.student, rng=rng.random) if args.student else None
+        report = simulate_agent(plant, clock, duration, rng, llm_latency=args.llm_latency,
+                                decision_log=decision_log, student=student, adaptive=args.adaptive,
+                                deadline=args.deadline, late_policy=args.late_policy)
+        if decision_log:
+            decision_log.close()
+    else:
+        report = simulate_dashboard(plant, clock, duration, rng, llm_latency=args.llm_latency,
+                                    deadline=args.deadline, late_policy=args.late_policy)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,497 @@
+import base64
+import contextlib
+import hashlib
+import json
+import math
+import random
+import re
+import select
+import socketserver
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Local stand-ins for ThingsBoard (REST and websocket), an MQTT broker and
+# ollama, used by benchmark.py (and handy for trying the agents without real
+# hardware or a GPU).
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, like the real servers
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing pooled keep-alive connections is normal, not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class StandInServer:
+    def __init__(self, handler, port=0):
+        self.httpd = _Server(("127.0.0.1", port), handler)
+        self.httpd.standin = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def _seconds(duration):
+    """ollama keep_alive ("30m", "1h", "-1", 300) in seconds; negative means forever."""
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if duration and duration[-1] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
+
+# --- ThingsBoard ---
+class _ThingsBoardHandler(_JsonHandler):
+    def do_POST(self):
+        tb = self.server.standin
+        path = urlparse(self.path).path
+        body = self._body()
+        if path == "/api/auth/login":
+            tb.count("login")
+            return self._reply(200, tb.issue())
+        if path == "/api/auth/token":
+            if body.get("refreshToken") not in tb.refresh_tokens:
+                return self._reply(401, {"message": "Invalid refresh token"})
+            tb.count("refresh")
+            return self._reply(200, tb.issue())
+        if path.startswith("/api/plugins/rpc/oneway/"):
+            if not tb.authorized(self.headers):
+                return self._reply(401, {"message": "Token has expired"})
+            tb.count("rpc")
+            tb.rpc_log.append((path.rsplit("/", 1)[-1], body.get("method"), body.get("params")))
+            return self._reply(200, {})
+        self._reply(404, {"message": "Not found"})
+
+    def do_GET(self):
+        tb = self.server.standin
+        path = urlparse(self.path).path
+        if path == "/api/ws/plugins/telemetry":
+            token = parse_qs(urlparse(self.path).query).get("token", [""])[0]
+            if tb.tokens.get(token, 0) <= time.time():
+                return self._reply(401, {"message": "Token has expired"})
+            return self._websocket(tb)
+        if path.startswith("/api/plugins/telemetry/DEVICE/") and path.endswith("/values/timeseries"):
+            if not tb.authorized(self.headers):
+                return self._reply(401, {"message": "Token has expired"})
+            query = parse_qs(urlparse(self.path).query)
+            if "startTs" in query:
+                tb.count("history")
+                return self._reply(200, tb.history(path.split("/")[5], query))
+            tb.count("telemetry")
+            return self._reply(200, tb.telemetry(path.split("/")[5]))
+        self._reply(404, {"message": "Not found"})
+
+    # --- Websocket telemetry subscription (RFC 6455, just what the agent uses) ---
+    def _websocket(self, tb):
+        accept = base64.b64encode(hashlib.sha1(
+            (self.headers["Sec-WebSocket-Key"] + "258EAFA5-E914-47DA-95CA-C5AB0DC85B11").encode()).digest())
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept.decode())
+        self.end_headers()
+        self.wfile.flush()
+        self.close_connection = True
+        tb.count("ws")
+        subscriptions = {}   # cmdId -> device_id
+        while True:
+            readable, _, _ = select.select([self.connection], [], [], tb.push_interval)
+            if readable:
+                opcode, payload = self._ws_read()
+                if opcode is None or opcode == 0x8:
+                    return self._ws_send(0x8, b"")
+                if opcode == 0x9:
+                    self._ws_send(0xA, payload)
+                elif opcode == 0x1:
+                    for cmd in json.loads(payload).get("tsSubCmds", []):
+                        subscriptions[cmd["cmdId"]] = cmd["entityId"]
+                continue
+            for cmd_id, device_id in subscriptions.items():
+                # Like ThingsBoard: [[ts, "value"]] per key, values as strings
+                data = {key: [[series[0]["ts"], str(series[0]["value"]).lower() if key == "fabric_detected"
+                               else str(series[0]["value"])]]
+                        for key, series in tb.telemetry(device_id).items()}
+                self._ws_send(0x1, json.dumps({"subscriptionId": cmd_id, "errorCode": 0, "errorMsg": None,
+                                               "data": data}).encode())
+                tb.count("pushed")
+
+    def _ws_read(self):
+        head = self.rfile.read(2)
+        if len(head) < 2:
+            return None, None
+        length = head[1] & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self.rfile.read(8))[0]
+        mask = self.rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+        return head[0] & 0x0F, payload
+
+    def _ws_send(self, opcode, payload):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack(">BB", 0x80 | opcode, n)
+        elif n < 65536:
+            header = struct.pack(">BBH", 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+        self.wfile.write(header + payload)
+        self.wfile.flush()
+
+class FakeThingsBoard(StandInServer):
+    """Auth, telemetry (latest, aggregated range and websocket push) and one-way RPC endpoints with synthetic devices.
+
+    Each device's temperature wanders around `temp_center` so all decision
+    tiers get exercised; `latency` adds a fixed server-side delay. With
+    `token_ttl` set, logins/refreshes issue real-looking JWTs that expire.
+    Websocket subscribers get a fresh sample per device every `push_interval`.
+    """
+
+    def __init__(self, port=0, token="standin-token", temp_center=135.0, temp_spread=40.0, latency=0.0,
+                 token_ttl=None, push_interval=0.5):
+        super().__init__(_ThingsBoardHandler, port)
+        self.token = token
+        self.token_ttl = token_ttl
+        self.tokens = {token: float("inf")} if token_ttl is None else {}   # token -> exp
+        self.refresh_tokens = set()
+        self.temp_center = temp_center
+        self.temp_spread = temp_spread
+        self.latency = latency
+        self.push_interval = push_interval
+        self.lock = threading.Lock()
+        self.counts = {"login": 0, "refresh": 0, "telemetry": 0, "history": 0, "rpc": 0, "ws": 0, "pushed": 0}
+        self.rpc_log = []
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def issue(self):
+        with self.lock:
+            if self.token_ttl is None:
+                token = self.token
+            else:
+                claims = {"sub": "standin", "exp": int(time.time() + self.token_ttl), "jti": len(self.tokens)}
+                body = base64.urlsafe_b64encode(json.dumps(claims).encode()).rstrip(b"=").decode()
+                token = f"eyJhbGciOiJIUzUxMiJ9.{body}.standin"
+                self.tokens[token] = time.time() + self.token_ttl
+            refresh = f"refresh-{len(self.refresh_tokens)}-{token[-16:]}"
+            self.refresh_tokens.add(refresh)
+        return {"token": token, "refreshToken": refresh}
+
+    def authorized(self, headers):
+        if self.latency:
+            time.sleep(self.latency)
+        auth = headers.get("X-Authorization", "")
+        return auth.startswith("Bearer ") and self.tokens.get(auth[7:], 0) > time.time()
+
+    def telemetry(self, device_id):
+        ts = int(time.time() * 1000)
+        temp = self.temp_center + random.uniform(-self.temp_spread, self.temp_spread)
+        return {
+            "temperature": [{"ts": ts, "value": round(temp, 1)}],
+            "humidity": [{"ts": ts, "value": round(random.uniform(40, 60), 1)}],
+            "fabric_detected": [{"ts": ts, "value": random.random() > 0.1}],
+        }
+
+    def history(self, device_id, query):
+        """Aggregated range query: one point per `interval` bucket, mid-bucket timestamps.
+
+        Values are a deterministic function of time, so repeated queries agree.
+        """
+        start, end = int(query["startTs"][0]), int(query["endTs"][0])
+        interval = int(query.get("interval", ["60000"])[0])
+        offset = {"MIN": -5.0, "MAX": 5.0}.get(query.get("agg", ["AVG"])[0], 0.0)
+        result = {}
+        for key in query["keys"][0].split(","):
+            points = []
+            for bucket in range(start, end, interval):
+                ts = bucket + interval // 2
+                if ts > time.time() * 1000:
+                    break
+                phase = ts / 3.6e6   # one cycle per hour
+                if key == "temperature":
+                    value = self.temp_center + self.temp_spread * math.sin(phase) + offset
+                else:
+                    value = 50 + 10 * math.cos(phase) + offset
+                points.append({"ts": ts, "value": round(value, 1)})
+            result[key] = points
+        return result
+
+# --- MQTT ---
+def _topic_matches(pattern, topic):
+    pattern, topic = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(pattern):
+        if part == "#":
+            return True
+        if i >= len(topic) or (part != "+" and part != topic[i]):
+            return False
+    return len(pattern) == len(topic)
+
+class _MqttHandler(socketserver.BaseRequestHandler):
+    """MQTT 3.1.1 with QoS 0/1 publish, subscribe and keep-alive; no sessions or retained messages."""
+
+    def handle(self):
+        broker = self.server.standin
+        self.filters = []
+        self.lock = threading.Lock()
+        try:
+            while True:
+                packet = self._read_packet()
+                if packet is None:
+                    return
+                kind, flags, body = packet
+                if kind == 1:                                   # CONNECT
+                    self._send(0x20, b"\0\0")
+                    with broker.lock:
+                        broker.clients.append(self)
+                elif kind == 3:                                 # PUBLISH
+                    n = struct.unpack(">H", body[:2])[0]
+                    topic, rest = body[2:2 + n].decode(), body[2 + n:]
+                    if flags & 0x6:
+                        self._send(0x40, rest[:2])              # PUBACK
+                        rest = rest[2:]
+                    broker.publish(topic, rest)
+                elif kind == 8:                                 # SUBSCRIBE
+                    packet_id, rest, granted = body[:2], body[2:], b""
+                    while rest:
+                        n = struct.unpack(">H", rest[:2])[0]
+                        self.filters.append(rest[2:2 + n].decode())
+                        rest, granted = rest[3 + n:], granted + b"\0"
+                    self._send(0x90, packet_id + granted)
+                elif kind == 10:                                # UNSUBSCRIBE
+                    self._send(0xB0, body[:2])
+                elif kind == 12:                                # PINGREQ
+                    self._send(0xD0, b"")
+                elif kind == 14:                                # DISCONNECT
+                    return
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with broker.lock:
+                if self in broker.clients:
+                    broker.clients.remove(self)
+
+    def _read_exact(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.request.recv(n - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_packet(self):
+        head = self._read_exact(1)
+        if head is None:
+            return None
+        length, shift = 0, 0
+        while True:
+            byte = self._read_exact(1)
+            if byte is None:
+                return None
+            length |= (byte[0] & 0x7F) << shift
+            shift += 7
+            if not byte[0] & 0x80:
+                break
+        body = self._read_exact(length) if length else b""
+        return None if body is None else (head[0] >> 4, head[0] & 0x0F, body)
+
+    def _send(self, header, body):
+        length, encoded = len(body), b""
+        while True:
+            byte, length = length & 0x7F, length >> 7
+            encoded += bytes([byte | (0x80 if length else 0)])
+            if not length:
+                break
+        with self.lock:
+            self.request.sendall(bytes([header]) + encoded + body)
+
+class _TcpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class FakeMqttBroker:
+    """Minimal in-process MQTT broker; publish() pushes a message to every matching subscriber."""
+
+    def __init__(self, port=0):
+        self.server = _TcpServer(("127.0.0.1", port), _MqttHandler)
+        self.server.standin = self
+        self.lock = threading.Lock()
+        self.clients = []
+        self.published = 0
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def publish(self, topic, payload):
+        if isinstance(payload, (dict, list)):
+            payload = json.dumps(payload)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        encoded = topic.encode()
+        body = struct.pack(">H", len(encoded)) + encoded + payload
+        with self.lock:
+            self.published += 1
+            clients = [c for c in self.clients if any(_topic_matches(f, topic) for f in c.filters)]
+        for client in clients:
+            try:
+                client._send(0x30, body)
+            except OSError:
+                pass
+
+    def subscribers(self):
+        with self.lock:
+            return sum(bool(c.filters) for c in self.clients)
+
+# --- ollama ---
+class _OllamaHandler(_JsonHandler):
+    def do_POST(self):
+        fake = self.server.standin
+        path = urlparse(self.path).path
+        body = self._body()
+        if path != "/api/chat":
+            return self._reply(404, {"error": "not found"})
+        latency = fake.admit(body)
+        content = fake.reply(body)
+        with fake.slots:
+            if body.get("stream"):
+                return self._stream(body, content, latency)
+            time.sleep(latency)
+        self._reply(200, self._message(body, content, done=True))
+
+    def _message(self, body, content, done):
+        message = {
+            "model": body.get("model", "llama3"),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": content},
+            "done": done,
+        }
+        if done:
+            message["done_reason"] = "stop"
+        return message
+
+    def _stream(self, body, content, latency):
+        # NDJSON over chunked encoding, a few characters per "token", with the
+        # latency spread evenly over the tokens like real decoding
+        tokens = [content[i:i + 4] for i in range(0, len(content), 4)]
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(latency / len(tokens))
+            self._chunk(self._message(body, token, done=False))
+        self._chunk(self._message(body, "", done=True))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, payload):
+        line = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+class FakeOllama(StandInServer):
+    """/api/chat that answers like llama3 after a configurable delay.
+
+    Honors "stream" (token-by-token NDJSON) and "format" (bare JSON, as with
+    schema-constrained decoding); otherwise the reply is wrapped in prose.
+    Batch requests (a "decisions" array schema) answer every numbered sample
+    and take `per_item_latency` longer per extra sample. With `load_latency`
+    set, the first request, and any after `keep_alive` lapsed, pays a model
+    load first. `parallel` caps concurrent generations like OLLAMA_NUM_PARALLEL
+    (None: unlimited).
+    """
+
+    def __init__(self, port=0, latency=0.05, per_item_latency=0.0, load_latency=0.0, parallel=None):
+        super().__init__(_OllamaHandler, port)
+        self.slots = threading.Semaphore(parallel) if parallel else contextlib.nullcontext()
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.load_latency = load_latency
+        self.loaded_until = 0.0
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.loads = 0
+
+    def admit(self, body):
+        """Count the request and return its decode latency (sleeping through a model load if needed)."""
+        keep_alive = body.get("keep_alive")
+        keep_alive = 300.0 if keep_alive is None else _seconds(keep_alive)
+        with self.lock:
+            self.requests += 1
+            cold = time.time() > self.loaded_until
+            if cold:
+                self.loads += 1
+            self.loaded_until = float("inf") if keep_alive < 0 else time.time() + keep_alive
+        if cold and self.load_latency:
+            time.sleep(self.load_latency)
+        return self.latency + self.per_item_latency * max(len(self._batch_ids(body)) - 1, 0)
+
+    def _batch_ids(self, body):
+        schema = body.get("format")
+        if not isinstance(schema, dict) or "decisions" not in schema.get("properties", {}):
+            return []
+        return [int(i) for i in re.findall(r"id=(\d+):", body["messages"][-1]["content"])]
+
+    def reply(self, body):
+        ids = self._batch_ids(body)
+        if ids:
+            return json.dumps({"decisions": [
+                {"id": i, "relay": random.random() > 0.5, "buzzer": False,
+                 "reason": "Temperature is inside the 120-150C band; holding state."} for i in ids]})
+        decision = {"relay": random.random() > 0.5, "buzzer": False,
+                    "reason": "Temperature is inside the 120-150C band; holding state."}
+        if body.get("format"):
+            return json.dumps(decision)
+        # Wrapped in prose and a code fence, like the real model often does
+        return f"Here is my decision:\n```json\n{json.dumps(decision, indent=4)}\n```"
@@ -0,0 +1,63 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Cold-start budget for the headless agent: imports `decision_core` in fresh
+# interpreters and fails if it is too slow, too big, or drags in modules
+# that belong to the dashboard or to lazily-loaded tiers.
+
+HEAVY_MODULES = ("streamlit", "pandas", "numpy", "altair", "pyarrow", "ollama", "httpx", "pydantic")
+
+PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "import_ms": elapsed * 1000,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy": [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+def probe(module, runs):
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = PROBE.format(module=module, heavy=HEAVY_MODULES)
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=here, capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))   # config may print a warning first
+    return {
+        "module": module,
+        "import_ms": statistics.median(s["import_ms"] for s in samples),
+        "rss_mb": max(s["rss_mb"] for s in samples),
+        "heavy": sorted(set().union(*(s["heavy"] for s in samples))),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the agent's import time and memory budget")
+    parser.add_argument("--module", default="decision_core")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=150.0)
+    parser.add_argument("--max-rss-mb", type=float, default=40.0)
+    args = parser.parse_args()
+
+    result = probe(args.module, args.runs)
+    failures = []
+    if result["import_ms"] > args.max_import_ms:
+        failures.append(f"import took {result['import_ms']:.0f} ms (budget {args.max_import_ms:.0f} ms)")
+    if result["rss_mb"] > args.max_rss_mb:
+        failures.append(f"RSS {result['rss_mb']:.1f} MB (budget {args.max_rss_mb:.0f} MB)")
+    if result["heavy"]:
+        failures.append(f"heavy modules loaded at import: {', '.join(result['heavy'])}")
+    result["ok"] = not failures
+    print(json.dumps(result, indent=2))
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}", file=sys.stderr)
+    sys.exit(0 if result["ok"] else 1)
+
+if __name__ == "__main__":
+    main()
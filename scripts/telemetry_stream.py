@@ -0,0 +1,257 @@
+import json
+import threading
+import time
+from collections import deque, namedtuple
+
+import requests
+
+from ironcore.telemetry import TELEMETRY_KEYS, telemetry_url, parse_telemetry
+from config import TB_WS_URL, MQTT_HOST, MQTT_PORT, MQTT_TOPIC
+
+# ts is the sensor timestamp in epoch ms as reported by ThingsBoard / the device
+TelemetryEvent = namedtuple("TelemetryEvent", "device_id temp hum fabric ts received_at data")
+
+class TelemetrySource:
+    """Base class for push (and polled) telemetry delivered as events.
+
+    Keeps the latest sample per device in the REST `values/timeseries` shape
+    ({key: [{"ts": ..., "value": ...}]}) so existing parsing code keeps working,
+    notifies subscribers, and lets a control loop block until a newer sample
+    arrives. Also tracks sensor-to-decision latency.
+    """
+
+    def __init__(self, device_ids):
+        self.device_ids = list(device_ids)
+        self.running = False
+        self.cond = threading.Condition()
+        self.latest_data = {}    # device_id -> merged REST-shaped data
+        self.latest_event = {}   # device_id -> TelemetryEvent
+        self.callbacks = []
+        self.events_received = 0
+        self.latency_ms = deque(maxlen=1000)
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+
+    def _ingest(self, device_id, updates):
+        """Merge {key: (ts, value)} updates for one device and emit an event."""
+        with self.cond:
+            data = self.latest_data.setdefault(device_id, {})
+            for key, (ts, value) in updates.items():
+                current = data.get(key)
+                if current and current[0]["ts"] > ts:
+                    continue  # out-of-order delivery
+                data[key] = [{"ts": ts, "value": value}]
+            if not data:
+                return None
+            temp, hum, fabric = parse_telemetry(data)
+            ts = max(series[0]["ts"] for series in data.values())
+            event = TelemetryEvent(device_id, temp, hum, fabric, ts, time.time(), dict(data))
+            self.latest_event[device_id] = event
+            self.events_received += 1
+            self.cond.notify_all()
+        for callback in self.callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Telemetry callback error: {e}")
+        return event
+
+    def latest(self, device_id):
+        with self.cond:
+            return self.latest_event.get(device_id)
+
+    def wait_for_update(self, device_id, after_ts=0, timeout=None):
+        """Block until a sample newer than `after_ts` arrives (or timeout)."""
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while self.running:
+                event = self.latest_event.get(device_id)
+                if event is not None and event.ts > after_ts:
+                    return event
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.cond.wait(remaining)
+        return None
+
+    def record_decision(self, event):
+        """Call once a decision for `event` has been made (and dispatched)."""
+        self.latency_ms.append(time.time() * 1000 - event.ts)
+
+    def latency_stats(self):
+        samples = sorted(self.latency_ms)
+        if not samples:
+            return {"events": self.events_received, "decisions": 0}
+        return {
+            "events": self.events_received,
+            "decisions": len(samples),
+            "p50_ms": samples[len(samples) // 2],
+            "p95_ms": samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+            "max_ms": samples[-1],
+        }
+
+# --- REST Polling (fallback) ---
+class PollingTelemetrySource(TelemetrySource):
+    """The original REST poll, wrapped so it produces the same events."""
+
+    def __init__(self, device_ids, token_provider, interval=2.0):
+        super().__init__(device_ids)
+        self.token_provider = token_provider
+        self.interval = interval
+        self.session = requests.Session()
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        while self.running:
+            headers = {"X-Authorization": f"Bearer {self.token_provider()}"}
+            for device_id in self.device_ids:
+                try:
+                    resp = self.session.get(telemetry_url(device_id), headers=headers, timeout=5)
+                    resp.raise_for_status()
+                    updates = {key: (series[0].get("ts", 0), series[0].get("value"))
+                               for key, series in resp.json().items() if series}
+                    event = self.latest(device_id)
+                    # Only emit when ThingsBoard actually has a newer sample
+                    if updates and (event is None or max(ts for ts, _ in updates.values()) > event.ts):
+                        self._ingest(device_id, updates)
+                except Exception as e:
+                    print(f"Poll Error ({device_id}): {e}")
+            time.sleep(self.interval)
+
+# --- ThingsBoard WebSocket Subscription ---
+class WebSocketTelemetrySource(TelemetrySource):
+    """Subscribes to LATEST_TELEMETRY over ThingsBoard's websocket API."""
+
+    def __init__(self, device_ids, token_provider, ws_url=TB_WS_URL, reconnect_delay=2.0):
+        super().__init__(device_ids)
+        self.token_provider = token_provider
+        self.ws_url = ws_url
+        self.reconnect_delay = reconnect_delay
+        self.cmd_to_device = {i + 1: device_id for i, device_id in enumerate(self.device_ids)}
+        self.ws = None
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def stop(self):
+        super().stop()
+        if self.ws:
+            self.ws.close()
+
+    def _subscribe_cmd(self):
+        return json.dumps({
+            "tsSubCmds": [
+                {"entityType": "DEVICE", "entityId": device_id, "scope": "LATEST_TELEMETRY",
+                 "keys": TELEMETRY_KEYS, "cmdId": cmd_id}
+                for cmd_id, device_id in self.cmd_to_device.items()
+            ],
+            "historyCmds": [],
+            "attrSubCmds": [],
+        })
+
+    def _on_open(self, ws):
+        ws.send(self._subscribe_cmd())
+
+    def _on_message(self, ws, message):
+        msg = json.loads(message)
+        device_id = self.cmd_to_device.get(msg.get("subscriptionId"))
+        if device_id is None or msg.get("errorCode"):
+            if msg.get("errorCode"):
+                print(f"WS Subscription Error: {msg.get('errorMsg')}")
+            return
+        # Websocket payloads look like {"temperature": [[ts, "value"]], ...}
+        updates = {key: (series[0][0], series[0][1]) for key, series in msg.get("data", {}).items() if series}
+        if updates:
+            self._ingest(device_id, updates)
+
+    def _run(self):
+        import websocket
+
+        delay = self.reconnect_delay
+        while self.running:
+            url = f"{self.ws_url}/api/ws/plugins/telemetry?token={self.token_provider()}"
+            self.ws = websocket.WebSocketApp(url, on_open=self._on_open, on_message=self._on_message,
+                                             on_error=lambda ws, e: print(f"WS Error: {e}"))
+            started = time.time()
+            self.ws.run_forever(ping_interval=30)
+            if not self.running:
+                break
+            # Reset backoff after a healthy session, otherwise grow it
+            delay = self.reconnect_delay if time.time() - started > 60 else min(delay * 2, 60)
+            print(f"WS disconnected, reconnecting in {delay:.0f}s...")
+            time.sleep(delay)
+
+# --- MQTT (local broker) ---
+class MqttTelemetrySource(TelemetrySource):
+    """Subscribes to per-device telemetry topics on an MQTT broker.
+
+    Intended for a local broker the irons (or a ThingsBoard rule chain MQTT
+    integration) publish to. Payloads may be flat
+    {"temperature": .., "humidity": .., "fabric_detected": .., "ts": ms}
+    or ThingsBoard style {"ts": ms, "values": {...}}.
+    """
+
+    def __init__(self, device_ids, host=MQTT_HOST, port=MQTT_PORT, topic=MQTT_TOPIC):
+        super().__init__(device_ids)
+        self.host = host
+        self.port = port
+        self.topic_to_device = {topic.format(device_id=device_id): device_id for device_id in self.device_ids}
+        self.client = None
+
+    def start(self):
+        import paho.mqtt.client as mqtt
+
+        self.running = True
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+        self.client.on_connect = self._on_connect
+        self.client.on_message = self._on_message
+        self.client.connect_async(self.host, self.port)
+        self.client.loop_start()
+        return self
+
+    def stop(self):
+        super().stop()
+        if self.client:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        for topic in self.topic_to_device:
+            client.subscribe(topic, qos=0)
+
+    def _on_message(self, client, userdata, msg):
+        device_id = self.topic_to_device.get(msg.topic)
+        if device_id is None:
+            return
+        try:
+            payload = json.loads(msg.payload)
+        except ValueError:
+            print(f"MQTT: bad payload on {msg.topic}")
+            return
+        ts = payload.get("ts", int(time.time() * 1000))
+        values = payload.get("values", payload)
+        updates = {key: (ts, values[key]) for key in TELEMETRY_KEYS.split(",") if key in values}
+        if updates:
+            self._ingest(device_id, updates)
+
+def create_source(kind, device_ids, token_provider, poll_interval=2.0):
+    if kind == "ws":
+        return WebSocketTelemetrySource(device_ids, token_provider)
+    if kind == "mqtt":
+        return MqttTelemetrySource(device_ids)
+    return PollingTelemetrySource(device_ids, token_provider, interval=poll_interval)